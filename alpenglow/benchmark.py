@@ -1,11 +1,21 @@
+import warnings
+
 import numpy
 from skimage.filters import threshold_otsu
 
+from alpenglow.image_sources.caching import CachingImageSource
+from alpenglow.image_sources.coalescing import CoalescingImageSource
+from alpenglow.image_sources.deduplicating import DeduplicatingImageSource
 from alpenglow.image_sources.demo import DemoImageSource
 from alpenglow.image_sources.filesystem import FilesystemImageSource
+from alpenglow.image_sources.packed import PackedImageSource
+from alpenglow.image_sources.prefetching import PrefetchingImageSource
+from alpenglow.image_sources.process_pool import ProcessPoolImageSource
 from alpenglow.image_sources.s3 import S3ImageSource
 from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
+from alpenglow.matching_algorithms.caching import ShiftCache
 from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
+from alpenglow.matching_algorithms.projection import Projection, ProjectionMatchingAlgorithm
 from alpenglow.patchwork_builders.default import PatchworkBuilder
 
 
@@ -22,7 +32,20 @@ class BenchmarkConfig:
                  replication_factor=1,
                  image_source='demo',
                  image_source_config=None,
-                 image_source_threads=4):
+                 image_source_threads=4,
+                 image_source_processes=0,
+                 image_cache_dir=None,
+                 image_cache_bytes=10 * 1024 ** 3,
+                 physical_image_bytes=1024 ** 3,
+                 coalesce_requests=True,
+                 prefetch_depth=0,
+                 prefetch_bytes=1024 ** 3,
+                 prioritize_samples=True,
+                 min_peak_ratio=None,
+                 min_samples=3,
+                 stable_samples=2,
+                 projection=None,
+                 shift_cache_path=None):
         self.sample_size = sample_size
         self.margin = margin
         self.verbosity = verbosity
@@ -34,7 +57,20 @@ class BenchmarkConfig:
 
         self.image_source = image_source
         self.image_source_threads = image_source_threads
+        self.image_source_processes = image_source_processes
         self.image_source_config = image_source_config
+        self.image_cache_dir = image_cache_dir
+        self.image_cache_bytes = image_cache_bytes
+        self.physical_image_bytes = physical_image_bytes
+        self.coalesce_requests = coalesce_requests
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_bytes = prefetch_bytes
+        self.prioritize_samples = prioritize_samples
+        self.min_peak_ratio = min_peak_ratio
+        self.min_samples = min_samples
+        self.stable_samples = stable_samples
+        self.projection = projection
+        self.shift_cache_path = shift_cache_path
         if image_source_config is None:
             if image_source == 'demo':
                 self.image_source_config = {
@@ -54,27 +90,47 @@ class BenchmarkConfig:
             replication_factor=self.replication_factor,
             image_source=self.image_source,
             image_source_threads=self.image_source_threads,
-            image_source_config=self.image_source_config
+            image_source_processes=self.image_source_processes,
+            image_source_config=self.image_source_config,
+            image_cache_dir=self.image_cache_dir,
+            image_cache_bytes=self.image_cache_bytes,
+            physical_image_bytes=self.physical_image_bytes,
+            coalesce_requests=self.coalesce_requests,
+            prefetch_depth=self.prefetch_depth,
+            prefetch_bytes=self.prefetch_bytes,
+            prioritize_samples=self.prioritize_samples,
+            min_peak_ratio=self.min_peak_ratio,
+            min_samples=self.min_samples,
+            stable_samples=self.stable_samples,
+            projection=self.projection,
+            shift_cache_path=self.shift_cache_path
         )
 
     @classmethod
     def from_dict(cls, d):
         return cls(**d)
 
-def get_image_order(config):
+def get_image_order(config, image_source=None):
     """
 
     Parameters
     ----------
     config: BenchmarkConfig
+    image_source: ImageSource
+        Source of the images. Created from config if not given.
 
     Returns
     -------
     Iterator for pairs (stripe, version) occuring in order they usually appear in the stream
 
     """
-    image_source = get_image_source(config)
-    return ((stripe, version) for stripe in range(image_source.stripe_count() * config.replication_factor) for version in range(image_source.version_count()))
+    if image_source is None:
+        with get_image_source(config) as image_source:
+            return get_image_order(config, image_source)
+
+    stripe_count = image_source.stripe_count()
+    version_count = image_source.version_count()
+    return ((stripe, version) for stripe in range(stripe_count * config.replication_factor) for version in range(version_count))
 
 
 def get_image_source(config):
@@ -86,96 +142,325 @@ def get_image_source(config):
 
     Returns
     -------
-    ImageSource object capable of generating image based on stripe and version.
+    ImageSource object capable of generating image based on stripe and version. When config.image_source_processes is
+    positive, images are fetched and decoded in that many worker processes. When config.image_cache_dir is set,
+    fetched images are kept in that directory and reused by following runs. When config.replication_factor is above 1,
+    images from all loops are derived from the physical image - kept in memory up to config.physical_image_bytes, and
+    read again from config.image_cache_dir (if set) or fetched again otherwise. When config.coalesce_requests is set,
+    concurrent requests for the same image share single fetch. When config.prefetch_depth is positive, images are
+    requested ahead of the consumer in order given by get_image_order. When config.prioritize_samples is set, threads
+    fetching images serve sample versions (see is_in_sample) before the others.
 
     """
-    if config.image_source == 'filesystem':
-        return ThreadedImageSource([FilesystemImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs']) for _ in range(config.image_source_threads)])
+    if config.image_source_processes > 0:
+        image_source_class = {
+            'filesystem': FilesystemImageSource,
+            's3': S3ImageSource,
+            'packed': PackedImageSource
+        }.get(config.image_source, DemoImageSource)
+        image_source = ProcessPoolImageSource(image_source_class, config.image_source_config['args'],
+                                              config.image_source_config['kwargs'],
+                                              max_workers=config.image_source_processes)
+    elif config.image_source == 'filesystem':
+        image_source = ThreadedImageSource([FilesystemImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs']) for _ in range(config.image_source_threads)])
     elif config.image_source == 's3':
-        return S3ImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs'])
+        image_source = S3ImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs'])
+    elif config.image_source == 'packed':
+        image_source = PackedImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs'])
     else:
-        return ThreadedImageSource([DemoImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs']) for _ in range(config.image_source_threads)])
+        image_source = ThreadedImageSource([DemoImageSource(*config.image_source_config['args'], **config.image_source_config['kwargs']) for _ in range(config.image_source_threads)])
+
+    if config.prioritize_samples and isinstance(image_source, (S3ImageSource, ThreadedImageSource)):
+        image_source.priority = get_sample_priority(config, image_source.version_count())
+
+    if config.image_cache_dir is not None:
+        image_source = CachingImageSource(image_source, config.image_cache_dir, max_bytes=config.image_cache_bytes)
+
+    if config.replication_factor > 1:
+        if config.image_cache_dir is None:
+            warnings.warn("Physical images evicted from memory (above physical_image_bytes) will be fetched again from "
+                          "the image source, set image_cache_dir to read them from disk instead")
+        image_source = DeduplicatingImageSource(image_source, max_bytes=config.physical_image_bytes)
+
+    if config.coalesce_requests:
+        image_source = CoalescingImageSource(image_source)
+
+    if config.prefetch_depth > 0:
+        image_source = PrefetchingImageSource(image_source, get_image_order(config, image_source),
+                                              depth=config.prefetch_depth, max_bytes=config.prefetch_bytes)
+
+    return image_source
+
+
+def is_in_sample(config, version, version_count):
+    """
+    Parameters
+    ----------
+    config: BenchmarkConfig
+    version: int
+    version_count: int
+        Number of versions of images, read once from the image source of config by callers, as creating the source is
+        not cheap.
+
+    Returns
+    -------
+    bool
+        Whether the version is one of sample_size versions used to compute shifts.
+    """
+    return is_in_sample_of(config.sample_size, version_count, version)
 
 
-def is_in_sample(config, version):
-    version_count = get_image_source(config).version_count()
-    if config.sample_size == 1:  # accept middle one
+def is_in_sample_of(sample_size, version_count, version):
+    if sample_size == 1:  # accept middle one
         return version == version_count // 2
-    elif config.sample_size == 2:  # accept edges
+    elif sample_size == 2:  # accept edges
         return version == 0 or version == version_count - 1
     else:  # accept evenly distributed versions
         return (version == 0) or \
-               (((version + 1) * (config.sample_size - 1)) % version_count) == 0 or \
-               (version + 1) * (config.sample_size - 1) // version_count > version * (
-               config.sample_size - 1) // version_count
+               (((version + 1) * (sample_size - 1)) % version_count) == 0 or \
+               (version + 1) * (sample_size - 1) // version_count > version * (
+               sample_size - 1) // version_count
+
+
+def get_sample_priority(config, version_count):
+    """
+    Returns
+    -------
+    function (stripe_id, version_id) -> int
+        Priority of image fetch, higher for sample versions, which are needed to compute shifts between stripes.
+    """
+    sample_versions = set(version for version in range(version_count)
+                          if is_in_sample_of(config.sample_size, version_count, version))
+    return lambda stripe_id, version_id: 1 if version_id in sample_versions else 0
 
 
 class CorrelationState:
+    """
+    Pairs images of the same version from consecutive stripes and computes their cross-power spectra.
+
+    Each ready correlation is [stripe, spectrum, top_image_shape, correlation_shape], where spectrum is the single
+    precision half spectrum returned by FftMatchingAlgorithm.cross_power_half_spectrum and correlation_shape is the
+    shape of correlated overlaps, needed to transform the spectrum back. Pairs of stripes marked with finish are no
+    longer correlated.
+    """
     def __init__(self, config):
         self.first_stripe = 0
         self.bottoms = {}
         self.tops = {}
+        self.finished = set()
         print("create state")
 
     def apply(self, version, stripe, image):
         ready_correlations = []
 
-        if stripe > self.first_stripe:
+        if stripe > self.first_stripe and stripe - 1 not in self.finished:
             top_id = (version, stripe - 1)
             if top_id in self.tops:
                 top_image = self.tops[top_id]
                 del self.tops[top_id]
-                correlation = self.__correlation(top_image, image)
-                ready_correlations.append([stripe - 1, correlation, top_image.shape])
+                spectrum, correlation_shape = self.__correlation(top_image, image)
+                ready_correlations.append([stripe - 1, spectrum, top_image.shape, correlation_shape])
             else:
                 self.bottoms[(version, stripe)] = image
 
         bottom_id = (version, stripe + 1)
-        if bottom_id in self.bottoms:
-            bottom_image = self.bottoms[bottom_id]
-            del self.bottoms[bottom_id]
-            correlation = self.__correlation(image, bottom_image)
-            ready_correlations.append([stripe, correlation, image.shape])
-        else:
-            self.tops[(version, stripe)] = image
+        if stripe not in self.finished:
+            if bottom_id in self.bottoms:
+                bottom_image = self.bottoms[bottom_id]
+                del self.bottoms[bottom_id]
+                spectrum, correlation_shape = self.__correlation(image, bottom_image)
+                ready_correlations.append([stripe, spectrum, image.shape, correlation_shape])
+            else:
+                self.tops[(version, stripe)] = image
 
         return ready_correlations
 
+    def finish(self, stripe):
+        """
+        Stops correlating images of stripe with images of the following stripe (e.g. when their shift is known) and
+        drops images kept for that pair.
+        """
+        self.finished.add(stripe)
+        for version, top_stripe in list(self.tops.keys()):
+            if top_stripe == stripe:
+                del self.tops[(version, top_stripe)]
+        for version, bottom_stripe in list(self.bottoms.keys()):
+            if bottom_stripe == stripe + 1:
+                del self.bottoms[(version, bottom_stripe)]
+
     def __correlation(self, top_image, bottom_image):
         width = min(top_image.shape[1], bottom_image.shape[1])
         height = min(top_image.shape[0], bottom_image.shape[0]) // 2
 
-        return FftMatchingAlgorithm.cross_correlation(top_image[-height:, :width], bottom_image[:height, :width])
+        spectrum = FftMatchingAlgorithm.cross_power_half_spectrum(top_image[-height:, :width], bottom_image[:height, :width])
+        return spectrum, (height, width)
 
 
 class ShiftState:
+    """
+    Sums cross-power spectra of sample_size versions of each pair of stripes and finds the shift with a single inverse
+    FFT of the sum.
+
+    When config.min_peak_ratio is set, sampling is adaptive: starting with config.min_samples versions the shift is
+    estimated after each spectrum, and it is returned as soon as config.stable_samples consecutive estimates are equal
+    and the peak to sidelobe ratio of the correlation reaches config.min_peak_ratio. Spectra of pairs of stripes with
+    known shift are ignored.
+    """
     def __init__(self, config):
         self.sample_size = config.sample_size
+        self.min_peak_ratio = config.min_peak_ratio
+        self.min_samples = config.min_samples
+        self.stable_samples = config.stable_samples
         self.sums = {}
+        self.estimates = {}
+        self.finished = set()
+
+    def apply(self, stripe, spectrum, top_shape, correlation_shape):
+        if stripe in self.finished:
+            return None
 
-    def apply(self, stripe, correlation, top_shape):
         if stripe not in self.sums:
-            self.sums[stripe] = (correlation, 1)
+            self.sums[stripe] = (numpy.array(spectrum, dtype=numpy.complex128), 1)
         else:
-            old_correlation, cnt = self.sums[stripe]
-            self.sums[stripe] = (correlation + old_correlation, cnt + 1)
+            old_spectrum, cnt = self.sums[stripe]
+            old_spectrum += spectrum
+            self.sums[stripe] = (old_spectrum, cnt + 1)
+
+        spectrum, cnt = self.sums[stripe]
+        if cnt == self.sample_size or (self.min_peak_ratio is not None and cnt >= self.min_samples):
+            correlation = numpy.fft.irfft2(spectrum, s=correlation_shape)
+            shift = [stripe, list(FftMatchingAlgorithm.extract_shift(correlation, correlation_shape[0])), top_shape]
 
-        if self.sums[stripe][1] == self.sample_size:
-            correlation = self.sums[stripe][0]
-            del self.sums[stripe]
-            return self.__extract_shift(stripe, correlation, top_shape)
+            if cnt == self.sample_size or self.__is_confident(stripe, shift[1], correlation):
+                del self.sums[stripe]
+                self.estimates.pop(stripe, None)
+                self.finished.add(stripe)
+                return shift
 
         return None
 
-    def __extract_shift(self, stripe, correlation, shape):
-        midpoints = numpy.array([numpy.fix(axis_size / 2) for axis_size in correlation.shape])
-        maxima = numpy.unravel_index(numpy.argmax(numpy.abs(correlation)), correlation.shape)
-        shifts = numpy.array(maxima, dtype=numpy.int)
+    def finish(self, stripe):
+        """
+        Ignores following spectra of stripe and the following stripe (e.g. when their shift is known from elsewhere).
+        """
+        self.finished.add(stripe)
+        self.sums.pop(stripe, None)
+        self.estimates.pop(stripe, None)
+
+    def __is_confident(self, stripe, shift, correlation):
+        estimates = self.estimates.setdefault(stripe, [])
+        estimates.append(tuple(shift))
+        if len(estimates) < self.stable_samples or len(set(estimates[-self.stable_samples:])) > 1:
+            return False
+        return FftMatchingAlgorithm.peak_to_sidelobe_ratio(correlation) >= self.min_peak_ratio
+
+
+class ProjectionState:
+    """
+    Alternative to CorrelationState followed by ShiftState, which keeps running config.projection ('max' or 'mean')
+    projections of halves of images at both edges of each stripe and correlates projections of consecutive stripes
+    once (see ProjectionMatchingAlgorithm), when sample_size versions of both were projected.
+
+    Each found shift is [stripe, shift, top_image_shape], as returned by ShiftState. Pairs of stripes marked with
+    finish are no longer projected.
+    """
+    def __init__(self, config):
+        self.sample_size = config.sample_size
+        self.projection = config.projection
+        self.first_stripe = 0
+        self.tops = {}
+        self.bottoms = {}
+        self.top_shapes = {}
+        self.finished = set()
+
+    def apply(self, version, stripe, image):
+        height = image.shape[0] // 2
+        if stripe > self.first_stripe and stripe - 1 not in self.finished:
+            self.bottoms.setdefault(stripe, Projection(self.projection)).add(image[:height])
+        if stripe not in self.finished:
+            self.tops.setdefault(stripe, Projection(self.projection)).add(image[-height:])
+            self.top_shapes[stripe] = image.shape
+
+        shifts = []
+        for top_stripe in [stripe - 1, stripe]:
+            if self.__is_complete(self.tops, top_stripe) and self.__is_complete(self.bottoms, top_stripe + 1):
+                shifts.append(self.__shift(top_stripe))
+        return shifts
+
+    def finish(self, stripe):
+        """
+        Stops projecting images of stripe and of the following stripe for their pair (e.g. when their shift is known)
+        and drops projections kept for that pair.
+        """
+        self.finished.add(stripe)
+        self.tops.pop(stripe, None)
+        self.top_shapes.pop(stripe, None)
+        self.bottoms.pop(stripe + 1, None)
+
+    def __is_complete(self, projections, stripe):
+        return stripe in projections and projections[stripe].count == self.sample_size
+
+    def __shift(self, stripe):
+        top_projection = self.tops.pop(stripe).get()
+        bottom_projection = self.bottoms.pop(stripe + 1).get()
+
+        width = min(top_projection.shape[1], bottom_projection.shape[1])
+        height = min(top_projection.shape[0], bottom_projection.shape[0])
+        shift = ProjectionMatchingAlgorithm.projection_shift(top_projection[-height:, :width],
+                                                             bottom_projection[:height, :width])
+        return [stripe, list(shift), self.top_shapes.pop(stripe)]
+
+
+class ShiftCacheState:
+    """
+    Looks up shifts of pairs of stripes in ShiftCache kept in config.shift_cache_path and stores shifts found by
+    ShiftState or ProjectionState, so that runs on unchanged images do not need to correlate samples. Shifts are keyed
+    by sample versions and by the options with which they are found. Does nothing if config.shift_cache_path is None.
 
-        shifts[shifts > midpoints] -= numpy.array(correlation.shape)[shifts > midpoints]
-        shifts[0] = correlation.shape[0] - shifts[0]
+    Fingerprints of sample images are fetched once per physical image, and key of each pair is computed once for its
+    lookup and store.
+    """
+    def __init__(self, config, image_source):
+        self.image_source = image_source
+        self.shift_cache = ShiftCache(config.shift_cache_path) if config.shift_cache_path is not None else None
+
+        version_count = image_source.version_count()
+        self.versions = [version for version in range(version_count)
+                         if is_in_sample_of(config.sample_size, version_count, version)]
+        self.algorithm = 'projection {}'.format(config.projection) if config.projection is not None else \
+            'correlation {}'.format(config.min_peak_ratio)
+        self.known = set()
+        self.keys = {}
+        self.fingerprints = {}
+
+    def lookup(self, stripe):
+        """
+        Returns
+        -------
+        list
+            [stripe, shift, top_image_shape] (as returned by ShiftState) of stripe and the following stripe, or None
+            if the shift is not cached or was already returned.
+        """
+        if self.shift_cache is None or stripe in self.known:
+            return None
+        shift = self.shift_cache.get(self.__key(stripe))
+        if shift is None:
+            return None
+        self.known.add(stripe)
+        del self.keys[stripe]
+        return [stripe, list(shift), self.image_source.probe_image(stripe)[0]]
+
+    def apply(self, stripe, shift, shape):
+        if self.shift_cache is not None and stripe not in self.known:
+            self.known.add(stripe)
+            self.shift_cache.put(self.__key(stripe), shift)
+            del self.keys[stripe]
 
-        return [stripe, list(shifts), shape]
+    def __key(self, stripe):
+        if stripe not in self.keys:
+            self.keys[stripe] = ShiftCache.key(self.image_source, stripe, stripe + 1, self.versions,
+                                               algorithm=self.algorithm, fingerprints=self.fingerprints)
+        return self.keys[stripe]
 
 
 class PositionState:
@@ -223,11 +508,13 @@ class PositionState:
 class DelayDownloadState:
     def __init__(self, config):
         self.config = config
+        with get_image_source(config) as image_source:
+            self.version_count = image_source.version_count()
         self.metadata = set()
         self.image_ids = set()
 
     def apply_image_id(self, stripe, version):
-        if is_in_sample(self.config, version):
+        if is_in_sample(self.config, version, self.version_count):
             return False
         elif (stripe, version) in self.metadata:
             self.metadata.remove((stripe, version))
@@ -237,7 +524,7 @@ class DelayDownloadState:
             return False
 
     def apply_metadata(self, stripe, version):
-        if is_in_sample(self.config, version):
+        if is_in_sample(self.config, version, self.version_count):
             return False
         elif (stripe, version) in self.image_ids:
             self.image_ids.remove((stripe, version))
@@ -340,7 +627,8 @@ class WindowState:
         self.window_offset = 0  # offset of next printed
         self.current_fill = 0  # up to where we have all versions already available
         self.first_offset = 0  # first offset containing still valid data.
-        self.version_count = get_image_source(config).version_count()
+        with get_image_source(config) as image_source:
+            self.version_count = image_source.version_count()
         self.window = None  # window object - note: it is reused.
 
     def apply(self, version, image, y):
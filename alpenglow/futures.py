@@ -0,0 +1,137 @@
+from concurrent.futures import Future, CancelledError
+from threading import Lock
+
+
+def map_future(future, function):
+    """
+    Parameters
+    ----------
+    future: Future
+        Future of the argument.
+    function: function
+        Function applied to the result of future.
+
+    Returns
+    -------
+    Future
+        Future for function(future.result()), failing with the exception of given future (or of the function).
+    """
+    mapped_future = Future()
+    mapped_future.set_running_or_notify_cancel()
+    future.add_done_callback(lambda f: _complete(mapped_future, f, function))
+    return mapped_future
+
+
+def _complete(mapped_future, future, function):
+    if future.cancelled():
+        mapped_future.set_exception(CancelledError())
+        return
+    if future.exception() is not None:
+        mapped_future.set_exception(future.exception())
+        return
+
+    try:
+        mapped_future.set_result(function(future.result()))
+    except Exception as e:
+        mapped_future.set_exception(e)
+
+
+class SharedFuture:
+    """
+    Result of a single computation (e.g. a fetch of an image) awaited by many consumers. Each consumer gets its own
+    future (see wait), so a consumer cancelling its future does not cancel it for the others. The computation (see
+    attach) is cancelled once every consumer has cancelled its future.
+    """
+    def __init__(self):
+        self.abandoned = False
+
+        self._lock = Lock()
+        self._waiters = []
+        self._future = None
+        self._outcome = None
+
+    def wait(self):
+        """
+        Returns
+        -------
+        Future
+            New future of the result, or None if all consumers cancelled their futures and the computation is being
+            cancelled, in which case the result should be computed again.
+        """
+        waiter = Future()
+        self._lock.acquire()
+        if self.abandoned:
+            self._lock.release()
+            return None
+        outcome = self._outcome
+        if outcome is None:
+            self._waiters.append(waiter)
+        self._lock.release()
+
+        if outcome is not None:
+            _resolve(waiter, *outcome)
+        else:
+            waiter.add_done_callback(self.__waiter_done)
+        return waiter
+
+    def attach(self, future):
+        """
+        Parameters
+        ----------
+        future: Future
+            Future of the computation, whose result (or exception) is passed to all consumers.
+        """
+        self._lock.acquire()
+        self._future = future
+        abandoned = self.abandoned
+        self._lock.release()
+
+        if abandoned:
+            future.cancel()
+        future.add_done_callback(self.__complete)
+
+    def set_exception(self, exception):
+        """
+        Fails futures of all consumers, e.g. when the computation could not be started.
+        """
+        self.__resolve(None, exception)
+
+    def __complete(self, future):
+        if future.cancelled():
+            self.__resolve(None, CancelledError())
+        elif future.exception() is not None:
+            self.__resolve(None, future.exception())
+        else:
+            self.__resolve(future.result(), None)
+
+    def __resolve(self, result, exception):
+        self._lock.acquire()
+        self._outcome = (result, exception)
+        waiters = self._waiters
+        self._waiters = []
+        self._lock.release()
+
+        for waiter in waiters:
+            _resolve(waiter, result, exception)
+
+    def __waiter_done(self, waiter):
+        if not waiter.cancelled():
+            return
+
+        self._lock.acquire()
+        if self._outcome is None and not self.abandoned and all(w.cancelled() for w in self._waiters):
+            self.abandoned = True
+        future = self._future if self.abandoned else None
+        self._lock.release()
+
+        if future is not None:
+            future.cancel()
+
+
+def _resolve(future, result, exception):
+    if not future.set_running_or_notify_cancel():
+        return
+    if exception is None:
+        future.set_result(result)
+    else:
+        future.set_exception(exception)
@@ -1,28 +1,69 @@
+import csv
+import json
+from threading import Lock
 from time import time
 
+import numpy
+
 from alpenglow.image_sources.image_source import ImageSource
 
 
 class BenchmarkingImageSource(ImageSource):
     """
-    Implementation of image source fetching images from local file system.
+    Image source recording how long fetching each image from underlying image source takes.
+
+    Each fetch is recorded in fetches as a dict with FIELDS:
+
+        stripe_id, version_id - requested image,
+        requested, completed  - seconds from creation of the benchmarking source,
+        total                 - seconds from request to completion,
+        queue_wait            - seconds spent waiting for a worker,
+        read, decode          - seconds spent on reading (e.g. downloading) and decoding the image,
+        bytes                 - number of bytes read,
+        concurrency           - number of fetches in flight when the image was requested (including this one).
+
+    queue_wait, read, decode and bytes are known only if underlying source reports them (see
+    ImageSource.get_image_timed and alpenglow.image_sources.scheduler.timed_future), otherwise they are None.
     """
+    FIELDS = ['stripe_id', 'version_id', 'requested', 'completed', 'total', 'queue_wait', 'read', 'decode', 'bytes',
+              'concurrency']
+
     def __init__(self, image_source):
         self.image_source = image_source
         self.fetch_times = []
+        self.fetches = []
+
+        self._lock = Lock()
+        self._in_flight = 0
+        self._start_time = time()
 
     def get_image(self, stripe_id, version_id):
-        start_time = time()
-        image = self.image_source.get_image(stripe_id, version_id)
-        self.fetch_times.append([time() - start_time, stripe_id, version_id])
-        return image
+        start_time, concurrency = self.__start()
+        timing = {}
+        try:
+            return self.image_source.get_image_timed(stripe_id, version_id, timing)
+        finally:
+            self.__record(stripe_id, version_id, start_time, concurrency, timing)
 
     def get_image_future(self, stripe_id, version_id):
-        start_time = time()
+        start_time, concurrency = self.__start()
         future = self.image_source.get_image_future(stripe_id, version_id)
-        future.add_done_callback(lambda _: self.fetch_times.append([time() - start_time, stripe_id, version_id]))
+        future.add_done_callback(lambda f: self.__record(stripe_id, version_id, start_time, concurrency,
+                                                         getattr(f, 'timing', {})))
         return future
 
+    def probes_images(self):
+        return self.image_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.image_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.image_source.fingerprint(stripe_id, version_id)
+
+    def close(self):
+        self.image_source.close()
+
     def stripe_count(self):
         return self.image_source.stripe_count()
 
@@ -34,3 +75,138 @@ class BenchmarkingImageSource(ImageSource):
 
     def total_fetching_time(self):
         return sum([x[0] for x in self.fetch_times])
+
+    def latency_percentiles(self, field='total', percentiles=(50, 90, 99, 100)):
+        """
+        Parameters
+        ----------
+        field: str
+            One of 'total', 'queue_wait', 'read' or 'decode'.
+        percentiles: iterable of float
+            Percentiles to compute, between 0 and 100.
+
+        Returns
+        -------
+        dict
+            percentile -> seconds, or None if no fetch reported the field.
+        """
+        values = self.__values(field)
+        if len(values) == 0:
+            return dict((percentile, None) for percentile in percentiles)
+        return dict((percentile, float(numpy.percentile(values, percentile))) for percentile in percentiles)
+
+    def latency_histogram(self, field='total', bins=20):
+        """
+        Parameters
+        ----------
+        field: str
+            One of 'total', 'queue_wait', 'read' or 'decode'.
+        bins: int or sequence of float
+            Number of bins or bin edges, as in numpy.histogram.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Number of fetches in each bin and bin edges in seconds.
+        """
+        return numpy.histogram(self.__values(field), bins=bins)
+
+    def throughput(self, interval=1.):
+        """
+        Parameters
+        ----------
+        interval: float
+            Length of time windows in seconds.
+
+        Returns
+        -------
+        list of (float, float, float)
+            Start of each time window (in seconds from creation of the source), number of images and number of bytes
+            per second completed in that window.
+        """
+        fetches = self.__fetches()
+        if len(fetches) == 0:
+            return []
+
+        window_count = int(max(fetch['completed'] for fetch in fetches) // interval) + 1
+        images = numpy.zeros(window_count)
+        transferred_bytes = numpy.zeros(window_count)
+        for fetch in fetches:
+            window = int(fetch['completed'] // interval)
+            images[window] += 1
+            transferred_bytes[window] += fetch['bytes'] or 0
+
+        return [(window * interval, images[window] / interval, transferred_bytes[window] / interval)
+                for window in range(window_count)]
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+            Number of fetches, bytes read, peak concurrency and latency percentiles of each phase of the fetch.
+        """
+        fetches = self.__fetches()
+        return dict(
+            fetches=len(fetches),
+            bytes=sum(fetch['bytes'] or 0 for fetch in fetches),
+            peak_concurrency=max([fetch['concurrency'] for fetch in fetches] + [0]),
+            total=self.latency_percentiles('total'),
+            queue_wait=self.latency_percentiles('queue_wait'),
+            read=self.latency_percentiles('read'),
+            decode=self.latency_percentiles('decode')
+        )
+
+    def to_csv(self, path):
+        """
+        Writes recorded fetches to CSV file with FIELDS columns.
+        """
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            for fetch in self.__fetches():
+                writer.writerow(fetch)
+
+    def to_json(self, path):
+        """
+        Writes summary, throughput in one second windows and recorded fetches to JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(dict(summary=self.summary(), throughput=self.throughput(), fetches=self.__fetches()), f)
+
+    def __start(self):
+        self._lock.acquire()
+        self._in_flight += 1
+        concurrency = self._in_flight
+        self._lock.release()
+        return time(), concurrency
+
+    def __record(self, stripe_id, version_id, start_time, concurrency, timing):
+        completion_time = time()
+        fetch = dict(
+            stripe_id=stripe_id,
+            version_id=version_id,
+            requested=start_time - self._start_time,
+            completed=completion_time - self._start_time,
+            total=completion_time - start_time,
+            queue_wait=timing.get('queue_wait'),
+            read=timing.get('read'),
+            decode=timing.get('decode'),
+            bytes=timing.get('bytes'),
+            concurrency=concurrency
+        )
+
+        self._lock.acquire()
+        self._in_flight -= 1
+        self.fetch_times.append([fetch['total'], stripe_id, version_id])
+        self.fetches.append(fetch)
+        self._lock.release()
+
+    def __fetches(self):
+        self._lock.acquire()
+        fetches = list(self.fetches)
+        self._lock.release()
+        return fetches
+
+    def __values(self, field):
+        return [fetch[field] for fetch in self.__fetches() if fetch[field] is not None]
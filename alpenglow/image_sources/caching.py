@@ -0,0 +1,203 @@
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from time import time
+
+import numpy
+
+from alpenglow.image_sources.image_source import ImageSource
+
+
+class CachingImageSource(ImageSource):
+    """
+    Image source keeping images fetched from underlying image source in local directory.
+
+    Images are stored as .npy files, one per (stripe, version). When total size of stored files exceeds max_bytes, least
+    recently used files are removed. Recency is kept in file modification times, so cache directory can be reused after
+    restart. Files are written to temporary file and renamed, so concurrent readers (also from other processes sharing
+    the directory) never see partially written images.
+
+    Notes
+    -----
+    Cache directory should be used only for images from a single data set, as files are identified by stripe and version
+    ids only. Temporary files left by interrupted writes are removed when the directory is loaded, once they are older
+    than STALE_TEMPORARY_SECONDS.
+    """
+    STALE_TEMPORARY_SECONDS = 60 * 60
+
+    def __init__(self, image_source, cache_dir, max_bytes=10 * 1024 ** 3):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source from which missing images are fetched.
+        cache_dir: str
+            Directory in which images are stored. Created if it does not exist.
+        max_bytes: int
+            Maximal total size of stored images.
+        """
+        self.image_source = image_source
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.__load_entries()
+
+    def get_image(self, stripe_id, version_id):
+        image = self.__read(stripe_id, version_id)
+        if image is None:
+            image = self.image_source.get_image(stripe_id, version_id)
+            self.__write(stripe_id, version_id, image)
+        return image
+
+    def get_image_future(self, stripe_id, version_id):
+        image = self.__read(stripe_id, version_id)
+        if image is not None:
+            future = Future()
+            future.set_result(image)
+            return future
+
+        future = self.image_source.get_image_future(stripe_id, version_id)
+        future.add_done_callback(lambda f: self.__store(stripe_id, version_id, f))
+        return future
+
+    def probes_images(self):
+        return self.image_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.image_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.image_source.fingerprint(stripe_id, version_id)
+
+    def close(self):
+        self.image_source.close()
+
+    def stripe_count(self):
+        return self.image_source.stripe_count()
+
+    def version_count(self):
+        return self.image_source.version_count()
+
+    def channel_count(self):
+        return self.image_source.channel_count()
+
+    def hit_ratio(self):
+        """
+        Returns
+        -------
+        float
+            Part of requests served from the cache directory.
+        """
+        requests = self.hits + self.misses
+        return self.hits / float(requests) if requests > 0 else 0.
+
+    def total_bytes(self):
+        """
+        Returns
+        -------
+        int
+            Total size of images stored in the cache directory.
+        """
+        return self._total_bytes
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, '{}_{}.npy'.format(*key))
+
+    def __load_entries(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            name, extension = os.path.splitext(filename)
+            if extension == '.tmp':
+                self.__remove_stale(path)
+                continue
+            if extension != '.npy':
+                continue
+            try:
+                key = tuple(int(part) for part in name.split('_'))
+                stat = os.stat(path)
+            except (ValueError, OSError):
+                continue
+            entries.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        self.__evict()
+
+    def __remove_stale(self, path):
+        # left by writers which died before renaming, files of live writers (e.g. other processes) are younger
+        try:
+            if os.path.getmtime(path) < time() - self.STALE_TEMPORARY_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def __read(self, stripe_id, version_id):
+        key = (stripe_id, version_id)
+        path = self.__path(key)
+        try:
+            image = numpy.load(path)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            self._lock.acquire()
+            self.misses += 1
+            self._lock.release()
+            return None
+
+        self._lock.acquire()
+        self.hits += 1
+        if key in self._entries:
+            self._entries[key] = self._entries.pop(key)
+        else:  # stored by other process sharing the directory
+            self._entries[key] = os.path.getsize(path)
+            self._total_bytes += self._entries[key]
+        self._lock.release()
+        return image
+
+    def __store(self, stripe_id, version_id, future):
+        if not future.cancelled() and future.exception() is None:
+            self.__write(stripe_id, version_id, future.result())
+
+    def __write(self, stripe_id, version_id, image):
+        key = (stripe_id, version_id)
+        path = self.__path(key)
+
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                numpy.save(f, image)
+            size = os.path.getsize(temporary_path)
+            os.rename(temporary_path, path)
+        except (IOError, OSError):
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+
+        self._lock.acquire()
+        self._total_bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self.__evict()
+        self._lock.release()
+
+    def __evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 0:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.__path(key))
+            except OSError:
+                pass
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from threading import Lock
+
+from alpenglow.futures import map_future, SharedFuture
+from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.stripes.stripe import region_slices
+
+
+class CoalescingImageSource(ImageSource):
+    """
+    Image source sharing single fetch of underlying image source between concurrent requests for the same image.
+
+    Request for an image which is already being fetched waits for that fetch (see alpenglow.futures.SharedFuture). Each
+    request gets its own future, and the fetch is cancelled once futures of all its requests are cancelled. Fetch is
+    forgotten as soon as it completes, so the image is kept in memory only by requesters.
+    """
+    def __init__(self, image_source):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source from which images are fetched.
+        """
+        self.image_source = image_source
+        self.saved_fetches = 0
+        self.saved_bytes = 0
+
+        self._lock = Lock()
+        self._in_flight = {}
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def get_image_future(self, stripe_id, version_id):
+        return self.get_image_futures([(stripe_id, version_id)])[(stripe_id, version_id)]
+
+    def get_image_futures(self, image_ids):
+        """
+        Requests images which are not being fetched already from underlying image source with a single batch request.
+        """
+        futures = OrderedDict()
+        shared = []
+        missing = []
+
+        self._lock.acquire()
+        for image_id in image_ids:
+            if image_id in futures:
+                continue
+            future = self._in_flight[image_id].wait() if image_id in self._in_flight else None
+            if future is not None:
+                self.saved_fetches += 1
+                shared.append(future)
+            else:
+                self._in_flight[image_id] = SharedFuture()
+                future = self._in_flight[image_id].wait()
+                missing.append(image_id)
+            futures[image_id] = future
+        shared_futures = dict((image_id, self._in_flight[image_id]) for image_id in missing)
+        self._lock.release()
+
+        for future in shared:
+            future.add_done_callback(self.__count_saved_bytes)
+
+        if len(missing) == 0:
+            return futures
+
+        try:
+            source_futures = self.image_source.get_image_futures(missing)
+        except Exception as e:
+            for image_id in missing:
+                self.__complete(image_id, shared_futures[image_id])
+                shared_futures[image_id].set_exception(e)
+            raise
+        for image_id in missing:
+            shared_future = shared_futures[image_id]
+            source_futures[image_id].add_done_callback(
+                lambda f, image_id=image_id, shared_future=shared_future: self.__complete(image_id, shared_future))
+            shared_future.attach(source_futures[image_id])
+
+        return futures
+
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None):
+        """
+        Cuts region from the image which is being fetched, or requests only the region from underlying image source.
+        """
+        self._lock.acquire()
+        shared_future = self._in_flight.get((stripe_id, version_id))
+        future = shared_future.wait() if shared_future is not None else None
+        self._lock.release()
+
+        if future is not None:
+            region = region_slices(rows, columns)
+            return map_future(future, lambda image: image[region])
+        return self.image_source.get_image_region_future(stripe_id, version_id, rows, columns)
+
+    def reads_regions(self):
+        return self.image_source.reads_regions()
+
+    def probes_images(self):
+        return self.image_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.image_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.image_source.fingerprint(stripe_id, version_id)
+
+    def close(self):
+        self.image_source.close()
+
+    def stripe_count(self):
+        return self.image_source.stripe_count()
+
+    def version_count(self):
+        return self.image_source.version_count()
+
+    def channel_count(self):
+        return self.image_source.channel_count()
+
+    def __complete(self, image_id, shared_future):
+        self._lock.acquire()
+        if self._in_flight.get(image_id) is shared_future:
+            del self._in_flight[image_id]
+        self._lock.release()
+
+    def __count_saved_bytes(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._lock.acquire()
+            self.saved_bytes += future.result().nbytes
+            self._lock.release()
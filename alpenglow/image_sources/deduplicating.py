@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+
+from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.stripes.image_cache import MemoryImageCache
+
+
+class DeduplicatingImageSource(ImageSource):
+    """
+    Image source fetching each physical image of the underlying source once, no matter in how many loops it is used.
+
+    Stripes from following loops (see ImageSource.loop_image) are resolved with physical_image_id to the stripe from the
+    first loop, which is fetched from the underlying source and kept in memory. Loop variants are derived from it -
+    mirrored images are views, only images on loop joints are copied to add the prefix.
+
+    Notes
+    -----
+    Physical images are kept in memory only up to max_bytes. When loops do not fit in it, physical images evicted from
+    memory are fetched again from the underlying source - wrap it with CachingImageSource to read them from disk instead.
+    """
+    def __init__(self, image_source, max_bytes=1024 ** 3, image_cache=None):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source from which physical images are fetched.
+        max_bytes: int
+            Maximal total size of physical images kept in memory.
+        image_cache: MemoryImageCache
+            Cache keeping physical images, created with max_bytes if not given.
+        """
+        self.image_source = image_source
+        self.image_cache = image_cache if image_cache is not None else MemoryImageCache(max_bytes)
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def get_image_future(self, stripe_id, version_id):
+        physical_stripe_id, _, _, _ = self.image_source.physical_image_id(stripe_id, version_id)
+        physical_future = self.image_cache.get_image_future(self.image_source, physical_stripe_id, version_id)
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        physical_future.add_done_callback(lambda f: self.__derive(stripe_id, f, future))
+        return future
+
+    def probes_images(self):
+        return self.image_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.image_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        physical_stripe_id, _, _, _ = self.image_source.physical_image_id(stripe_id, version_id)
+        return self.image_source.fingerprint(physical_stripe_id, version_id)
+
+    def close(self):
+        self.image_source.close()
+
+    def stripe_count(self):
+        return self.image_source.stripe_count()
+
+    def version_count(self):
+        return self.image_source.version_count()
+
+    def channel_count(self):
+        return self.image_source.channel_count()
+
+    def __derive(self, stripe_id, physical_future, future):
+        if physical_future.exception() is not None:
+            future.set_exception(physical_future.exception())
+        else:
+            future.set_result(ImageSource.loop_image(physical_future.result(), stripe_id, self.stripe_count()))
@@ -1,9 +1,79 @@
+from collections import OrderedDict
+from threading import Lock
+
 import numpy
 import skimage
 from skimage import data, dtype_limits
 
 from alpenglow.image_sources.image_source import ImageSource
 
+_camera_image = None
+_memo = OrderedDict()
+_memo_bytes = 0
+_max_memo_bytes = 256 * 1024 ** 2
+_memo_lock = Lock()
+
+
+def camera_image():
+    """
+    Returns
+    -------
+    ndarray
+        skimage.data.camera example, loaded once per process.
+    """
+    global _camera_image
+    if _camera_image is None:
+        _camera_image = data.camera()
+    return _camera_image
+
+
+def set_max_cached_bytes(max_bytes):
+    """
+    Parameters
+    ----------
+    max_bytes: int
+        Maximal number of bytes of mapped channels and generated images of all demo sources kept in memory, 256 MiB by
+        default. Least recently used ones are dropped at once if they take more.
+
+    Returns
+    -------
+    int
+        Previous limit.
+    """
+    global _max_memo_bytes
+    _memo_lock.acquire()
+    previous_max_bytes = _max_memo_bytes
+    _max_memo_bytes = max_bytes
+    _evict()
+    _memo_lock.release()
+    return previous_max_bytes
+
+
+def _evict():
+    global _memo_bytes
+    while _memo_bytes > _max_memo_bytes:
+        _, evicted_image = _memo.popitem(last=False)
+        _memo_bytes -= evicted_image.nbytes
+
+
+def tile_image(image, tiles):
+    """
+    Parameters
+    ----------
+    image: ndarray
+        Image to be tiled.
+    tiles: tuple(int, int)
+        Number of image copies in vertical and horizontal direction. Every other copy is mirrored, so tiles join without
+        visible edges.
+
+    Returns
+    -------
+    ndarray
+        Image tiles[0] times higher and tiles[1] times wider than the given one.
+    """
+    row = numpy.concatenate([image if i % 2 == 0 else image[:, ::-1] for i in range(tiles[1])], axis=1)
+    return numpy.concatenate([row if i % 2 == 0 else row[::-1, :] for i in range(tiles[0])], axis=0)
+
 
 class DemoImageSource(ImageSource):
     """
@@ -12,8 +82,14 @@ class DemoImageSource(ImageSource):
     Versions are simulated with different blur levels. Each returning image is concatenated vertically from different
     channels. Different channel versions are implementing by applying various [0,1] -> [0,1] functions on pixel values,
     because example image skimage.data.camera has only one channel.
+
+    Channels are mapped once for the whole source image. Mapped channels and generated images are kept in memory shared
+    by all demo sources of the process, so sources with the same configuration (e.g. all sources of
+    ThreadedImageSource) do not generate them again. Least recently used ones are dropped when they take more than the
+    limit set with set_max_cached_bytes. Returned images are read only.
     """
-    def __init__(self, stripe_count=1, version_count=1, channel_count=1, overlap=0.3, vertical_shifts=(0,)):
+    def __init__(self, stripe_count=1, version_count=1, channel_count=1, overlap=0.3, vertical_shifts=(0,),
+                 tiles=(1, 1)):
         """
         Parameters
         ----------
@@ -31,6 +107,8 @@ class DemoImageSource(ImageSource):
             Number of additional pixels which will be concatenated on the left side of the image to simulate camera
             shifts. To Nth stripe vertical_strips[N%len(vertical_strips)] columns of pixels will be appended on the
             left. Columns on the right will be appended to equalize number of columns in each image.
+        tiles: tuple(int, int)
+            Number of skimage.data.camera copies stacked vertically and horizontally to build larger source image.
         """
         super(DemoImageSource, self).__init__()
         self._stripe_count = stripe_count
@@ -38,23 +116,19 @@ class DemoImageSource(ImageSource):
         self._channel_count = channel_count
         self.overlap = overlap
         self.vertical_shifts = vertical_shifts
+        self.tiles = tuple(tiles)
 
-        self.source_image = data.camera()
+        self.source_image = camera_image() if self.tiles == (1, 1) else tile_image(camera_image(), self.tiles)
         self.stripe_height = int(self.source_image.shape[0] / (self._stripe_count * (1. - self.overlap) + self.overlap))
         self.overlap_height = int(self.stripe_height * self.overlap)
+        self._memo_key = (stripe_count, version_count, channel_count, overlap, tuple(vertical_shifts), self.tiles)
 
     def get_image(self, stripe_id, version_id):
         stripe_image_id = stripe_id % self.stripe_count()
         if (stripe_id // self.stripe_count()) % 2 == 1:
             stripe_image_id = self.stripe_count() - 1 - stripe_image_id
 
-        blur_level = self.__get_blur_level(version_id)
-        raw_stripe = self.__get_raw_stripe(stripe_image_id)
-        shifted_stripe = self.__shift(self.__get_shift(stripe_image_id), raw_stripe)
-
-        channels = [self.__class__.__prepare_channel_stripe(shifted_stripe, blur_level, channel_id) for channel_id in range(self.channel_count())]
-
-        return ImageSource.loop_image(numpy.concatenate(channels, axis=1), stripe_id, self.stripe_count())
+        return ImageSource.loop_image(self.__get_stripe_image(stripe_image_id, version_id), stripe_id, self.stripe_count())
 
     def stripe_count(self):
         return self._stripe_count
@@ -65,11 +139,52 @@ class DemoImageSource(ImageSource):
     def channel_count(self):
         return self._channel_count
 
-    def __get_raw_stripe(self, stripe_id):
+    def __get_stripe_image(self, stripe_image_id, version_id):
+        key = ('image', self._memo_key, stripe_image_id, version_id)
+        image = self.__memoized(key)
+        if image is not None:
+            return image
+
+        blur_level = self.__get_blur_level(version_id)
+        shift = self.__get_shift(stripe_image_id)
+        channels = [self.__class__.__blur(self.__shift(shift, self.__get_raw_stripe(self.__get_channel_image(channel_id), stripe_image_id)), blur_level)
+                    for channel_id in range(self.channel_count())]
+        image = numpy.concatenate(channels, axis=1)
+        image.flags.writeable = False
+        self.__memoize(key, image)
+        return image
+
+    def __get_channel_image(self, channel_id):
+        key = ('channel', self.tiles, channel_id)
+        image = self.__memoized(key)
+        if image is None:
+            image = self.__class__.__map_channel(self.source_image, channel_id)
+            image.flags.writeable = False
+            self.__memoize(key, image)
+        return image
+
+    def __memoized(self, key):
+        _memo_lock.acquire()
+        image = _memo.pop(key, None)
+        if image is not None:
+            _memo[key] = image
+        _memo_lock.release()
+        return image
+
+    def __memoize(self, key, image):
+        global _memo_bytes
+        _memo_lock.acquire()
+        if key not in _memo:
+            _memo[key] = image
+            _memo_bytes += image.nbytes
+        _evict()
+        _memo_lock.release()
+
+    def __get_raw_stripe(self, image, stripe_id):
         row_from = (self.stripe_height - self.overlap_height) * stripe_id
-        row_to = row_from + self.stripe_height if stripe_id < self.stripe_count() - 1 else self.source_image.shape[0]
+        row_to = row_from + self.stripe_height if stripe_id < self.stripe_count() - 1 else image.shape[0]
 
-        return self.source_image[row_from:row_to]
+        return image[row_from:row_to]
 
     def __shift(self, shift, stripe):
         parts = []
@@ -93,13 +208,15 @@ class DemoImageSource(ImageSource):
         return 2.0 * version / (self.version_count() - 1)
 
     @classmethod
-    def __prepare_channel_stripe(cls, stripe, blur_level, channel):
-        max = dtype_limits(stripe, clip_negative=False)[1]
+    def __map_channel(cls, image, channel):
+        max = dtype_limits(image, clip_negative=False)[1]
         channel_map = cls.__channel_function(channel)
-        pixel_map = numpy.vectorize(lambda x: int(round(channel_map(float(x) / max) * max)))
-        mapped_stripe = pixel_map(stripe).astype(stripe.dtype)
-        blurred_stripe = numpy.vectorize(lambda x: int(round(x * max)))(skimage.filters.gaussian(mapped_stripe, blur_level)).astype(stripe.dtype)
-        return blurred_stripe
+        return numpy.round(channel_map(image / float(max)) * max).astype(image.dtype)
+
+    @classmethod
+    def __blur(cls, stripe, blur_level):
+        max = dtype_limits(stripe, clip_negative=False)[1]
+        return numpy.round(skimage.filters.gaussian(stripe, blur_level) * max).astype(stripe.dtype)
 
     @classmethod
     def __channel_function(cls, channel):
@@ -114,11 +231,12 @@ class DemoImageSource(ImageSource):
         Returns
         -------
         function [0,1] -> [0,1]
+            Function applied element-wise to numpy arrays.
         """
         functions = [
             lambda x: x,
             lambda x: 1. - x,
             lambda x: x ** 2,
-            lambda x: x + 0.5 if x <= 0.5 else x - 0.5
+            lambda x: numpy.where(x <= 0.5, x + 0.5, x - 0.5)
         ]
         return functions[channel % len(functions)]
@@ -1,4 +1,16 @@
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+from threading import Lock
+from time import time
+
+import numpy
+
 from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.image_sources.tiff_layout import contiguous_layout, stored_shape
+from alpenglow.stripes.stripe import region_slices
 import skimage.external.tifffile as tiff
 
 
@@ -6,19 +18,124 @@ class FilesystemImageSource(ImageSource):
     """
     Implementation of image source fetching images from local file system.
     """
-    def __init__(self, path_format, stripe_ids, version_ids, channel_count=1):
+    def __init__(self, path_format, stripe_ids, version_ids, channel_count=1, memory_map=False, max_workers=4):
+        """
+        Parameters
+        ----------
+        path_format: str
+            Format of image paths with stripe_id and version_id fields.
+        stripe_ids: [int]
+            Ids of stripes used in path_format.
+        version_ids: [int]
+            Ids of versions used in path_format.
+        channel_count: int
+            Number of channels in each image.
+        memory_map: bool
+            If True, pixel data of uncompressed TIFFs is mapped from the file instead of being read. Returned images are
+            copy-on-write views, memory is copied only for the pages to which a consumer writes. Files which cannot be
+            mapped are read as usual.
+        max_workers: int
+            Number of files read concurrently by get_images.
+        """
         self.path_format = path_format
         self.stripe_ids = stripe_ids
         self.version_ids = version_ids
         self._channel_count = channel_count
+        self.memory_map = memory_map
+        self.max_workers = max_workers
+        self._probes = {}
+        self._executor = None
+        self._lock = Lock()
 
     def get_image(self, stripe_id, version_id):
-        stripe_image_id = stripe_id % len(self.stripe_ids)
-        if (stripe_id // len(self.stripe_ids)) % 2 == 1:
-            stripe_image_id = len(self.stripe_ids) - 1 - stripe_image_id
+        return self.get_image_timed(stripe_id, version_id, {})
+
+    def get_image_timed(self, stripe_id, version_id, timing):
+        path = self.__path(stripe_id, version_id)
+        return ImageSource.loop_image(self.__read(path, timing).swapaxes(0, 1), stripe_id, len(self.stripe_ids))
+
+    def get_image_region(self, stripe_id, version_id, rows=None, columns=None):
+        """
+        Reads only pages of the file holding requested region, if the TIFF can be memory mapped (see memory_map_tiff).
+        Other files are read whole.
+        """
+        image = self.__class__.memory_map_tiff(self.__path(stripe_id, version_id))
+        if image is None:
+            return super(FilesystemImageSource, self).get_image_region(stripe_id, version_id, rows, columns)
+
+        rows, columns = region_slices(rows, columns)
+        image = ImageSource.loop_image(image.swapaxes(0, 1)[:, columns], stripe_id, len(self.stripe_ids))
+        return numpy.array(image[rows])
+
+    def reads_regions(self):
+        return True
+
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None):
+        future = Future()
+        future.set_result(self.get_image_region(stripe_id, version_id, rows, columns))
+        return future
+
+    def probes_images(self):
+        return True
+
+    def probe_image(self, stripe_id, version_id=0):
+        """
+        Reads shape and dtype from TIFF header. Images of a stripe are assumed to have the same shape and dtype in each
+        version, so each stripe is probed once.
+        """
+        physical_stripe_id = self.physical_image_id(stripe_id, version_id)[0]
+        if physical_stripe_id not in self._probes:
+            with tiff.TiffFile(self.__path(physical_stripe_id, version_id)) as tif:
+                probe = stored_shape(tif)
+            if probe is None:
+                probe = super(FilesystemImageSource, self).probe_image(physical_stripe_id, version_id)
+            else:
+                probe = (probe[0][1], probe[0][0]), probe[1]
+            self._probes[physical_stripe_id] = probe
+
+        shape, dtype = self._probes[physical_stripe_id]
+        return ImageSource.loop_shape(shape, stripe_id, len(self.stripe_ids)), dtype
 
-        path = self.path_format.format(stripe_id=self.stripe_ids[stripe_image_id], version_id=self.version_ids[version_id])
-        return ImageSource.loop_image(tiff.TiffFile(path).asarray().swapaxes(0, 1), stripe_id, len(self.stripe_ids))
+    def fingerprint(self, stripe_id, version_id):
+        """
+        Size and modification time of the file, read without opening it.
+        """
+        stat = os.stat(self.__path(stripe_id, version_id))
+        return '{}-{}'.format(stat.st_size, stat.st_mtime)
+
+    def get_images(self, image_ids):
+        """
+        Returns requested images in order of image_ids, reading up to max_workers of them concurrently ahead of the
+        consumer. Reads not taken by the consumer are cancelled when it stops iterating.
+        """
+        self._lock.acquire()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._lock.release()
+
+        image_ids = iter(OrderedDict.fromkeys(image_ids))
+        pending = deque((image_id, self._executor.submit(self.get_image, *image_id))
+                        for image_id in islice(image_ids, self.max_workers))
+        try:
+            while len(pending) > 0:
+                image_id, future = pending.popleft()
+                next_image_id = next(image_ids, None)
+                if next_image_id is not None:
+                    pending.append((next_image_id, self._executor.submit(self.get_image, *next_image_id)))
+                yield image_id, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        """
+        Stops threads reading images for get_images.
+        """
+        self._lock.acquire()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._lock.release()
 
     def stripe_count(self):
         return len(self.stripe_ids)
@@ -28,3 +145,48 @@ class FilesystemImageSource(ImageSource):
 
     def channel_count(self):
         return self._channel_count
+
+    def __path(self, stripe_id, version_id):
+        stripe_image_id = stripe_id % len(self.stripe_ids)
+        if (stripe_id // len(self.stripe_ids)) % 2 == 1:
+            stripe_image_id = len(self.stripe_ids) - 1 - stripe_image_id
+
+        return self.path_format.format(stripe_id=self.stripe_ids[stripe_image_id], version_id=self.version_ids[version_id])
+
+    def __read(self, path, timing):
+        start_time = time()
+        if self.memory_map:
+            image = self.__class__.memory_map_tiff(path)
+            if image is not None:
+                # pixels are read from the file when they are accessed
+                timing.update(read=time() - start_time, decode=0.)
+                return image
+
+        with open(path, 'rb') as f:
+            image_data = f.read()
+        read_time = time()
+        image = tiff.TiffFile(BytesIO(image_data)).asarray()
+        timing.update(read=read_time - start_time, decode=time() - read_time, bytes=len(image_data))
+        return image
+
+    @classmethod
+    def memory_map_tiff(cls, path):
+        """
+        Parameters
+        ----------
+        path: str
+            Path to TIFF file
+
+        Returns
+        -------
+        numpy.memmap
+            Copy-on-write memory map of pixels of single page TIFF, or None if pixels are not stored as single
+            uncompressed block.
+        """
+        with tiff.TiffFile(path) as tif:
+            layout = contiguous_layout(tif)
+        if layout is None:
+            return None
+
+        offset, shape, dtype = layout
+        return numpy.memmap(path, dtype=dtype, mode='c', offset=offset, shape=shape)
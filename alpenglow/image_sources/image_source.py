@@ -1,10 +1,16 @@
+import hashlib
+
 import numpy
 from abc import ABCMeta, abstractmethod
-from concurrent.futures import Future
+from collections import OrderedDict
+from concurrent.futures import Future, as_completed
+from time import time
 
 from numpy import ndarray
 
+from alpenglow.futures import map_future
 from alpenglow.stripes.lazy import LazyStripe
+from alpenglow.stripes.stripe import region_slices
 
 
 class ImageSource:
@@ -16,17 +22,19 @@ class ImageSource:
     def __init__(self):
         self._executor = None
 
-    def get_stripe(self, stripe_id):
+    def get_stripe(self, stripe_id, image_cache=None):
         """
         Parameters
         ----------
         stripe_id: int
+        image_cache: MemoryImageCache
+            Cache keeping images fetched by the stripe. Process wide default_image_cache is used if not given.
 
         Returns
         -------
         Stripe with given id
         """
-        return LazyStripe(stripe_id, self)
+        return LazyStripe(stripe_id, self, image_cache)
 
     def get_image_future(self, stripe_id, version_id):
         """
@@ -46,6 +54,175 @@ class ImageSource:
         future.set_result(self.get_image(stripe_id, version_id))
         return future
 
+    def get_image_timed(self, stripe_id, version_id, timing):
+        """
+        Fetches image like get_image, recording how long it took.
+
+        Parameters
+        ----------
+        stripe_id
+        version_id
+        timing: dict
+            Updated with time spent on reading ('read') and decoding ('decode') the image in seconds, and with number of
+            bytes read ('bytes'), when they are known. Implementations which cannot tell reading from decoding record
+            the whole time as 'read'.
+
+        Returns
+        -------
+        ndarray
+            Requested image.
+        """
+        start_time = time()
+        image = self.get_image(stripe_id, version_id)
+        timing['read'] = time() - start_time
+        return image
+
+    def get_image_region(self, stripe_id, version_id, rows=None, columns=None):
+        """
+        Fetches part of the image. Implementations may override it to read only part of the stored image.
+
+        Parameters
+        ----------
+        stripe_id : int
+        version_id : int
+        rows: tuple(int, int)
+            Range (start, stop) of rows with meaning of slice arguments, all rows if None.
+        columns: tuple(int, int)
+            Range (start, stop) of columns with meaning of slice arguments, all columns if None.
+
+        Returns
+        -------
+        ndarray
+            Requested part of the image returned by get_image.
+        """
+        return self.get_image(stripe_id, version_id)[region_slices(rows, columns)]
+
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None):
+        """
+        Same as get_image_region, but returns Future<ndarray>.
+        """
+        region = region_slices(rows, columns)
+        return map_future(self.get_image_future(stripe_id, version_id), lambda image: image[region])
+
+    def reads_regions(self):
+        """
+        Tells whether get_image_region_future reads only part of the stored image. Regions of images from sources which
+        do not read them are cut from whole images, which are then better cached and shared by all regions (e.g.
+        channels) of the image, see MemoryImageCache.get_image_region_future.
+
+        Returns
+        -------
+        bool
+            False by default, True for implementations overriding get_image_region to read only requested region.
+        """
+        return False
+
+    def probes_images(self):
+        """
+        Tells whether probe_image reads shape and dtype from image metadata. Stripes of sources which would fetch whole
+        images to probe them fetch the image through their image cache instead, see LazyStripe.probe.
+
+        Returns
+        -------
+        bool
+            False by default, True for implementations overriding probe_image to read image metadata.
+        """
+        return False
+
+    def probe_image(self, stripe_id, version_id=0):
+        """
+        Returns shape and dtype of the image, without fetching its pixels when implementation can read them from image
+        metadata. Default implementation fetches the image.
+
+        Parameters
+        ----------
+        stripe_id : int
+        version_id : int
+
+        Returns
+        -------
+        tuple(tuple(int, int), numpy.dtype)
+            Shape and dtype of the image returned by get_image.
+        """
+        image = self.get_image(stripe_id, version_id)
+        return image.shape, image.dtype
+
+    def fingerprint(self, stripe_id, version_id):
+        """
+        Returns cheap identifier of the content of the image, changing when stored image changes. Default
+        implementation hashes first rows of the image (see get_image_region), implementations override it to use
+        metadata of stored files.
+
+        Parameters
+        ----------
+        stripe_id : int
+        version_id : int
+
+        Returns
+        -------
+        str
+            Fingerprint of the image.
+        """
+        image = self.get_image_region(stripe_id, version_id, rows=(0, 8))
+        fingerprint = hashlib.sha1('{} {}'.format(image.shape, image.dtype).encode('utf-8'))
+        fingerprint.update(numpy.ascontiguousarray(image).tobytes())
+        return fingerprint.hexdigest()
+
+    def get_image_futures(self, image_ids):
+        """
+        Requests many images at once. Implementations may override it to schedule the whole batch together.
+
+        Parameters
+        ----------
+        image_ids: iterable of (int, int)
+            (stripe_id, version_id) pairs.
+
+        Returns
+        -------
+        dict
+            Future<ndarray> for each requested (stripe_id, version_id) pair.
+        """
+        futures = OrderedDict()
+        for image_id in image_ids:
+            if image_id not in futures:
+                futures[image_id] = self.get_image_future(*image_id)
+        return futures
+
+    def get_images(self, image_ids):
+        """
+        Requests many images at once and returns them as they become available.
+
+        Parameters
+        ----------
+        image_ids: iterable of (int, int)
+            (stripe_id, version_id) pairs.
+
+        Returns
+        -------
+        iterator of ((int, int), ndarray)
+            Requested images with their (stripe_id, version_id) in order of completion.
+        """
+        image_ids_by_future = {}
+        for image_id, future in self.get_image_futures(image_ids).items():
+            image_ids_by_future.setdefault(future, []).append(image_id)
+
+        for future in as_completed(image_ids_by_future):
+            for image_id in image_ids_by_future[future]:
+                yield image_id, future.result()
+
+    def close(self):
+        """
+        Releases resources held by the source, e.g. stops its worker threads. Wrapping sources close the wrapped ones.
+        Default implementation does nothing. Sources are closed as well when they are used as context managers.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     @classmethod
     def loop_image(cls, image, stripe_id, stripe_count):
         """
@@ -77,7 +254,50 @@ class ImageSource:
 
         return result
 
+    @classmethod
+    def loop_shape(cls, shape, stripe_id, stripe_count):
+        """
+        Parameters
+        ----------
+        shape : tuple(int, int)
+            Shape of the stored image.
+        stripe_id : int
+            Id of the stripe from which image comes from
+        stripe_count : int
+            Number of stripes in the data set
+
+        Returns
+        -------
+        tuple(int, int)
+            Shape of the image returned by loop_image.
+        """
+        if stripe_id != 0 and stripe_id % stripe_count == 0:
+            return (shape[0] + shape[0] // 3,) + tuple(shape[1:])
+        return tuple(shape)
+
+    def physical_image_id(self, stripe_id, version_id):
+        """
+        Resolves stripe from any loop to the image stored in the data set.
+
+        Parameters
+        ----------
+        stripe_id : int
+            Id of the stripe, possibly from one of the following loops.
+        version_id : int
 
+        Returns
+        -------
+        tuple(int, int, bool, bool)
+            Id of the stripe in the first loop (for which get_image returns image as stored), version id, whether the
+            image is mirrored and whether it is prefixed by loop_image.
+        """
+        stripe_count = self.stripe_count()
+        physical_stripe_id = stripe_id % stripe_count
+        mirror = (stripe_id // stripe_count) % 2 == 1
+        if mirror:
+            physical_stripe_id = stripe_count - 1 - physical_stripe_id
+        prefix = stripe_id != 0 and stripe_id % stripe_count == 0
+        return physical_stripe_id, version_id, mirror, prefix
 
     @abstractmethod
     def get_image(self, stripe_id, version_id):
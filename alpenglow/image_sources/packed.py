@@ -0,0 +1,209 @@
+import json
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import boto3
+import numpy
+from botocore.config import Config
+
+from alpenglow.image_sources.image_source import ImageSource
+
+MAGIC = b'ALPPACK1'
+HEADER_FORMAT = '<8sQQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+class PackedStripeWriter:
+    """
+    Writes all versions of a single stripe into one container file.
+
+    Container starts with a header (magic, offset and length of the index), followed by one chunk per version holding
+    raw pixel data (optionally compressed with zlib) and JSON index with shape, dtype and location of each chunk.
+    """
+    def __init__(self, path, compression=None, compression_level=6):
+        """
+        Parameters
+        ----------
+        path: str
+            Path of created container file.
+        compression: str
+            None or 'zlib'.
+        compression_level: int
+            zlib compression level.
+        """
+        if compression not in (None, 'zlib'):
+            raise ValueError("Unsupported compression {}".format(compression))
+        self.compression = compression
+        self.compression_level = compression_level
+        self.shape = None
+        self.dtype = None
+        self.chunks = []
+
+        self._file = open(path, 'wb')
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, 0, 0))
+
+    def append(self, version_id, image):
+        """
+        Appends image as the next version of the stripe.
+
+        Parameters
+        ----------
+        version_id: int
+            External id of the version (e.g. number in source file name).
+        image: ndarray
+            Image with the same shape and dtype as previously appended ones.
+        """
+        if self.shape is None:
+            self.shape = image.shape
+            self.dtype = image.dtype
+        elif image.shape != self.shape or image.dtype != self.dtype:
+            raise ValueError("Image {} {} does not match {} {}".format(image.shape, image.dtype, self.shape, self.dtype))
+
+        data = numpy.ascontiguousarray(image).tobytes()
+        if self.compression == 'zlib':
+            data = zlib.compress(data, self.compression_level)
+
+        self.chunks.append([version_id, self._file.tell(), len(data)])
+        self._file.write(data)
+
+    def close(self):
+        """
+        Writes index and closes the file.
+        """
+        index = json.dumps(dict(
+            shape=list(self.shape) if self.shape is not None else None,
+            dtype=self.dtype.str if self.dtype is not None else None,
+            compression=self.compression,
+            chunks=self.chunks
+        )).encode('utf-8')
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, index_offset, len(index)))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PackedImageSource(ImageSource):
+    """
+    Implementation of image source reading images from containers written by PackedStripeWriter, one container per
+    stripe.
+
+    Containers are read from local file system, or from s3 storage with byte-range requests when s3 credentials are
+    given. Index of each container is read once and kept in memory.
+    """
+    def __init__(self, path_format, stripe_ids, channel_count=1, s3=None, max_workers=8, array_mapping=None):
+        """
+        Parameters
+        ----------
+        path_format: str
+            Format of container paths (or s3 keys) with stripe_id field.
+        stripe_ids: [int]
+            Ids of stripes used in path_format.
+        channel_count: int
+            Number of channels in each image.
+        s3: dict
+            If given, containers are read from s3 storage. Dictionary with 'key', 'secret', 'bucket' and 'endpoint'.
+        max_workers: int
+            Number of threads reading images requested by get_image_future.
+        array_mapping: function
+            Function applied to each stored array, by default swapping axes like FilesystemImageSource.
+        """
+        super(PackedImageSource, self).__init__()
+        self.path_format = path_format
+        self.stripe_ids = stripe_ids
+        self._channel_count = channel_count
+        self._s3 = s3
+        self._max_workers = max_workers
+        self._array_mapping = array_mapping
+        self._transposed = array_mapping is None
+        if array_mapping is None:
+            self._array_mapping = lambda a: a.swapaxes(0, 1)
+
+        self._connection = None
+        self._lock = Lock()
+        self._indexes = {}
+
+    def get_image(self, stripe_id, version_id):
+        stripe_image_id = stripe_id % len(self.stripe_ids)
+        if (stripe_id // len(self.stripe_ids)) % 2 == 1:
+            stripe_image_id = len(self.stripe_ids) - 1 - stripe_image_id
+
+        path = self.path_format.format(stripe_id=self.stripe_ids[stripe_image_id])
+        index = self.__index(path)
+        _, offset, length = index['chunks'][version_id]
+
+        data = self.__read(path, offset, length)
+        if index['compression'] == 'zlib':
+            data = zlib.decompress(data)
+        image = numpy.frombuffer(data, dtype=numpy.dtype(index['dtype'])).reshape(index['shape'])
+
+        return ImageSource.loop_image(self._array_mapping(image), stripe_id, len(self.stripe_ids))
+
+    def get_image_future(self, stripe_id, version_id):
+        self._lock.acquire()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        self._lock.release()
+        return self._executor.submit(self.get_image, stripe_id, version_id)
+
+    def probes_images(self):
+        return self._transposed
+
+    def probe_image(self, stripe_id, version_id=0):
+        """
+        Reads shape and dtype from the index of the container, unless custom array_mapping is used.
+        """
+        if not self._transposed:
+            return super(PackedImageSource, self).probe_image(stripe_id, version_id)
+
+        physical_stripe_id = self.physical_image_id(stripe_id, version_id)[0]
+        index = self.__index(self.path_format.format(stripe_id=self.stripe_ids[physical_stripe_id]))
+        shape = (index['shape'][1], index['shape'][0])
+        return ImageSource.loop_shape(shape, stripe_id, len(self.stripe_ids)), numpy.dtype(index['dtype'])
+
+    def stripe_count(self):
+        return len(self.stripe_ids)
+
+    def version_count(self):
+        return len(self.__index(self.path_format.format(stripe_id=self.stripe_ids[0]))['chunks'])
+
+    def channel_count(self):
+        return self._channel_count
+
+    def __index(self, path):
+        if path not in self._indexes:
+            magic, index_offset, index_length = struct.unpack(HEADER_FORMAT, self.__read(path, 0, HEADER_SIZE))
+            if magic != MAGIC:
+                raise ValueError("{} is not a packed stripe".format(path))
+            index = json.loads(self.__read(path, index_offset, index_length).decode('utf-8'))
+            self._lock.acquire()
+            self._indexes[path] = index
+            self._lock.release()
+        return self._indexes[path]
+
+    def __read(self, path, offset, length):
+        if self._s3 is None:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+
+        byte_range = 'bytes={}-{}'.format(offset, offset + length - 1)
+        return self.__get_connection().get_object(Bucket=self._s3['bucket'], Key=path.lstrip('/'), Range=byte_range)["Body"].read()
+
+    def __get_connection(self):
+        self._lock.acquire()
+        if self._connection is None:
+            self._connection = boto3.client('s3', endpoint_url=self._s3['endpoint'],
+                                            aws_access_key_id=self._s3['key'],
+                                            aws_secret_access_key=self._s3['secret'],
+                                            config=Config(max_pool_connections=self._max_workers))
+        self._lock.release()
+        return self._connection
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from threading import Lock
+
+from alpenglow.futures import map_future
+from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.stripes.stripe import region_slices
+
+
+class PrefetchingImageSource(ImageSource):
+    """
+    Image source requesting images from underlying image source before they are requested by the consumer.
+
+    Images are requested in order given by image_order (e.g. alpenglow.benchmark.get_image_order), keeping at most
+    depth prefetched images which were not yet taken by the consumer. Prefetching stops when images waiting for the
+    consumer would exceed max_bytes, and resumes when the consumer catches up. Prefetched images which the consumer
+    skipped are dropped once it gets depth images further in the order.
+
+    Notes
+    -----
+    Prefetching is driven by requests of the consumer, underlying source is never called from its worker threads.
+    """
+    def __init__(self, image_source, image_order, depth=16, max_bytes=1024 ** 3):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source from which images are fetched.
+        image_order: iterable of (int, int)
+            (stripe_id, version_id) pairs in order in which they will be requested.
+        depth: int
+            Maximal number of images requested ahead of the consumer.
+        max_bytes: int
+            Maximal total size of prefetched images waiting for the consumer.
+        """
+        self.image_source = image_source
+        self.depth = depth
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+        self._order = iter(image_order)
+        self._lock = Lock()
+        self._prefetched = OrderedDict()  # (stripe_id, version_id) -> (index in order, future)
+        self._sizes = {}
+        self._requested = set()
+        self._next_index = 0
+        self._consumed_index = -1
+        self._ready_bytes = 0
+        self._image_bytes = 0
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def get_image_future(self, stripe_id, version_id):
+        image_id = (stripe_id, version_id)
+
+        self._lock.acquire()
+        entry = self._prefetched.pop(image_id, None)
+        if entry is not None:
+            self.hits += 1
+            self._ready_bytes -= self._sizes.pop(image_id, 0)
+            self._consumed_index = max(self._consumed_index, entry[0])
+            self.__drop_skipped()
+        else:
+            self.misses += 1
+            self._requested.add(image_id)
+        self._lock.release()
+
+        self.__prefetch()
+
+        if entry is not None:
+            return entry[1]
+        return self.image_source.get_image_future(stripe_id, version_id)
+
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None):
+        """
+        Cuts region from prefetched image, or requests only the region from underlying image source. Region requests
+        do not take prefetched images and do not move prefetching forward.
+        """
+        self._lock.acquire()
+        entry = self._prefetched.get((stripe_id, version_id))
+        self._lock.release()
+
+        if entry is not None:
+            region = region_slices(rows, columns)
+            return map_future(entry[1], lambda image: image[region])
+        return self.image_source.get_image_region_future(stripe_id, version_id, rows, columns)
+
+    def reads_regions(self):
+        return self.image_source.reads_regions()
+
+    def probes_images(self):
+        return self.image_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.image_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.image_source.fingerprint(stripe_id, version_id)
+
+    def close(self):
+        self.image_source.close()
+
+    def stripe_count(self):
+        return self.image_source.stripe_count()
+
+    def version_count(self):
+        return self.image_source.version_count()
+
+    def channel_count(self):
+        return self.image_source.channel_count()
+
+    def __prefetch(self):
+        while True:
+            self._lock.acquire()
+            waiting_bytes = self._ready_bytes + self._image_bytes * (len(self._prefetched) - len(self._sizes))
+            if len(self._prefetched) >= self.depth or waiting_bytes >= self.max_bytes:
+                self._lock.release()
+                return
+
+            image_id = next(self._order, None)
+            if image_id is None:
+                self._lock.release()
+                return
+
+            index = self._next_index
+            self._next_index += 1
+            if image_id in self._requested:  # consumer was faster
+                self._requested.remove(image_id)
+                self._lock.release()
+                continue
+            self._lock.release()
+
+            future = self.image_source.get_image_future(*image_id)
+
+            self._lock.acquire()
+            self._prefetched[image_id] = (index, future)
+            self._lock.release()
+            future.add_done_callback(lambda f, image_id=image_id: self.__prefetched(image_id, f))
+
+    def __prefetched(self, image_id, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self._lock.acquire()
+        image_bytes = future.result().nbytes
+        self._image_bytes = image_bytes
+        if image_id in self._prefetched and self._prefetched[image_id][1] is future:
+            self._sizes[image_id] = image_bytes
+            self._ready_bytes += image_bytes
+        self._lock.release()
+
+    def __drop_skipped(self):
+        for image_id, (index, future) in list(self._prefetched.items()):
+            if index >= self._consumed_index - self.depth:
+                break
+            del self._prefetched[image_id]
+            self._ready_bytes -= self._sizes.pop(image_id, 0)
+            future.cancel()
+            self.dropped += 1
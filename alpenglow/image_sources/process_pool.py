@@ -0,0 +1,192 @@
+import errno
+import os
+import tempfile
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock
+
+import numpy
+
+from alpenglow.image_sources.image_source import ImageSource
+
+_worker_sources = {}
+
+SHARED_FILE_PREFIX = 'alpenglow-'
+
+
+def fetch_to_shared_file(token, source_class, args, kwargs, stripe_id, version_id, shared_directory, prefix):
+    """
+    Fetches image in a worker process and stores it in a .npy file in shared_directory, with name starting with prefix.
+
+    Image source is created once per worker process and reused by following tasks with the same token.
+
+    Returns
+    -------
+    str
+        Path of the file holding the image.
+    """
+    if token not in _worker_sources:
+        _worker_sources[token] = source_class(*args, **kwargs)
+    image = _worker_sources[token].get_image(stripe_id, version_id)
+
+    descriptor, path = tempfile.mkstemp(dir=shared_directory, prefix=prefix, suffix='.npy')
+    os.close(descriptor)
+    try:
+        shared_image = numpy.lib.format.open_memmap(path, mode='w+', dtype=image.dtype, shape=image.shape)
+        shared_image[...] = image
+        del shared_image
+    except Exception:
+        _remove(path)
+        raise
+    return path
+
+
+def remove_stale_shared_files(shared_directory):
+    """
+    Removes files left in shared_directory by pools whose main process is no longer running (e.g. was killed before it
+    took images from its workers).
+    """
+    if os.name != 'posix':  # liveness of other processes is checked with signals
+        return
+
+    for filename in os.listdir(shared_directory):
+        if not filename.startswith(SHARED_FILE_PREFIX) or not filename.endswith('.npy'):
+            continue
+        try:
+            pid = int(filename[len(SHARED_FILE_PREFIX):].split('-')[0])
+        except ValueError:
+            continue
+        if not _is_running(pid):
+            _remove(os.path.join(shared_directory, filename))
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ProcessPoolImageSource(ImageSource):
+    """
+    Image source fetching and decoding images in a pool of worker processes, so decoding does not compete for the GIL
+    with matching and merging.
+
+    Each worker creates its own source_class(*args, **kwargs). Decoded pixels are not pickled - worker writes them into
+    a file in shared_directory (by default /dev/shm, which is kept in memory), main process maps that file and removes
+    it, so the mapping is the only reference left. Names of the files contain pid of the main process, files left by
+    main processes which are no longer running are removed when a pool is created (see remove_stale_shared_files).
+
+    Notes
+    -----
+    args and kwargs are pickled for every request, so they should be small and must not contain lambdas.
+    """
+    def __init__(self, source_class, args=(), kwargs=None, max_workers=None, shared_directory=None):
+        """
+        Parameters
+        ----------
+        source_class: class
+            ImageSource implementation created in worker processes.
+        args: list
+            Positional arguments of source_class.
+        kwargs: dict
+            Keyword arguments of source_class.
+        max_workers: int
+            Number of worker processes, number of cores by default.
+        shared_directory: str
+            Directory used to pass images from workers.
+        """
+        super(ProcessPoolImageSource, self).__init__()
+        self.source_class = source_class
+        self.args = list(args)
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.max_workers = max_workers
+        self.shared_directory = shared_directory
+        if shared_directory is None:
+            self.shared_directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+        self._token = uuid.uuid4().hex
+        self._prefix = '{}{}-'.format(SHARED_FILE_PREFIX, os.getpid())
+        self._lock = Lock()
+        self._sample_source = None
+
+        remove_stale_shared_files(self.shared_directory)
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def get_image_future(self, stripe_id, version_id):
+        self._lock.acquire()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._lock.release()
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        worker_future = self._executor.submit(fetch_to_shared_file, self._token, self.source_class, self.args,
+                                              self.kwargs, stripe_id, version_id, self.shared_directory, self._prefix)
+        worker_future.add_done_callback(lambda f: self.__map_image(future, f))
+        return future
+
+    def probes_images(self):
+        return self.__get_sample_source().probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.__get_sample_source().probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.__get_sample_source().fingerprint(stripe_id, version_id)
+
+    def stripe_count(self):
+        return self.__get_sample_source().stripe_count()
+
+    def version_count(self):
+        return self.__get_sample_source().version_count()
+
+    def channel_count(self):
+        return self.__get_sample_source().channel_count()
+
+    def close(self):
+        """
+        Stops worker processes.
+        """
+        self._lock.acquire()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __get_sample_source(self):
+        if self._sample_source is None:
+            self._sample_source = self.source_class(*self.args, **self.kwargs)
+        return self._sample_source
+
+    @classmethod
+    def __map_image(cls, future, worker_future):
+        if worker_future.exception() is not None:
+            future.set_exception(worker_future.exception())
+            return
+
+        path = worker_future.result()
+        try:
+            image = numpy.load(path, mmap_mode='r+')
+        except Exception as e:
+            future.set_exception(e)
+            return
+        finally:
+            _remove(path)
+        future.set_result(image)
@@ -1,85 +1,259 @@
-from concurrent.futures import Future
-import sys
-is_py2 = sys.version[0] == '2'
-if is_py2:
-    from Queue import Queue, Empty
-else:
-    from queue import Queue, Empty
-
+from collections import OrderedDict
 from threading import Thread, Lock
+from time import time
 
 import boto3
+import numpy
+from botocore.config import Config
 from io import BytesIO
 
 from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.image_sources.scheduler import FetchScheduler, timed_future
+from alpenglow.image_sources.tiff_layout import contiguous_layout, stored_shape
+from alpenglow.stripes.stripe import region_slices
 import skimage.external.tifffile as tiff
 
 
 class S3ImageSourceThread(Thread):
-    def __init__(self, thread_id, credentials, task_queue, threads, lock, array_mapping):
+    """
+    Long living worker fetching batches of images chosen by the scheduler until the scheduler is closed.
+    """
+    def __init__(self, scheduler, fetch, batch_size=1):
         Thread.__init__(self)
         self.daemon = True
-        self.thread_id = thread_id
-        self.threads = threads
-        self.task_queue = task_queue
-        self.lock = lock
-        self._bucket = credentials['bucket']
-        self.connection = None
-        self._credentials = credentials
-        self.array_mapping = array_mapping
-
+        self.scheduler = scheduler
+        self.fetch = fetch
+        self.batch_size = batch_size
 
     def run(self):
-        try:
-            while True:
-                path, future, stripe_id, stripe_count = self.task_queue.get_nowait()
-                image_data = BytesIO(self.get_connection().get_object(Bucket=self._bucket, Key=path)["Body"].read())
-                future.set_result(ImageSource.loop_image(self.array_mapping(tiff.TiffFile(image_data).asarray()), stripe_id, stripe_count))
-        except Empty:
-            self.lock.acquire()
-            del self.threads[self.thread_id]
-            self.lock.release()
+        while True:
+            requests = self.scheduler.get(self.batch_size)
+            if len(requests) == 0:
+                break
 
-    def get_connection(self):
-        if self.connection is None:
-            self.connection = boto3.client('s3', endpoint_url=self._credentials['endpoint'],
-                                           aws_access_key_id=self._credentials['key'],
-                                           aws_secret_access_key=self._credentials['secret'])
-        return self.connection
+            for future, task in requests:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                future.timing['queue_wait'] = time() - future.timing['requested']
+                try:
+                    future.set_result(self.fetch(task, future.timing))
+                except Exception as e:
+                    future.set_exception(e)
 
 
 class S3ImageSource(ImageSource):
     """
     Implementation of image source fetching images from s3 storage.
+
+    Images are fetched by a fixed pool of max_workers threads started with the first request. All workers share single
+    boto3 client, so HTTP connections are kept alive and reused between requests. Pending requests are kept in
+    FetchScheduler holding at most queue_size requests - requesting more images blocks until workers catch up. Workers
+    take up to batch_size requests at once.
+
+    Requests with higher priority are fetched first. Priority can be given with each request, or computed by priority
+    function (stripe_id, version_id) -> int, e.g. to fetch versions used for shift computation before the others.
+    Cancelled requests are dropped without being fetched.
+
+    Returned futures have timing dict (see alpenglow.image_sources.scheduler.timed_future) filled by workers.
+
+    Regions (see get_image_region_future) of uncompressed TIFFs are fetched with byte-range requests when they are
+    stored as a contiguous block. With default array_mapping image columns are stored as rows of the TIFF, so only
+    column ranges (e.g. single channel) reduce transfer - row ranges are cut after fetching all rows. Layout of files
+    is read once per stripe from first header_bytes bytes of one of its images, as images of a stripe are assumed to be
+    stored in the same way in each version. Shape and dtype of images (see probe_image) are read from header of single
+    image of each stripe as well.
+
+    Source should be closed when it is no longer needed, either explicitly with close or by using it as a context
+    manager.
     """
-    def __init__(self, path_format, stripe_ids, version_ids, key, secret, bucket, endpoint, channel_count=1, mapping=None, max_workers=8, array_mapping=None):
+    def __init__(self, path_format, stripe_ids, version_ids, key, secret, bucket, endpoint, channel_count=1, mapping=None, max_workers=8, array_mapping=None, queue_size=256, batch_size=4, priority=None, header_bytes=64 * 1024):
         self.path_format = path_format
         self.stripe_ids = stripe_ids
         self.version_ids = version_ids
         self._channel_count = channel_count
         self._max_workers = max_workers
+        self._batch_size = batch_size
         self.mapping = mapping
+        self.priority = priority
         self._array_mapping = array_mapping
+        self._transposed = array_mapping is None
         if array_mapping is None:
             self._array_mapping = lambda a: a.swapaxes(0, 1)
+        self._header_bytes = header_bytes
+        self._layouts = {}
+        self._probes = {}
 
         self._bucket = bucket
 
-        self._thread_data = {
-            'bucket': bucket,
+        self._connection_data = {
             'endpoint': endpoint,
             'key': key,
             'secret': secret
         }
-        self._task_queue = Queue()
-        self._lock = Lock()
-        self._threads = {}
-        self._thread_id = 1
+        self._connection = None
+        self._scheduler = FetchScheduler(maxsize=queue_size)
+        self._lock = Lock()  # guards workers, layouts and probes
+        self._threads = []
+        self._closed = False
 
     def get_image(self, stripe_id, version_id):
         return self.get_image_future(stripe_id, version_id).result()
 
-    def get_image_future(self, stripe_id, version_id):
+    def get_image_timed(self, stripe_id, version_id, timing):
+        future = self.get_image_future(stripe_id, version_id)
+        image = future.result()
+        timing.update(future.timing)
+        return image
+
+    def get_image_future(self, stripe_id, version_id, priority=None, deadline=None):
+        """
+        Parameters
+        ----------
+        priority: int
+            Requests with higher priority are fetched first. Computed with priority function if not given.
+        deadline: float
+            Time (as returned by time.time()) until which the image is needed. Optional.
+        """
+        return self.get_image_futures([(stripe_id, version_id)], priority, deadline)[(stripe_id, version_id)]
+
+    def get_image_futures(self, image_ids, priority=None, deadline=None):
+        """
+        Requests many images at once, putting all of them into the scheduler together.
+        """
+        futures = OrderedDict()
+        for image_id in image_ids:
+            if image_id not in futures:
+                futures[image_id] = timed_future()
+
+        requests = [(future, (self.__path(stripe_id, version_id), stripe_id, None), stripe_id,
+                     self.__priority(stripe_id, version_id, priority), deadline)
+                    for (stripe_id, version_id), future in futures.items()]
+
+        self.__start_workers()
+        self._scheduler.put_many(requests)
+
+        return futures
+
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None, priority=None, deadline=None):
+        """
+        Requests region of the image, see ImageSource.get_image_region.
+        """
+        future = timed_future()
+        self.__start_workers()
+        self._scheduler.put(future, (self.__path(stripe_id, version_id), stripe_id, (rows, columns)), stripe_id,
+                            self.__priority(stripe_id, version_id, priority), deadline)
+        return future
+
+    def reads_regions(self):
+        return self._transposed
+
+    def probes_images(self):
+        return self._transposed
+
+    def probe_image(self, stripe_id, version_id=0):
+        """
+        Reads shape and dtype from the TIFF header fetched with a byte-range request, falling back to fetching whole
+        image when the header does not fit in header_bytes or array_mapping is not the default one. Images of a stripe
+        are assumed to have the same shape and dtype in each version, so each stripe is probed once.
+        """
+        physical_stripe_id = self.physical_image_id(stripe_id, version_id)[0]
+        self._lock.acquire()
+        probe = self._probes.get(physical_stripe_id)
+        self._lock.release()
+
+        if probe is None:
+            if self._transposed:
+                probe = self.__read_header(self.__path(physical_stripe_id, version_id), stored_shape)
+            if probe is None:
+                probe = super(S3ImageSource, self).probe_image(physical_stripe_id, version_id)
+            else:
+                probe = (probe[0][1], probe[0][0]), probe[1]
+            self._lock.acquire()
+            self._probes[physical_stripe_id] = probe
+            self._lock.release()
+
+        shape, dtype = probe
+        return ImageSource.loop_shape(shape, stripe_id, len(self.stripe_ids)), dtype
+
+    def fingerprint(self, stripe_id, version_id):
+        """
+        ETag of the object, read with a HEAD request.
+        """
+        return self.get_connection().head_object(Bucket=self._bucket, Key=self.__path(stripe_id, version_id))['ETag']
+
+    def get_connection(self):
+        """
+        Returns
+        -------
+        boto3 s3 client shared by all workers, with connection pool large enough to keep one connection per worker.
+        """
+        if self._connection is None:
+            self._connection = boto3.client('s3', endpoint_url=self._connection_data['endpoint'],
+                                            aws_access_key_id=self._connection_data['key'],
+                                            aws_secret_access_key=self._connection_data['secret'],
+                                            config=Config(max_pool_connections=self._max_workers))
+        return self._connection
+
+    def __fetch(self, task, timing):
+        path, stripe_id, region = task
+        start_time = time()
+
+        if region is not None and region[1] is not None and self._transposed:
+            layout = self.__layout(path, stripe_id)
+            if layout is not None:
+                offset, shape, dtype = layout
+                row_from, row_to, step = slice(*region[1]).indices(shape[0])  # image columns are stored as rows
+                if step == 1 and row_to > row_from:
+                    row_bytes = shape[1] * dtype.itemsize
+                    byte_range = 'bytes={}-{}'.format(offset + row_from * row_bytes, offset + row_to * row_bytes - 1)
+                    image_data = self.get_connection().get_object(Bucket=self._bucket, Key=path, Range=byte_range)["Body"].read()
+                    read_time = time()
+                    image = numpy.frombuffer(bytearray(image_data), dtype=dtype).reshape((row_to - row_from, shape[1]))
+                    image = ImageSource.loop_image(image.swapaxes(0, 1), stripe_id, len(self.stripe_ids))
+                    image = image[region_slices(region[0])]
+                    timing.update(read=read_time - start_time, decode=time() - read_time, bytes=len(image_data))
+                    return image
+
+        image_data = self.get_connection().get_object(Bucket=self._bucket, Key=path)["Body"].read()
+        read_time = time()
+        image = ImageSource.loop_image(self._array_mapping(tiff.TiffFile(BytesIO(image_data)).asarray()), stripe_id, len(self.stripe_ids))
+        if region is not None:
+            image = image[region_slices(*region)]
+        timing.update(read=read_time - start_time, decode=time() - read_time, bytes=len(image_data))
+        return image
+
+    def __layout(self, path, stripe_id):
+        physical_stripe_id = self.physical_image_id(stripe_id, 0)[0]
+        self._lock.acquire()
+        known = physical_stripe_id in self._layouts
+        layout = self._layouts.get(physical_stripe_id)
+        self._lock.release()
+
+        if not known:  # header is read without holding the lock, concurrent reads of the same layout are harmless
+            layout = self.__read_header(path, contiguous_layout)
+            self._lock.acquire()
+            self._layouts[physical_stripe_id] = layout
+            self._lock.release()
+        return layout
+
+    def __read_header(self, path, parse):
+        byte_range = 'bytes=0-{}'.format(self._header_bytes - 1)
+        try:
+            header = self.get_connection().get_object(Bucket=self._bucket, Key=path, Range=byte_range)["Body"].read()
+            with tiff.TiffFile(BytesIO(header)) as tif:
+                return parse(tif)
+        except Exception:
+            return None  # e.g. header does not fit in header_bytes
+
+    def __priority(self, stripe_id, version_id, priority):
+        if priority is not None:
+            return priority
+        if self.priority is not None:
+            return self.priority(stripe_id, version_id)
+        return 0
+
+    def __path(self, stripe_id, version_id):
         stripe_image_id = stripe_id % len(self.stripe_ids)
         if (stripe_id // len(self.stripe_ids)) % 2 == 1:
             stripe_image_id = len(self.stripe_ids) - 1 - stripe_image_id
@@ -90,22 +264,41 @@ class S3ImageSource(ImageSource):
         if self.mapping is not None:
             external_stripe_id, external_version_id = self.mapping(external_stripe_id, external_version_id)
 
-        path = self.path_format.format(stripe_id=external_stripe_id, version_id=external_version_id).lstrip('/')
-
-        future = Future()
+        return self.path_format.format(stripe_id=external_stripe_id, version_id=external_version_id).lstrip('/')
 
-        task = (path, future, stripe_id, len(self.stripe_ids))
-        self._task_queue.put(task)
+    def close(self):
+        """
+        Stops all workers after they finish already requested images.
+        """
         self._lock.acquire()
-        if len(self._threads) < self._max_workers:
-            thread_id = self._thread_id
-            self._thread_id += 1
-            thread = S3ImageSourceThread(thread_id, self._thread_data, self._task_queue, self._threads, self._lock, self._array_mapping)
-            self._threads[thread_id] = thread
-            thread.start()
+        self._closed = True
+        threads = self._threads
+        self._threads = []
         self._lock.release()
 
-        return future
+        self._scheduler.close()
+        for thread in threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __start_workers(self):
+        self._lock.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("Cannot fetch images from closed S3ImageSource")
+            if len(self._threads) == 0:
+                self.get_connection()
+                for _ in range(self._max_workers):
+                    thread = S3ImageSourceThread(self._scheduler, self.__fetch, self._batch_size)
+                    self._threads.append(thread)
+                    thread.start()
+        finally:
+            self._lock.release()
 
     def stripe_count(self):
         return len(self.stripe_ids)
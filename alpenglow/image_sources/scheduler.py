@@ -0,0 +1,170 @@
+import heapq
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from itertools import count
+from threading import Condition
+from time import time
+
+
+def timed_future():
+    """
+    Returns
+    -------
+    Future
+        Future with timing dict holding time of the request ('requested'), in which the worker serving the request
+        records time spent in the queue ('queue_wait'), on reading and decoding the image ('read', 'decode') and number
+        of bytes read ('bytes').
+    """
+    future = Future()
+    future.timing = dict(requested=time())
+    return future
+
+
+class _PriorityLevel:
+    """
+    Requests with the same priority: requests with deadline in earliest deadline first order, followed by the rest
+    served in turns by stripe.
+    """
+    def __init__(self):
+        self.deadlines = []
+        self.stripes = OrderedDict()
+        self.size = 0
+
+    def push(self, sequence, future, task, stripe_id, deadline):
+        if deadline is not None:
+            heapq.heappush(self.deadlines, (deadline, sequence, future, task))
+        else:
+            if stripe_id not in self.stripes:
+                self.stripes[stripe_id] = deque()
+            self.stripes[stripe_id].append((future, task))
+        self.size += 1
+
+    def pop(self):
+        self.size -= 1
+        if len(self.deadlines) > 0:
+            _, _, future, task = heapq.heappop(self.deadlines)
+            return future, task
+
+        stripe_id, requests = self.stripes.popitem(last=False)
+        request = requests.popleft()
+        if len(requests) > 0:
+            self.stripes[stripe_id] = requests  # next request of this stripe waits for other stripes
+        return request
+
+
+class FetchScheduler:
+    """
+    Thread safe queue of image requests deciding in which order they are fetched.
+
+    Requests with higher priority are served first. Among requests with the same priority, requests with deadline are
+    served first in order of their deadlines, remaining ones are served in turns by stripe, so a stripe with many
+    pending versions does not starve the others. Requests whose futures were cancelled before being served are
+    dropped.
+
+    Notes
+    -----
+    Scheduler only orders requests - the worker taking a request is responsible for its future, and should start
+    with future.set_running_or_notify_cancel().
+    """
+    def __init__(self, maxsize=0):
+        """
+        Parameters
+        ----------
+        maxsize: int
+            Maximal number of pending requests, putting more requests blocks until workers take some. Unlimited if 0.
+        """
+        self.maxsize = maxsize
+
+        self._condition = Condition()
+        self._levels = {}
+        self._sequence = count()
+        self._size = 0
+        self._closed = False
+
+    def put(self, future, task, stripe_id=None, priority=0, deadline=None):
+        """
+        Parameters
+        ----------
+        future: Future
+            Future completed by the worker which takes the request.
+        task: object
+            Anything needed by the worker to serve the request.
+        stripe_id: int
+            Stripe of requested image, used to share workers fairly between stripes.
+        priority: int
+            Requests with higher priority are served first.
+        deadline: float
+            Time (as returned by time.time()) until which the image is needed. Optional.
+        """
+        self.put_many([(future, task, stripe_id, priority, deadline)])
+
+    def put_many(self, requests):
+        """
+        Parameters
+        ----------
+        requests: iterable of (Future, object, int, int, float)
+            (future, task, stripe_id, priority, deadline) of each request, as in put.
+        """
+        with self._condition:
+            for future, task, stripe_id, priority, deadline in requests:
+                while self.maxsize > 0 and self._size >= self.maxsize and not self._closed:
+                    self._condition.notify_all()  # wake workers waiting for already added requests
+                    self._condition.wait()
+                if self._closed:
+                    raise RuntimeError("Cannot schedule requests in closed FetchScheduler")
+
+                if priority not in self._levels:
+                    self._levels[priority] = _PriorityLevel()
+                self._levels[priority].push(next(self._sequence), future, task, stripe_id, deadline)
+                self._size += 1
+            self._condition.notify_all()
+
+    def get(self, max_count=1, block=True):
+        """
+        Parameters
+        ----------
+        max_count: int
+            Maximal number of returned requests.
+        block: bool
+            Whether to wait for requests when none is pending.
+
+        Returns
+        -------
+        list of (Future, object)
+            (future, task) of at most max_count requests, in order in which they should be served. Empty if there are no
+            pending requests and block is False or the scheduler was closed.
+        """
+        requests = []
+        with self._condition:
+            while True:
+                while block and self._size == 0 and not self._closed:
+                    self._condition.wait()
+
+                while len(requests) < max_count and self._size > 0:
+                    priority = max(self._levels)
+                    level = self._levels[priority]
+                    future, task = level.pop()
+                    self._size -= 1
+                    if level.size == 0:
+                        del self._levels[priority]
+                    if not future.cancelled():
+                        requests.append((future, task))
+
+                if len(requests) > 0 or not block or self._closed:
+                    break
+
+            self._condition.notify_all()
+        return requests
+
+    def close(self):
+        """
+        Rejects new requests. Workers waiting in get receive requests which are still pending, followed by an empty
+        list.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return self._size
@@ -1,52 +1,136 @@
-from concurrent.futures import Future
+from collections import OrderedDict
 from threading import Thread, Lock
+from time import time
+
 from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.image_sources.scheduler import FetchScheduler, timed_future
 
 
 class ImageSourceThread(Thread):
-    def __init__(self, image_source, task_queue, lock, sources):
+    """
+    Long living worker fetching images chosen by the scheduler with its own image source, until the scheduler is closed.
+    """
+    def __init__(self, image_source, scheduler):
         Thread.__init__(self)
         self.daemon = True
-        self.task_queue = task_queue
-        self.lock = lock
+        self.scheduler = scheduler
         self.image_source = image_source
-        self.sources = sources
 
     def run(self):
         while True:
-            self.lock.acquire()
-            if len(self.task_queue) == 0:
+            requests = self.scheduler.get()
+            if len(requests) == 0:
                 break
-            future, stripe_id, version_id = self.task_queue.pop(0)
-            self.lock.release()
-            future.set_result(self.image_source.get_image(stripe_id, version_id))
-        self.sources.append(self.image_source)
-        self.lock.release()
+
+            future, (stripe_id, version_id, region) = requests[0]
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            future.timing['queue_wait'] = time() - future.timing['requested']
+            try:
+                if region is None:
+                    future.set_result(self.image_source.get_image_timed(stripe_id, version_id, future.timing))
+                else:
+                    future.set_result(self.image_source.get_image_region(stripe_id, version_id, *region))
+            except Exception as e:
+                future.set_exception(e)
 
 
 class ThreadedImageSource(ImageSource):
-    def __init__(self, sources):
+    """
+    Image source fetching images with many instances of underlying image source.
+
+    Each source is used by its own worker thread, started with the first request and living until the source is closed.
+    Pending requests are ordered by FetchScheduler - requests with higher priority (given with each request, or
+    computed by priority function (stripe_id, version_id) -> int) are served first. Cancelled requests are dropped.
+    At most max_pending requests wait for workers - requesting more images blocks until workers catch up.
+
+    Returned futures have timing dict (see alpenglow.image_sources.scheduler.timed_future) filled by workers with
+    get_image_timed of underlying sources.
+
+    Source should be closed when it is no longer needed, either explicitly with close or by using it as a context
+    manager.
+    """
+    def __init__(self, sources, priority=None, max_pending=256):
+        """
+        Parameters
+        ----------
+        sources: [ImageSource]
+            Underlying image sources, each used by a single worker thread.
+        priority: function
+            Function (stripe_id, version_id) -> int computing priority of requests given without priority.
+        max_pending: int
+            Maximal number of requests waiting for workers. Unlimited if 0.
+        """
         self.sources = sources
         self.sample_source = sources[0]
-        self._task_queue = []
+        self.priority = priority
+        self._scheduler = FetchScheduler(maxsize=max_pending)
         self._lock = Lock()
-        self._threads = {}
+        self._threads = []
+        self._started = False
+        self._closed = False
 
-    def get_image_future(self, stripe_id, version_id):
-        future = Future()
-        task = (future, stripe_id, version_id)
-        self._lock.acquire()
-        self._task_queue.append(task)
-        if len(self.sources) > 0:
-            image_source = self.sources.pop()
-            thread = ImageSourceThread(image_source, self._task_queue, self._lock, self.sources)
-            thread.start()
-        self._lock.release()
-        return future
+    def get_image_future(self, stripe_id, version_id, priority=None, deadline=None):
+        """
+        Parameters
+        ----------
+        priority: int
+            Requests with higher priority are fetched first. Computed with priority function if not given.
+        deadline: float
+            Time (as returned by time.time()) until which the image is needed. Optional.
+        """
+        return self.get_image_futures([(stripe_id, version_id)], priority, deadline)[(stripe_id, version_id)]
+
+    def get_image_futures(self, image_ids, priority=None, deadline=None):
+        """
+        Requests many images at once, putting all of them into the scheduler together.
+        """
+        futures = OrderedDict()
+        for image_id in image_ids:
+            if image_id not in futures:
+                futures[image_id] = timed_future()
+
+        requests = [(future, (stripe_id, version_id, None), stripe_id, self.__priority(stripe_id, version_id, priority), deadline)
+                    for (stripe_id, version_id), future in futures.items()]
+
+        if not self._started:
+            self.__start_workers()
+        self._scheduler.put_many(requests)
+        return futures
 
     def get_image(self, stripe_id, version_id):
         return self.get_image_future(stripe_id, version_id).result()
 
+    def get_image_region_future(self, stripe_id, version_id, rows=None, columns=None, priority=None, deadline=None):
+        """
+        Requests region read (see ImageSource.get_image_region) from one of underlying sources.
+        """
+        future = timed_future()
+        if not self._started:
+            self.__start_workers()
+        self._scheduler.put(future, (stripe_id, version_id, (rows, columns)), stripe_id,
+                            self.__priority(stripe_id, version_id, priority), deadline)
+        return future
+
+    def get_image_timed(self, stripe_id, version_id, timing):
+        future = self.get_image_future(stripe_id, version_id)
+        image = future.result()
+        timing.update(future.timing)
+        return image
+
+    def reads_regions(self):
+        return self.sample_source.reads_regions()
+
+    def probes_images(self):
+        return self.sample_source.probes_images()
+
+    def probe_image(self, stripe_id, version_id=0):
+        return self.sample_source.probe_image(stripe_id, version_id)
+
+    def fingerprint(self, stripe_id, version_id):
+        return self.sample_source.fingerprint(stripe_id, version_id)
+
     def stripe_count(self):
         return self.sample_source.stripe_count()
 
@@ -56,3 +140,45 @@ class ThreadedImageSource(ImageSource):
     def channel_count(self):
         return self.sample_source.channel_count()
 
+    def close(self):
+        """
+        Stops all workers after they finish already requested images, and closes underlying sources.
+        """
+        self._lock.acquire()
+        self._closed = True
+        threads = self._threads
+        self._threads = []
+        self._lock.release()
+
+        self._scheduler.close()
+        for thread in threads:
+            thread.join()
+        for image_source in self.sources:
+            image_source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __priority(self, stripe_id, version_id, priority):
+        if priority is not None:
+            return priority
+        if self.priority is not None:
+            return self.priority(stripe_id, version_id)
+        return 0
+
+    def __start_workers(self):
+        self._lock.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("Cannot fetch images from closed ThreadedImageSource")
+            if not self._started:
+                for image_source in self.sources:
+                    thread = ImageSourceThread(image_source, self._scheduler)
+                    self._threads.append(thread)
+                    thread.start()
+                self._started = True
+        finally:
+            self._lock.release()
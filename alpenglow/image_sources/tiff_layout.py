@@ -0,0 +1,48 @@
+import numpy
+
+
+def contiguous_layout(tif):
+    """
+    Parameters
+    ----------
+    tif: TiffFile
+        Opened TIFF file. Only its header is read.
+
+    Returns
+    -------
+    tuple(int, tuple, numpy.dtype)
+        Offset of pixel data in the file, shape and dtype of the image, or None if the file does not hold single page
+        with pixels stored as one uncompressed block.
+    """
+    if len(tif.pages) != 1:
+        return None
+    page = tif.pages[0]
+    contiguous = page.is_contiguous
+    if not contiguous:
+        return None
+    if contiguous is True:  # newer tifffile versions report location of the data separately
+        contiguous = (page.dataoffsets[0], page.nbytes)
+    dtype = numpy.dtype(tif.byteorder + numpy.dtype(page.dtype).char)
+    shape = tuple(page.shape)
+
+    offset, byte_count = contiguous
+    if int(numpy.prod(shape)) * dtype.itemsize != byte_count:
+        return None
+    return offset, shape, dtype
+
+
+def stored_shape(tif):
+    """
+    Parameters
+    ----------
+    tif: TiffFile
+        Opened TIFF file. Only its header is read.
+
+    Returns
+    -------
+    tuple(tuple(int, int), numpy.dtype)
+        Shape and dtype of pixels of single page grayscale TIFF, or None for other files.
+    """
+    if len(tif.pages) != 1 or len(tif.pages[0].shape) != 2:
+        return None
+    return tuple(tif.pages[0].shape), numpy.dtype(numpy.dtype(tif.pages[0].dtype).char)
@@ -0,0 +1,227 @@
+import concurrent
+from collections import deque
+from threading import Lock
+
+import numpy
+
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm, fft_backend
+
+
+class BoundedFftMatchingAlgorithm(FftMatchingAlgorithm):
+    """
+    FftMatchingAlgorithm searching for the shift only within expected ranges of overlap and horizontal shift.
+
+    Ranges are either configured or learned from shifts of previously matched pairs of stripes (which are the relative
+    shifts stored in patchwork of patchwork builders). Only overlap_range[1] rows of each stripe are read and
+    correlated, instead of half of the stripe, and the peak of correlation is searched only within the ranges.
+
+    Correlation is normalized by the number of common pixels of each shift, so that shifts with larger overlaps are not
+    preferred. Found shift is rejected and the pair is matched with full search of FftMatchingAlgorithm when the peak
+    is weak (correlation coefficient of common pixels is below min_peak_correlation) or lies on the border of learned
+    ranges, which suggests that the true shift is outside of them. Until first shift is known (or when ranges are not configured) full search is
+    used as well.
+
+    Learned ranges depend on order in which pairs are matched, so pairs are matched one by one in order of stripes when
+    ranges are learned (see matches_independently).
+    """
+    def __init__(self, versions, channels, overlap_range=None, shift_range=None, overlap_margin=16, shift_margin=16,
+                 history=8, min_peak_correlation=0.9, **kwargs):
+        """
+        Parameters
+        ----------
+        versions: [int]
+            List of versions to test for shift
+        channels: [int]
+            List of channels to test for shift
+        overlap_range: tuple(int, int)
+            Minimal and maximal number of common rows of consecutive stripes. Learned from previous shifts if None.
+        shift_range: tuple(int, int)
+            Minimal and maximal horizontal shift between consecutive stripes. Learned from previous shifts if None.
+        overlap_margin: int
+            Number of rows by which learned overlap range extends range of previously found overlaps.
+        shift_margin: int
+            Number of columns by which learned shift range extends range of previously found shifts.
+        history: int
+            Number of previous shifts from which ranges are learned.
+        min_peak_correlation: float
+            Minimal correlation coefficient of common pixels (see overlap_correlation) of accepted shifts.
+        kwargs:
+            Options of full search, passed to FftMatchingAlgorithm.
+        """
+        FftMatchingAlgorithm.__init__(self, versions, channels, **kwargs)
+        self.overlap_range = overlap_range
+        self.shift_range = shift_range
+        self.overlap_margin = overlap_margin
+        self.shift_margin = shift_margin
+        self.min_peak_correlation = min_peak_correlation
+
+        self.shifts = deque(maxlen=history)
+        self.bounded_matches = 0
+        self.full_matches = 0
+        self._lock = Lock()
+
+    def match(self, top_stripe, bottom_stripe):
+        shift = None
+        bounds = self.search_bounds()
+        if bounds is not None:
+            shift = self.bounded_match(top_stripe, bottom_stripe, *bounds)
+
+        bounded = shift is not None
+        if not bounded:
+            shift = FftMatchingAlgorithm.match(self, top_stripe, bottom_stripe)
+
+        self._lock.acquire()
+        if bounded:
+            self.bounded_matches += 1
+        else:
+            self.full_matches += 1
+        self._lock.release()
+
+        self.observe(shift)
+        return shift
+
+    def matches_independently(self):
+        """
+        Pairs are matched independently only when both ranges are configured.
+        """
+        return self.overlap_range is not None and self.shift_range is not None
+
+    def observe(self, shift):
+        """
+        Adds shift of a pair of stripes (e.g. matched earlier) to shifts from which search ranges are learned.
+
+        Parameters
+        ----------
+        shift: tuple(int, int)
+            Number of common rows and horizontal shift, as returned by match.
+        """
+        self._lock.acquire()
+        self.shifts.append((int(shift[0]), int(shift[1])))
+        self._lock.release()
+
+    def search_bounds(self):
+        """
+        Returns
+        -------
+        tuple(tuple(int, int), tuple(int, int), bool)
+            Overlap range, horizontal shift range and whether the ranges were learned, or None if ranges are not
+            known yet.
+        """
+        if self.overlap_range is None or self.shift_range is None:
+            self._lock.acquire()
+            shifts = list(self.shifts)
+            self._lock.release()
+            if len(shifts) == 0:
+                return None
+            overlaps = [shift[0] for shift in shifts]
+            horizontal_shifts = [shift[1] for shift in shifts]
+
+        overlap_range = self.overlap_range
+        if overlap_range is None:
+            overlap_range = (max(1, min(overlaps) - self.overlap_margin), max(overlaps) + self.overlap_margin)
+
+        shift_range = self.shift_range
+        if shift_range is None:
+            shift_range = (min(horizontal_shifts) - self.shift_margin, max(horizontal_shifts) + self.shift_margin)
+
+        return overlap_range, shift_range, self.overlap_range is None or self.shift_range is None
+
+    def bounded_match(self, top_stripe, bottom_stripe, overlap_range, shift_range, learned=False):
+        """
+        Parameters
+        ----------
+        top_stripe: Stripe
+        bottom_stripe: Stripe
+        overlap_range: tuple(int, int)
+            Minimal and maximal number of common rows.
+        shift_range: tuple(int, int)
+            Minimal and maximal horizontal shift.
+        learned: bool
+            Whether ranges were learned, in which case peak on their border is rejected.
+
+        Returns
+        -------
+        numpy.array
+            Number of common rows and horizontal shift, as returned by match, or None if the peak was rejected.
+        """
+        top_shape = top_stripe.get_channel_shape()
+        bottom_shape = bottom_stripe.get_channel_shape()
+
+        width = min(top_shape[1], bottom_shape[1])
+        height = min(overlap_range[1], top_shape[0], bottom_shape[0])
+        min_overlap = max(1, min(overlap_range[0], height))
+        max_shift = max(abs(shift_range[0]), abs(shift_range[1]))
+        if max_shift >= width:
+            return None
+        # large enough to keep circular correlation free of wrapped around values within the ranges
+        padded_shape = (self.fast_length(2 * height - min_overlap), self.fast_length(width + max_shift + 1))
+
+        futures = {}
+        for version_id in self._versions:
+            for channel_id in self._channels:
+                futures[top_stripe.get_channel_region_future(version_id, channel_id, (top_shape[0] - height, top_shape[0]), (0, width))] = ('top', version_id, channel_id)
+                futures[bottom_stripe.get_channel_region_future(version_id, channel_id, (0, height), (0, width))] = ('bottom', version_id, channel_id)
+
+        spectrum = numpy.zeros((padded_shape[0], padded_shape[1] // 2 + 1), dtype=numpy.result_type(self.precision, numpy.complex64))
+        overlaps = {}
+        for future in concurrent.futures.as_completed(futures):
+            position, version_id, channel_id = futures[future]
+            pair = overlaps.setdefault((version_id, channel_id), {})
+            pair[position] = future.result()
+            if len(pair) == 2:
+                spectrum += self.__padded_spectrum(pair['top'], padded_shape) * self.__padded_spectrum(pair['bottom'], padded_shape).conj()
+
+        correlation = fft_backend.irfft2(spectrum, s=padded_shape)
+
+        rows = numpy.arange(height - overlap_range[1], height - min_overlap + 1)
+        rows = rows[rows >= 0]
+        columns = numpy.arange(shift_range[0], shift_range[1] + 1)
+        window = correlation[numpy.ix_(rows, columns % padded_shape[1])]
+        window = window / numpy.outer(height - rows, width - numpy.abs(columns))  # mean product over common pixels
+        row_index, column_index = numpy.unravel_index(numpy.argmax(window), window.shape)
+        shift = numpy.array([height - rows[row_index], columns[column_index]], dtype=int)
+
+        if learned and (shift[0] in overlap_range or shift[1] in shift_range):
+            return None
+        peak_correlation = numpy.mean([self.overlap_correlation(pair['top'], pair['bottom'], shift)
+                                       for pair in overlaps.values()])
+        if peak_correlation < self.min_peak_correlation:
+            return None
+
+        return shift
+
+    @classmethod
+    def overlap_correlation(cls, top_overlap, bottom_overlap, shift):
+        """
+        Parameters
+        ----------
+        top_overlap: numpy.array
+            Bottom part of the top image.
+        bottom_overlap: numpy.array
+            Top part of the bottom image, of the same shape as top_overlap.
+        shift: tuple(int, int)
+            Number of common rows and horizontal shift, as returned by match.
+
+        Returns
+        -------
+        float
+            Pearson correlation coefficient of pixels which are common for both images when they are stitched with
+            given shift. Close to 1 for correct shifts.
+        """
+        overlap, horizontal_shift = shift
+        width = top_overlap.shape[1] - abs(horizontal_shift)
+        top_pixels = top_overlap[-overlap:, max(0, horizontal_shift):max(0, horizontal_shift) + width]
+        bottom_pixels = bottom_overlap[:overlap, max(0, -horizontal_shift):max(0, -horizontal_shift) + width]
+
+        top_pixels = top_pixels - numpy.mean(top_pixels, dtype=numpy.float64)
+        bottom_pixels = bottom_pixels - numpy.mean(bottom_pixels, dtype=numpy.float64)
+        norm = numpy.sqrt(numpy.sum(top_pixels ** 2) * numpy.sum(bottom_pixels ** 2))
+        if norm == 0:
+            return 0.
+        return float(numpy.sum(top_pixels * bottom_pixels) / norm)
+
+    def __padded_spectrum(self, image, padded_shape):
+        buffer = numpy.zeros(padded_shape, dtype=self.precision)
+        height, width = image.shape
+        numpy.subtract(image, numpy.mean(image, dtype=numpy.float64), out=buffer[:height, :width], casting='unsafe')
+        return fft_backend.rfft2(buffer)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy
+
+from alpenglow.matching_algorithms.matching_algorithm import MatchingAlgorithm
+
+
+class ShiftCache:
+    """
+    Shifts of pairs of stripes kept in a JSON file, so they are reused by following runs.
+
+    Shifts are identified by keys (see key) made of physical stripes of the pair, versions and channels used for
+    matching and fingerprints of sampled images. Stripes from following loops (see ImageSource.loop_image) which are
+    derived from the same physical images in the same way share shifts, and shifts are not reused when stored images
+    change. File is written to temporary file and renamed after each stored shift, so it is never partially written.
+    """
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            File in which shifts are kept. Created with the first stored shift if it does not exist.
+        """
+        self.path = path
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = Lock()
+        self._shifts = {}
+        try:
+            with open(path) as f:
+                self._shifts = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    @classmethod
+    def key(cls, image_source, top_stripe_id, bottom_stripe_id, versions, channels=None, algorithm=None,
+            fingerprints=None):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source of both stripes.
+        top_stripe_id: int
+        bottom_stripe_id: int
+        versions: [int]
+            Versions used for matching, whose fingerprints (see ImageSource.fingerprint) are part of the key.
+        channels: [int]
+            Channels used for matching, None if images are matched as a whole.
+        algorithm: str
+            Name of matching algorithm and its options affecting found shifts.
+        fingerprints: dict
+            Fingerprints already known, see fingerprints. Missing ones are fetched and added to it.
+
+        Returns
+        -------
+        str
+            Key of the shift between given stripes.
+        """
+        fingerprints = cls.fingerprints(image_source, (top_stripe_id, bottom_stripe_id), versions, fingerprints)
+
+        stripes = []
+        fingerprint = hashlib.sha1()
+        for stripe_id in (top_stripe_id, bottom_stripe_id):
+            physical_stripe_id, _, mirror, prefix = image_source.physical_image_id(stripe_id, 0)
+            stripes.append([physical_stripe_id, mirror, prefix])
+            for version_id in versions:
+                fingerprint.update(fingerprints[(physical_stripe_id, version_id)].encode('utf-8'))
+
+        return json.dumps([algorithm, stripes, list(versions), None if channels is None else list(channels),
+                           fingerprint.hexdigest()])
+
+    @classmethod
+    def fingerprints(cls, image_source, stripe_ids, versions, known=None, max_workers=8):
+        """
+        Fetches fingerprints (see ImageSource.fingerprint) of images of physical stripes of given stripes concurrently,
+        as fetching each of them may take a request to the storage.
+
+        Parameters
+        ----------
+        image_source: ImageSource
+        stripe_ids: [int]
+        versions: [int]
+        known: dict
+            Fingerprints fetched before, which are not fetched again. Updated with fetched fingerprints.
+        max_workers: int
+            Maximal number of fingerprints fetched at once.
+
+        Returns
+        -------
+        dict
+            (physical_stripe_id, version_id) -> fingerprint, for images of given stripes and all known ones.
+        """
+        known = known if known is not None else {}
+        missing = []
+        for stripe_id in stripe_ids:
+            physical_stripe_id = image_source.physical_image_id(stripe_id, 0)[0]
+            for version_id in versions:
+                if (physical_stripe_id, version_id) not in known and (physical_stripe_id, version_id) not in missing:
+                    missing.append((physical_stripe_id, version_id))
+
+        if len(missing) == 1:
+            known[missing[0]] = image_source.fingerprint(*missing[0])
+        elif len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                fetched = list(executor.map(lambda image_id: image_source.fingerprint(*image_id), missing))
+            known.update(zip(missing, fetched))
+        return known
+
+    def get(self, key):
+        """
+        Returns
+        -------
+        numpy.array
+            Number of common rows and horizontal shift, as returned by MatchingAlgorithm.match, or None if shift of
+            the key is not known.
+        """
+        self._lock.acquire()
+        shift = self._shifts.get(key)
+        if shift is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._lock.release()
+        return None if shift is None else numpy.array(shift, dtype=int)
+
+    def put(self, key, shift):
+        self._lock.acquire()
+        try:
+            self._shifts[key] = [int(shift[0]), int(shift[1])]
+            self.__write()
+        finally:
+            self._lock.release()
+
+    def __write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as f:
+                json.dump(self._shifts, f)
+            os.rename(temporary_path, self.path)
+        except (IOError, OSError):
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+class CachingMatchingAlgorithm(MatchingAlgorithm):
+    """
+    Matching algorithm returning shifts kept in ShiftCache, and matching with underlying algorithm only pairs of stripes
+    with unknown shifts, before any of their images is fetched.
+
+    Only stripes fetched from image sources (LazyStripe) are identified in the cache, other stripes are always matched.
+    """
+    def __init__(self, matching_algorithm, shift_cache, versions, channels=None, name=None):
+        """
+        Parameters
+        ----------
+        matching_algorithm: MatchingAlgorithm
+            Algorithm matching stripes with unknown shifts.
+        shift_cache: ShiftCache
+        versions: [int]
+            Versions used by matching_algorithm.
+        channels: [int]
+            Channels used by matching_algorithm.
+        name: str
+            Name identifying matching_algorithm and its options in the cache, its class name if not given.
+        """
+        self.matching_algorithm = matching_algorithm
+        self.shift_cache = shift_cache
+        self.versions = versions
+        self.channels = channels
+        self.name = name if name is not None else matching_algorithm.__class__.__name__
+
+    def matches_independently(self):
+        return self.matching_algorithm.matches_independently()
+
+    def match(self, top_stripe, bottom_stripe):
+        key = None
+        image_source = getattr(top_stripe, 'image_source', None)
+        if image_source is not None and image_source is getattr(bottom_stripe, 'image_source', None):
+            key = ShiftCache.key(image_source, top_stripe.stripe_id, bottom_stripe.stripe_id, self.versions,
+                                 self.channels, self.name)
+            shift = self.shift_cache.get(key)
+            if shift is not None:
+                return shift
+
+        shift = self.matching_algorithm.match(top_stripe, bottom_stripe)
+        if key is not None:
+            self.shift_cache.put(key, shift)
+        return shift
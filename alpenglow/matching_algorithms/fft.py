@@ -1,15 +1,40 @@
 import concurrent
+import threading
+from collections import OrderedDict
 
 import numpy
 
+try:
+    import scipy.fft as fft_backend  # keeps single precision, unlike numpy.fft
+    batch_fft_options = dict(workers=-1)  # stacked transforms are split between all cores
+except ImportError:
+    fft_backend = numpy.fft
+    batch_fft_options = dict()
+
 from alpenglow.matching_algorithms.matching_algorithm import MatchingAlgorithm
 
 
 class FftMatchingAlgorithm(MatchingAlgorithm):
     """
     Implementation of stripe matching algorithm derived from file stitching2.py
+
+    In fast mode correlation is computed with real-input FFTs in given precision. Mean of each image is subtracted and
+    images are zero-padded to lengths for which FFT is fast. Padded buffers of max_workspaces recently matched shapes
+    are kept per thread and reused for following pairs of the same shape.
+
+    In batched mode overlaps of all versions and channels are stacked and transformed together, cross-power spectra
+    are summed and only one inverse FFT is computed for a pair of stripes. Stacks are allocated for each pair of
+    stripes, not kept, as they hold overlaps of all versions and channels.
+
+    Pairs of overlaps are accumulated in order of versions and channels, whatever the order of their fetching. With
+    min_peak_ratio set (and without batching) sampling is adaptive: after each accumulated pair of overlaps the shift
+    is estimated, and once the estimate did not change for stable_samples pairs and its peak to sidelobe ratio
+    reached min_peak_ratio, the shift is returned and remaining fetches are cancelled. Number of pairs used for the
+    last finished match is kept in sample_count, which is only reported, so pairs of stripes can be matched
+    concurrently.
     """
-    def __init__(self, versions, channels):
+    def __init__(self, versions, channels, fast=False, precision=numpy.float32, pad_to_fast_length=True,
+                 batched=False, min_peak_ratio=None, min_samples=3, stable_samples=2, max_workspaces=2):
         """
         Parameters
         ----------
@@ -17,6 +42,23 @@ class FftMatchingAlgorithm(MatchingAlgorithm):
             List of versions to test for shift
         channels: [int]
             List of channels to test for shift
+        fast: bool
+            Whether to use fast mode.
+        precision: numpy.dtype
+            Working precision of fast mode, numpy.float32 or numpy.float64.
+        pad_to_fast_length: bool
+            Whether fast mode pads images to lengths with small prime factors.
+        batched: bool
+            Whether to transform all versions and channels in one stacked FFT call.
+        min_peak_ratio: float
+            Peak to sidelobe ratio (see peak_to_sidelobe_ratio) above which the shift is confident. Every version and
+            channel is used if None.
+        min_samples: int
+            Minimal number of pairs of overlaps (version, channel) used in adaptive sampling.
+        stable_samples: int
+            Number of consecutive equal estimates required in adaptive sampling.
+        max_workspaces: int
+            Number of shapes of overlaps for which padded buffers of fast mode are kept in each thread.
         """
         if not versions:
             raise ValueError("Shift must be detected in at least one version of images")
@@ -26,6 +68,17 @@ class FftMatchingAlgorithm(MatchingAlgorithm):
             raise ValueError("Shift must be detected in at least one channel")
         self._channels = channels
 
+        self.fast = fast
+        self.precision = numpy.dtype(precision)
+        self.pad_to_fast_length = pad_to_fast_length
+        self.batched = batched
+        self.min_peak_ratio = min_peak_ratio
+        self.min_samples = min_samples
+        self.stable_samples = stable_samples
+        self.max_workspaces = max_workspaces
+        self.sample_count = None
+        self._workspaces = threading.local()
+
     def match(self, top_stripe, bottom_stripe):
         top_shape = top_stripe.get_channel_shape()
         bottom_shape = bottom_stripe.get_channel_shape()
@@ -37,27 +90,162 @@ class FftMatchingAlgorithm(MatchingAlgorithm):
         futures = {}
         for version_id in self._versions:
             for channel_id in self._channels:
-                futures[top_stripe.get_channel_image_future(version_id, channel_id)] = ('top', version_id, channel_id)
-                futures[bottom_stripe.get_channel_image_future(version_id, channel_id)] = ('bottom', version_id, channel_id)
+                futures[top_stripe.get_channel_region_future(version_id, channel_id, (top_shape[0] - height, top_shape[0]), (0, width))] = ('top', version_id, channel_id)
+                futures[bottom_stripe.get_channel_region_future(version_id, channel_id, (0, height), (0, width))] = ('bottom', version_id, channel_id)
+
+        if self.batched:
+            return FftMatchingAlgorithm.extract_shift(self.__batched_correlation(futures, shape), height)
 
-        correlation = numpy.zeros(shape, dtype=numpy.complex128)
+        padded_shape = None
+        if self.fast:
+            padded_shape = self.padded_shape(shape)
+            correlation = numpy.zeros((padded_shape[0], padded_shape[1] // 2 + 1), dtype=numpy.result_type(self.precision, numpy.complex64))
+            pair_correlation = self.cross_power_spectrum
+        else:
+            correlation = numpy.zeros(shape, dtype=numpy.complex128)
+            pair_correlation = FftMatchingAlgorithm.cross_correlation
 
+        # pairs are accumulated in order of versions and channels, not in order of completion, so that results (also
+        # of adaptive sampling) do not depend on timing of fetches
+        pair_keys = [(version_id, channel_id) for version_id in self._versions for channel_id in self._channels]
         completed = {}
+        estimates = []
+        sample_count = 0
+        confident = False
+        for future in concurrent.futures.as_completed(futures):
+            position, version_id, channel_id = futures[future]
+            completed.setdefault((version_id, channel_id), {})[position] = future.result()
+
+            while not confident and sample_count < len(pair_keys) and \
+                    len(completed.get(pair_keys[sample_count], ())) == 2:
+                pair = completed.pop(pair_keys[sample_count])
+                correlation += pair_correlation(pair['top'], pair['bottom'])
+                sample_count += 1
+                confident = self.min_peak_ratio is not None and \
+                    self.__is_confident(correlation, height, padded_shape, estimates, sample_count)
+
+            if confident:
+                for remaining_future in futures:
+                    remaining_future.cancel()
+                break
+        self.sample_count = sample_count
+
+        if self.fast:
+            correlation = fft_backend.irfft2(correlation, s=padded_shape)
+
+        return FftMatchingAlgorithm.extract_shift(correlation, height)
+
+    def __is_confident(self, correlation, height, padded_shape, estimates, sample_count):
+        if sample_count < self.min_samples:
+            return False
+        if self.fast:
+            correlation = fft_backend.irfft2(correlation, s=padded_shape)
+
+        estimates.append(tuple(FftMatchingAlgorithm.extract_shift(correlation, height)))
+        if len(estimates) < self.stable_samples or len(set(estimates[-self.stable_samples:])) > 1:
+            return False
+        return FftMatchingAlgorithm.peak_to_sidelobe_ratio(correlation) >= self.min_peak_ratio
+
+    def cross_power_spectrum(self, top_image, bottom_image):
+        """
+        Parameters
+        ----------
+        top_image: numpy.array
+            Bottom part of the top image.
+        bottom_image: numpy.array
+            Top part of the bottom image, of the same shape as top_image.
+
+        Returns
+        -------
+        numpy.array
+            Half spectrum (as returned by rfft2) of cross correlation of mean subtracted images, zero-padded to
+            padded_shape.
+        """
+        top_buffer, bottom_buffer = self.__workspace(top_image.shape)
+        self.__fill(top_buffer, top_image)
+        self.__fill(bottom_buffer, bottom_image)
+
+        spectrum = fft_backend.rfft2(top_buffer)
+        spectrum *= fft_backend.rfft2(bottom_buffer).conj()
+        return spectrum
+
+    def padded_shape(self, shape):
+        """
+        Returns
+        -------
+        tuple(int, int)
+            Shape to which images of given shape are padded in fast mode.
+        """
+        if not self.pad_to_fast_length:
+            return tuple(shape)
+        return tuple(FftMatchingAlgorithm.fast_length(axis_size) for axis_size in shape)
+
+    def __batched_correlation(self, futures, shape):
+        pair_keys = sorted(set((version_id, channel_id) for _, version_id, channel_id in futures.values()))
+        indices = dict((pair_key, index) for index, pair_key in enumerate(pair_keys))
+        top_stack, bottom_stack = self.__buffers((len(pair_keys), ) + shape)
+
         for future in concurrent.futures.as_completed(futures):
-            position = futures[future]
-            pair_key = (position[1], position[2])
-            try:
-                if position[0] == 'top':
-                    top_image, bottom_image = future.result(), completed[pair_key]
-                else:
-                    top_image, bottom_image = completed[pair_key], future.result()
-                del completed[pair_key]
-                correlation += FftMatchingAlgorithm.cross_correlation(top_image[-height:, :width], bottom_image[:height, :width])
-            except KeyError:
-                completed[pair_key] = future.result()
+            position, version_id, channel_id = futures[future]
+            stack = top_stack if position == 'top' else bottom_stack
+            self.__fill(stack[indices[(version_id, channel_id)]], future.result())
+
+        if self.fast:
+            bottom_spectrum = fft_backend.rfft2(bottom_stack, axes=(-2, -1), **batch_fft_options)
+            numpy.conjugate(bottom_spectrum, out=bottom_spectrum)
+            spectrum = fft_backend.rfft2(top_stack, axes=(-2, -1), **batch_fft_options)
+            spectrum *= bottom_spectrum
+            return fft_backend.irfft2(spectrum.sum(axis=0), s=top_stack.shape[-2:])
+
+        bottom_spectrum = numpy.fft.fft2(bottom_stack, axes=(-2, -1))
+        numpy.conjugate(bottom_spectrum, out=bottom_spectrum)
+        spectrum = numpy.fft.fft2(top_stack, axes=(-2, -1))
+        spectrum *= bottom_spectrum
+        return numpy.fft.ifft2(spectrum.sum(axis=0))
+
+    def __fill(self, buffer, image):
+        height, width = image.shape
+        if self.fast:
+            numpy.subtract(image, numpy.mean(image, dtype=numpy.float64), out=buffer[:height, :width], casting='unsafe')
+        else:
+            buffer[:height, :width] = image
 
+    def __workspace(self, shape):
+        workspaces = self._workspaces.__dict__.setdefault('buffers', OrderedDict())
+        if shape in workspaces:
+            workspaces[shape] = workspaces.pop(shape)
+        else:
+            workspaces[shape] = self.__buffers(shape)
+            while len(workspaces) > self.max_workspaces:
+                workspaces.popitem(last=False)
+        return workspaces[shape]
+
+    def __buffers(self, shape):
+        if self.fast:
+            padded_shape = shape[:-2] + self.padded_shape(shape[-2:])
+            dtype = self.precision
+        else:
+            padded_shape, dtype = shape, numpy.float64
+        return numpy.zeros(padded_shape, dtype=dtype), numpy.zeros(padded_shape, dtype=dtype)
+
+    @classmethod
+    def extract_shift(cls, correlation, height):
+        """
+        Parameters
+        ----------
+        correlation: numpy.array
+            Cross correlation of bottom part of the top image and top part of the bottom image.
+        height: int
+            Height of correlated parts of images.
+
+        Returns
+        -------
+        numpy.array
+            Number of common rows and horizontal shift, as returned by match.
+        """
+        shape = correlation.shape
         midpoints = numpy.array([numpy.fix(axis_size / 2) for axis_size in shape])
-        maxima = numpy.unravel_index(numpy.argmax(numpy.abs(correlation)), correlation.shape)
+        maxima = numpy.unravel_index(numpy.argmax(numpy.abs(correlation)), shape)
         shifts = numpy.array(maxima, dtype=numpy.int)
 
         shifts[shifts > midpoints] -= numpy.array(shape)[shifts > midpoints]
@@ -65,6 +253,73 @@ class FftMatchingAlgorithm(MatchingAlgorithm):
 
         return shifts
 
+    @classmethod
+    def peak_to_sidelobe_ratio(cls, correlation, exclusion=5):
+        """
+        Parameters
+        ----------
+        correlation: numpy.array
+            Cross correlation (as returned by cross_correlation or sum of such correlations).
+        exclusion: int
+            Half size of the neighbourhood of the peak excluded from the sidelobe.
+
+        Returns
+        -------
+        float
+            Number of standard deviations of the sidelobe (correlation magnitude outside of the peak neighbourhood) by
+            which the peak of correlation magnitude exceeds mean of the sidelobe. Higher values mean more reliable
+            shifts.
+        """
+        magnitude = numpy.abs(correlation)
+        peak = numpy.unravel_index(numpy.argmax(magnitude), magnitude.shape)
+
+        sidelobe = numpy.ones(magnitude.shape, dtype=numpy.bool_)
+        rows = numpy.arange(peak[0] - exclusion, peak[0] + exclusion + 1) % magnitude.shape[0]
+        columns = numpy.arange(peak[1] - exclusion, peak[1] + exclusion + 1) % magnitude.shape[1]
+        sidelobe[numpy.ix_(rows, columns)] = False
+        values = magnitude[sidelobe]
+        if values.size == 0 or numpy.std(values) == 0:
+            return numpy.inf
+        return float((magnitude[peak] - numpy.mean(values)) / numpy.std(values))
+
+    @classmethod
+    def fast_length(cls, length):
+        """
+        Returns
+        -------
+        int
+            Smallest number not lower than length, which has no prime factors other than 2, 3 and 5.
+        """
+        fast_length = length
+        while True:
+            remainder = fast_length
+            for factor in (2, 3, 5):
+                while remainder % factor == 0:
+                    remainder //= factor
+            if remainder == 1:
+                return fast_length
+            fast_length += 1
+
+    @classmethod
+    def cross_power_half_spectrum(cls, top_image, bottom_image):
+        """
+        Parameters
+        ----------
+        top_image: numpy.array
+            Bottom part of the top image.
+        bottom_image: numpy.array
+            Top part of the bottom image, of the same shape as top_image.
+
+        Returns
+        -------
+        numpy.array
+            Cross-power spectrum of images in single precision, without redundant half (as returned by rfft2). Sum of
+            such spectra transformed with irfft2(spectrum, s=top_image.shape) is the sum of cross_correlation results.
+        """
+        spectrum = fft_backend.rfft2(numpy.asarray(top_image, dtype=numpy.float32))
+        spectrum *= fft_backend.rfft2(numpy.asarray(bottom_image, dtype=numpy.float32)).conj()
+        return spectrum.astype(numpy.complex64, copy=False)
+
     @classmethod
     def cross_correlation(cls, top_image, bottom_image):
         src_image = numpy.array(top_image, dtype=numpy.complex128, copy=False)
@@ -28,3 +28,15 @@ class MatchingAlgorithm:
         """
         pass
 
+    def matches_independently(self):
+        """
+        Tells whether shift of a pair of stripes does not depend on pairs matched before, so that pairs can be matched
+        concurrently and in any order (see PatchworkBuilder.match_all).
+
+        Returns
+        -------
+        bool
+            True by default, False for algorithms learning from previously matched pairs.
+        """
+        return True
+
@@ -42,13 +42,21 @@ class OldMatchingAlgorithm(MatchingAlgorithm):
         return shift
 
     def measure_shifts(self, top_stripe, bottom_stripe):
-        shifts = []
+        top_shape = top_stripe.get_channel_shape()
+        bottom_shape = bottom_stripe.get_channel_shape()
+        width = min(top_shape[1], bottom_shape[1])
+        height = min(top_shape[0], bottom_shape[0]) // 2
 
+        overlap_futures = []
         for version_id in self._versions:
             for channel_id in self._channels:
-                top_channel = top_stripe.get_channel_image(version_id, channel_id)
-                bottom_channel = bottom_stripe.get_channel_image(version_id, channel_id)
-                shifts.append(self.__class__.find_shift(top_channel, bottom_channel))
+                overlap_futures.append((
+                    top_stripe.get_channel_region_future(version_id, channel_id, (top_shape[0] - height, top_shape[0]), (0, width)),
+                    bottom_stripe.get_channel_region_future(version_id, channel_id, (0, height), (0, width))
+                ))
+
+        shifts = [self.__class__.find_overlap_shift(top_future.result(), bottom_future.result())
+                  for top_future, bottom_future in overlap_futures]
 
         return numpy.array(shifts, numpy.float)
 
@@ -90,5 +98,23 @@ class OldMatchingAlgorithm(MatchingAlgorithm):
         """
         width = min(top_image.shape[1], bottom_image.shape[1])
         height = min(top_image.shape[0], bottom_image.shape[0]) // 2
-        shift, _, _ = register_translation(top_image[-height:, :width], bottom_image[:height, :width], upsample_factor=8)
-        return [height - shift[0], shift[1]]
+        return cls.find_overlap_shift(top_image[-height:, :width], bottom_image[:height, :width])
+
+    @classmethod
+    def find_overlap_shift(cls, top_overlap, bottom_overlap):
+        """
+        Parameters
+        ----------
+        top_overlap: numpy.array
+            Bottom part of the top image.
+        bottom_overlap: numpy.array
+            Top part of the bottom image, of the same shape as top_overlap.
+
+        Returns
+        -------
+        [int, int]
+            Height of overlay of images from which overlaps were cut and horizontal shift which needs to be applied to
+            bottom image before matching, as in find_shift.
+        """
+        shift, _, _ = register_translation(top_overlap, bottom_overlap, upsample_factor=8)
+        return [top_overlap.shape[0] - shift[0], shift[1]]
@@ -0,0 +1,124 @@
+import concurrent
+
+import numpy
+
+from alpenglow.matching_algorithms.matching_algorithm import MatchingAlgorithm
+from alpenglow.matching_algorithms.pyramid import PyramidMatchingAlgorithm
+
+
+class Projection:
+    """
+    Running maximum or mean intensity projection of images of the same shape, updated in place as images arrive.
+    """
+    def __init__(self, kind='max'):
+        """
+        Parameters
+        ----------
+        kind: str
+            'max' or 'mean'.
+        """
+        if kind not in ('max', 'mean'):
+            raise ValueError("Unknown projection {}".format(kind))
+        self.kind = kind
+        self.count = 0
+        self.__image = None
+
+    def add(self, image):
+        if self.__image is None:
+            self.__image = numpy.array(image, dtype=numpy.float32)
+        elif self.kind == 'max':
+            numpy.maximum(self.__image, image, out=self.__image, casting='unsafe')
+        else:
+            numpy.add(self.__image, image, out=self.__image, casting='unsafe')
+        self.count += 1
+
+    def get(self):
+        """
+        Returns
+        -------
+        numpy.array
+            Projection of added images in single precision, None if no image was added.
+        """
+        if self.kind == 'mean' and self.__image is not None:
+            return self.__image / self.count
+        return self.__image
+
+
+class ProjectionMatchingAlgorithm(MatchingAlgorithm):
+    """
+    Stripe matching algorithm correlating intensity projections of overlaps instead of each version and channel.
+
+    Overlaps (half of the stripe, as in FftMatchingAlgorithm) of all versions and channels of each stripe are
+    accumulated into one running projection as they are fetched, so only one array is kept per stripe edge and one
+    pair of FFTs is computed per pair of stripes. Maximum projection sharpens the peak for dim and sparse images, mean
+    projection averages out noise.
+
+    Projections are correlated as the coarsest level of PyramidMatchingAlgorithm: zero-padded, with correlation
+    normalized by the number of common rows. Detected overlap is at most half of the height of the stripes.
+    """
+    def __init__(self, versions, channels, projection='max', min_overlap=16):
+        """
+        Parameters
+        ----------
+        versions: [int]
+            List of versions to test for shift
+        channels: [int]
+            List of channels to test for shift
+        projection: str
+            Kind of projection of versions and channels, 'max' or 'mean'.
+        min_overlap: int
+            Minimal number of common rows.
+        """
+        if not versions:
+            raise ValueError("Shift must be detected in at least one version of images")
+        self._versions = versions
+
+        if not channels:
+            raise ValueError("Shift must be detected in at least one channel")
+        self._channels = channels
+
+        Projection(projection)  # validates kind of projection
+        self.projection = projection
+        self.min_overlap = min_overlap
+
+    def match(self, top_stripe, bottom_stripe):
+        top_shape = top_stripe.get_channel_shape()
+        bottom_shape = bottom_stripe.get_channel_shape()
+
+        width = min(top_shape[1], bottom_shape[1])
+        height = min(top_shape[0], bottom_shape[0]) // 2
+
+        futures = {}
+        for version_id in self._versions:
+            for channel_id in self._channels:
+                futures[top_stripe.get_channel_region_future(version_id, channel_id, (top_shape[0] - height, top_shape[0]), (0, width))] = 'top'
+                futures[bottom_stripe.get_channel_region_future(version_id, channel_id, (0, height), (0, width))] = 'bottom'
+
+        projections = dict(top=Projection(self.projection), bottom=Projection(self.projection))
+        for future in concurrent.futures.as_completed(futures):
+            projections[futures[future]].add(future.result())
+
+        return self.__class__.projection_shift(projections['top'].get(), projections['bottom'].get(), self.min_overlap)
+
+    @classmethod
+    def projection_shift(cls, top_projection, bottom_projection, min_overlap=16):
+        """
+        Parameters
+        ----------
+        top_projection: numpy.array
+            Projection of bottom parts of the top images.
+        bottom_projection: numpy.array
+            Projection of top parts of the bottom images, of the same shape as top_projection.
+        min_overlap: int
+            Minimal number of common rows.
+
+        Returns
+        -------
+        numpy.array
+            Number of common rows and horizontal shift, as returned by match.
+        """
+        height = top_projection.shape[0]
+        lag = PyramidMatchingAlgorithm.coarse_lag([(top_projection - numpy.mean(top_projection),
+                                                    bottom_projection - numpy.mean(bottom_projection))],
+                                                  min(min_overlap, height))
+        return numpy.array([height - lag[0], lag[1]], dtype=int)
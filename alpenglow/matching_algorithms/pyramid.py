@@ -0,0 +1,166 @@
+import concurrent
+
+import numpy
+
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm, fft_backend
+from alpenglow.matching_algorithms.matching_algorithm import MatchingAlgorithm
+
+
+class PyramidMatchingAlgorithm(MatchingAlgorithm):
+    """
+    Stripe matching algorithm estimating the shift on downsampled images and refining it at higher resolutions.
+
+    Overlaps (half of the stripe, as in FftMatchingAlgorithm) of all versions and channels are averaged down by a
+    factor of 2 at each level of the pyramid. At the coarsest level full correlation is computed with FFT, at each finer
+    level, up to the full resolution, only few shifts around the doubled previous estimate are evaluated.
+    Correlation of each shift is normalized by the number of common rows, so shifts with larger overlaps are not
+    preferred, while shifts with smaller horizontal offsets still are.
+
+    Detected overlap is at most half of the height of the stripes.
+    """
+    def __init__(self, versions, channels, levels=None, min_size=32, radius=2, min_overlap=16):
+        """
+        Parameters
+        ----------
+        versions: [int]
+            List of versions to test for shift
+        channels: [int]
+            List of channels to test for shift
+        levels: int
+            Number of downsampled levels of the pyramid (0 for full resolution correlation only). If None, images are
+            downsampled while both dimensions of the coarsest level are at least min_size.
+        min_size: int
+            Minimal height and width of overlaps at the coarsest level, used when levels is None.
+        radius: int
+            Maximal distance (in pixels of the level) of shift refined at the first level below the coarsest one from
+            the doubled coarse estimate. At finer levels shifts within 1 pixel of doubled estimates are evaluated.
+        min_overlap: int
+            Minimal number of common rows. Correlation normalized by the number of common rows is noisy for few rows.
+        """
+        if not versions:
+            raise ValueError("Shift must be detected in at least one version of images")
+        self._versions = versions
+
+        if not channels:
+            raise ValueError("Shift must be detected in at least one channel")
+        self._channels = channels
+
+        self.levels = levels
+        self.min_size = min_size
+        self.radius = radius
+        self.min_overlap = min_overlap
+
+    def match(self, top_stripe, bottom_stripe):
+        top_shape = top_stripe.get_channel_shape()
+        bottom_shape = bottom_stripe.get_channel_shape()
+
+        width = min(top_shape[1], bottom_shape[1])
+        height = min(top_shape[0], bottom_shape[0]) // 2
+
+        futures = {}
+        for version_id in self._versions:
+            for channel_id in self._channels:
+                futures[top_stripe.get_channel_region_future(version_id, channel_id, (top_shape[0] - height, top_shape[0]), (0, width))] = ('top', version_id, channel_id)
+                futures[bottom_stripe.get_channel_region_future(version_id, channel_id, (0, height), (0, width))] = ('bottom', version_id, channel_id)
+
+        levels = self.levels
+        if levels is None:
+            levels = 0
+            while min(height, width) >> (levels + 1) >= self.min_size:
+                levels += 1
+
+        pyramids = {}
+        for future in concurrent.futures.as_completed(futures):
+            position, version_id, channel_id = futures[future]
+            pyramids.setdefault((version_id, channel_id), {})[position] = self.__class__.pyramid(future.result(), levels)
+        pairs = [(pyramid['top'], pyramid['bottom']) for pyramid in pyramids.values()]
+
+        lag = self.__class__.coarse_lag([(top[-1], bottom[-1]) for top, bottom in pairs], max(1, self.min_overlap >> levels))
+        for level in reversed(range(levels)):
+            radius = self.radius if level == levels - 1 else 1  # refined estimates are off by at most 1 when doubled
+            lag = self.__class__.refine_lag([(top[level], bottom[level]) for top, bottom in pairs],
+                                            (2 * lag[0], 2 * lag[1]), radius)
+
+        return numpy.array([height - lag[0], lag[1]], dtype=int)
+
+    @classmethod
+    def pyramid(cls, image, levels):
+        """
+        Returns
+        -------
+        [numpy.array]
+            Mean subtracted image followed by levels images, each downsampled by a factor of 2 with averaging of 2x2
+            blocks of the previous one.
+        """
+        image = numpy.asarray(image, dtype=numpy.float32)
+        pyramid = [image - numpy.mean(image)]
+        for _ in range(levels):
+            image = pyramid[-1]
+            height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+            image = image[:height, :width]
+            pyramid.append((image[0::2, 0::2] + image[1::2, 0::2] + image[0::2, 1::2] + image[1::2, 1::2]) / 4)
+        return pyramid
+
+    @classmethod
+    def coarse_lag(cls, pairs, min_overlap):
+        """
+        Parameters
+        ----------
+        pairs: [(numpy.array, numpy.array)]
+            Mean subtracted bottom part of the top image and top part of the bottom image, of the same shape.
+        min_overlap: int
+            Minimal number of common rows.
+
+        Returns
+        -------
+        tuple(int, int)
+            Number of rows by which top of the bottom image is shifted down from top of the top image part and
+            horizontal shift, with the highest correlation normalized by number of common rows. Common part has at
+            least min_overlap rows and half of the width of the images.
+        """
+        height, width = pairs[0][0].shape
+        padded_shape = (FftMatchingAlgorithm.fast_length(2 * height), FftMatchingAlgorithm.fast_length(2 * width))
+
+        spectrum = 0
+        for top_image, bottom_image in pairs:
+            spectrum = spectrum + fft_backend.rfft2(top_image, s=padded_shape) * fft_backend.rfft2(bottom_image, s=padded_shape).conj()
+        correlation = fft_backend.irfft2(spectrum, s=padded_shape)
+
+        rows = numpy.arange(0, max(1, height - min_overlap + 1))
+        columns = numpy.arange(-(width // 2), width // 2 + 1)
+        window = correlation[numpy.ix_(rows, columns % padded_shape[1])]
+        window = window / (height - rows)[:, numpy.newaxis]
+        row_index, column_index = numpy.unravel_index(numpy.argmax(window), window.shape)
+
+        return rows[row_index], columns[column_index]
+
+    @classmethod
+    def refine_lag(cls, pairs, estimate, radius):
+        """
+        Parameters
+        ----------
+        pairs: [(numpy.array, numpy.array)]
+            Mean subtracted bottom part of the top image and top part of the bottom image, of the same shape.
+        estimate: tuple(int, int)
+            Lag (as returned by coarse_lag) around which the lag is searched.
+        radius: int
+            Maximal distance of returned lag from estimate.
+
+        Returns
+        -------
+        tuple(int, int)
+            Lag within radius from estimate with the highest correlation normalized by number of common rows.
+        """
+        height, width = pairs[0][0].shape
+        best_lag, best_score = None, None
+        for row_lag in range(max(0, estimate[0] - radius), min(height - 1, estimate[0] + radius) + 1):
+            for column_lag in range(max(1 - width, estimate[1] - radius), min(width - 1, estimate[1] + radius) + 1):
+                column_from, column_to = max(0, column_lag), width + min(0, column_lag)
+                score = 0.
+                for top_image, bottom_image in pairs:
+                    top_pixels = top_image[row_lag:, column_from:column_to]
+                    bottom_pixels = bottom_image[:height - row_lag, column_from - column_lag:column_to - column_lag]
+                    score += numpy.einsum('ij,ij->', top_pixels, bottom_pixels) / top_pixels.shape[0]  # no copies of views
+                if best_score is None or score > best_score:
+                    best_lag, best_score = (row_lag, column_lag), score
+        return best_lag
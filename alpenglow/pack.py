@@ -0,0 +1,69 @@
+"""
+Repacks TIFF files of each stripe into a single container readable by PackedImageSource.
+
+Example:
+    python -m alpenglow.pack 'data/{stripe_id:06d}/{stripe_id:06d}_{version_id:05d}.tif' 'packed/{stripe_id:06d}.pack' \
+        --stripes 0-2 --versions 1-1800 --compression zlib
+"""
+import argparse
+import os
+
+import skimage.external.tifffile as tiff
+
+from alpenglow.image_sources.packed import PackedStripeWriter
+
+
+def parse_ids(values):
+    """
+    Parameters
+    ----------
+    values: [str]
+        Ids or inclusive ranges of ids, e.g. ['0', '3-5'].
+
+    Returns
+    -------
+    [int]
+        All listed ids, e.g. [0, 3, 4, 5].
+    """
+    ids = []
+    for value in values:
+        if '-' in value:
+            first, last = value.split('-')
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(value))
+    return ids
+
+
+def pack_stripe(path_format, output_path, stripe_id, version_ids, compression=None):
+    """
+    Writes all versions of given stripe into a container at output_path.
+    """
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with PackedStripeWriter(output_path, compression=compression) as writer:
+        for version_id in version_ids:
+            path = path_format.format(stripe_id=stripe_id, version_id=version_id)
+            writer.append(version_id, tiff.TiffFile(path).asarray())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path_format', help='format of TIFF paths with stripe_id and version_id fields')
+    parser.add_argument('output_format', help='format of container paths with stripe_id field')
+    parser.add_argument('--stripes', nargs='+', required=True, help='stripe ids or ranges, e.g. 0-2')
+    parser.add_argument('--versions', nargs='+', required=True, help='version ids or ranges, e.g. 1-1800')
+    parser.add_argument('--compression', choices=['zlib'], default=None)
+    args = parser.parse_args(argv)
+
+    version_ids = parse_ids(args.versions)
+    for stripe_id in parse_ids(args.stripes):
+        output_path = args.output_format.format(stripe_id=stripe_id)
+        pack_stripe(args.path_format, output_path, stripe_id, version_ids, compression=args.compression)
+        print("packed stripe {} into {}".format(stripe_id, output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import concurrent
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy
 from time import time
@@ -54,6 +55,37 @@ class PatchworkBuilder:
         self.patchwork.append((stripe, shift))
         self.stitching_times.append(time() - stitching_start_time)
 
+    def stitch_all(self, stripes, max_workers=8):
+        """
+        Stitches stripes on the bottom of the represented patchwork, with the same result as stitching them one by one.
+        Pairs of consecutive stripes are matched concurrently (see match_all), so matching_algorithm has to be thread
+        safe, unless it learns from previously matched pairs, and horizontal shifts are accumulated afterwards.
+
+        Parameters
+        ----------
+        stripes: [Stripe]
+        max_workers: int
+            Maximal number of pairs of stripes matched at the same time.
+
+        Raises
+        -------
+        StitchingMismatchException
+            Raised when matching of any stripe fails. Stripes preceding it are stitched.
+        """
+        stripes = list(stripes)
+        if len(stripes) == 0:
+            return
+        if len(self.patchwork) == 0:
+            self.stitch(stripes[0])
+            stripes = stripes[1:]
+
+        last_stripe = self.patchwork[-1][0]
+        for stripe, relative_shift, matching_time in \
+                self.__class__.match_all(self.matching_algorithm, last_stripe, stripes, max_workers):
+            last_shift = self.patchwork[-1][1]
+            self.patchwork.append((stripe, (relative_shift[0], last_shift[1] + relative_shift[1])))
+            self.stitching_times.append(matching_time)
+
     def get(self):
         """
         Returns
@@ -86,9 +118,7 @@ class PatchworkBuilder:
             column_from = max(0, shift[1])
             column_to = min(channel_width, shift[1] + stripe_channel_width)
 
-            future_images = {}
-            for version_id in range(version_count):
-                future_images[stripe.get_image_future(version_id)] = version_id
+            future_images = dict((future, version_id) for version_id, future in stripe.get_image_futures(range(version_count)).items())
 
             for future_image in concurrent.futures.as_completed(future_images):
                 version_id = future_images[future_image]
@@ -122,6 +152,44 @@ class PatchworkBuilder:
         """
         return self.stitching_times, self.result_building_time
 
+    @classmethod
+    def match_all(cls, matching_algorithm, first_stripe, stripes, max_workers=8):
+        """
+        Matches each of stripes with the previous one in a pool of threads. Matching of a pair of stripes does not
+        depend on other pairs, so all pairs are matched concurrently, fetching their images at the same time. Pairs are
+        matched one by one in order of stripes if matching_algorithm learns from previously matched pairs (see
+        MatchingAlgorithm.matches_independently), so that shifts are the same as with stitching stripes one by one.
+
+        Parameters
+        ----------
+        matching_algorithm: MatchingAlgorithm
+        first_stripe: Stripe
+            Stripe preceding the first of stripes.
+        stripes: [Stripe]
+        max_workers: int
+            Maximal number of pairs of stripes matched at the same time.
+
+        Returns
+        -------
+        iterator of (Stripe, tuple(int, int), float)
+            Each of stripes with its shift relative to the previous stripe (as returned by MatchingAlgorithm.match)
+            and time in seconds taken by its matching, in order of stripes.
+        """
+        def timed_match(pair):
+            matching_start_time = time()
+            relative_shift = matching_algorithm.match(*pair)
+            return relative_shift, time() - matching_start_time
+
+        pairs = list(zip([first_stripe] + stripes[:-1], stripes))
+        if len(pairs) == 0:
+            return
+
+        if not matching_algorithm.matches_independently():
+            max_workers = 1
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as executor:
+            for stripe, (relative_shift, matching_time) in zip(stripes, executor.map(timed_match, pairs)):
+                yield stripe, relative_shift, matching_time
+
     @classmethod
     def gradient_merge_arrays(cls, image_one, image_two):
         """
@@ -61,9 +61,7 @@ class LazyStitchedData:
             column_from = max(0, shift[1])
             column_to = min(self.channel_width, shift[1] + stripe_channel_width)
 
-            future_images = {}
-            for version_id in versions_to_fetch:
-                future_images[stripe.get_image_future(version_id)] = version_id
+            future_images = dict((future, version_id) for version_id, future in stripe.get_image_futures(versions_to_fetch).items())
 
             for future_image in concurrent.futures.as_completed(future_images):
                 version_id = future_images[future_image]
@@ -126,6 +124,31 @@ class LazyPatchworkBuilder:
         self.patchwork.append((stripe, shift))
         self.stitching_times.append(time() - stitching_start_time)
 
+    def stitch_all(self, stripes, max_workers=8):
+        """
+        Stitches stripes on the bottom of the represented patchwork, with the same result as stitching them one by one,
+        matching pairs of consecutive stripes concurrently (see PatchworkBuilder.stitch_all).
+
+        Parameters
+        ----------
+        stripes: [Stripe]
+        max_workers: int
+            Maximal number of pairs of stripes matched at the same time.
+        """
+        stripes = list(stripes)
+        if len(stripes) == 0:
+            return
+        if len(self.patchwork) == 0:
+            self.stitch(stripes[0])
+            stripes = stripes[1:]
+
+        last_stripe = self.patchwork[-1][0]
+        for stripe, relative_shift, matching_time in \
+                PatchworkBuilder.match_all(self.matching_algorithm, last_stripe, stripes, max_workers):
+            last_shift = self.patchwork[-1][1]
+            self.patchwork.append((stripe, (relative_shift[0], last_shift[1] + relative_shift[1])))
+            self.stitching_times.append(matching_time)
+
     def get(self):
         if len(self.patchwork) == 0:
             raise IndexError('No stripes were added to the patchwork')
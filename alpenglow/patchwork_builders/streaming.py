@@ -63,19 +63,51 @@ class StreamingPatchworkBuilder:
             self.stitching_times.append(time() - stitching_start_time)
             return empty_data
         else:
-            last_stripe, last_shift = self.patchwork[-1]
+            relative_shift = self.matching_algorithm.match(self.patchwork[-1][0], stripe)
+            return self.__append(stripe, relative_shift, stitching_start_time)
 
-            relative_shift = self.matching_algorithm.match(last_stripe, stripe)
+    def stitch_all(self, stripes, max_workers=8):
+        """
+        Stitches stripes on the bottom of the represented patchwork, with the same result as stitching them one by one,
+        matching pairs of consecutive stripes concurrently (see PatchworkBuilder.stitch_all).
+
+        Parameters
+        ----------
+        stripes: [Stripe]
+        max_workers: int
+            Maximal number of pairs of stripes matched at the same time.
+
+        Returns
+        -------
+        [MemoryMappedStripe]
+            Parts of final image fixed after stitching each of stripes, as returned by stitch.
+        """
+        stripes = list(stripes)
+        if len(stripes) == 0:
+            return []
+        fixed = []
+        if len(self.patchwork) == 0:
+            fixed.append(self.stitch(stripes[0]))
+            stripes = stripes[1:]
 
-            print("relative shift: {} stripe height: {}".format(relative_shift, stripe.get_channel_shape()))
+        last_stripe = self.patchwork[-1][0]
+        for stripe, relative_shift, matching_time in \
+                PatchworkBuilder.match_all(self.matching_algorithm, last_stripe, stripes, max_workers):
+            fixed.append(self.__append(stripe, relative_shift, time() - matching_time))
+        return fixed
 
-            shift = (relative_shift[0], last_shift[1] + relative_shift[1])
-            self.patchwork.append((stripe, shift))
-            if len(self.patchwork) > 2:
-                self.patchwork[-2] = None  # saves memory
+    def __append(self, stripe, relative_shift, stitching_start_time):
+        last_stripe, last_shift = self.patchwork[-1]
 
-            self.stitching_times.append(time() - stitching_start_time)
-            return self.get_newly_fixed(last_stripe, last_shift, stripe, shift)
+        print("relative shift: {} stripe height: {}".format(relative_shift, stripe.get_channel_shape()))
+
+        shift = (relative_shift[0], last_shift[1] + relative_shift[1])
+        self.patchwork.append((stripe, shift))
+        if len(self.patchwork) > 2:
+            self.patchwork[-2] = None  # saves memory
+
+        self.stitching_times.append(time() - stitching_start_time)
+        return self.get_newly_fixed(last_stripe, last_shift, stripe, shift)
 
     def get_newly_fixed(self, previous_stripe, previous_shift, stripe, shift):
         """
@@ -113,9 +145,7 @@ class StreamingPatchworkBuilder:
         # fetch rows from previous stripe (if they are not in cache)
         if self.image_cache is None:
             self.image_cache = {}
-            future_images = {}
-            for version_id in range(version_count):
-                future_images[previous_stripe.get_image_future(version_id)] = version_id
+            future_images = dict((future, version_id) for version_id, future in previous_stripe.get_image_futures(range(version_count)).items())
             for future_image in concurrent.futures.as_completed(future_images):
                 self.image_cache[future_images[future_image]] = future_image.result()
 
@@ -139,9 +169,7 @@ class StreamingPatchworkBuilder:
         if shift[0] == 0:
             self.image_cache = None
         else:
-            future_images = {}
-            for version_id in range(version_count):
-                future_images[stripe.get_image_future(version_id)] = version_id
+            future_images = dict((future, version_id) for version_id, future in stripe.get_image_futures(range(version_count)).items())
 
             for future_image in concurrent.futures.as_completed(future_images):
                 version_id = future_images[future_image]
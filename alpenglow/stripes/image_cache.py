@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+
+from alpenglow.futures import map_future, SharedFuture
+from alpenglow.stripes.stripe import region_slices
+
+
+class MemoryImageCache:
+    """
+    Thread safe in-memory cache of images fetched by stripes, with least recently used images evicted when total size
+    of cached images exceeds max_bytes.
+
+    Images are identified by (image_source, stripe_id, version_id), so single cache can be shared by stripes from many
+    image sources. Requests for an image which is still being fetched share its fetch, but each of them gets its own
+    future (see SharedFuture), so cancelling one of them does not affect the others. The fetch is cancelled when all of
+    them are cancelled.
+
+    Notes
+    -----
+    Cached images are shared by all stripes requesting them and must not be modified in place.
+    """
+    def __init__(self, max_bytes=1024 ** 3):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            Maximal total size of cached images. 0 disables caching of fetched images.
+        """
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.peak_bytes = 0
+
+        self._lock = Lock()
+        self._images = OrderedDict()
+        self._pending = {}
+        self._total_bytes = 0
+
+    def get_image(self, image_source, stripe_id, version_id):
+        """
+        Returns
+        -------
+        ndarray
+            Cached image or image fetched from image_source.
+        """
+        return self.get_image_future(image_source, stripe_id, version_id).result()
+
+    def get_image_future(self, image_source, stripe_id, version_id):
+        """
+        Returns
+        -------
+        Future<ndarray>
+            Future for cached image or for image requested from image_source.
+        """
+        return self.get_image_futures(image_source, [(stripe_id, version_id)])[(stripe_id, version_id)]
+
+    def get_image_futures(self, image_source, image_ids):
+        """
+        Parameters
+        ----------
+        image_source: ImageSource
+            Source from which missing images are fetched.
+        image_ids: iterable of (int, int)
+            (stripe_id, version_id) pairs of requested images.
+
+        Returns
+        -------
+        OrderedDict
+            (stripe_id, version_id) -> Future<ndarray>. Images missing in the cache are requested from image_source
+            with a single get_image_futures call.
+        """
+        futures = OrderedDict()
+        missing = OrderedDict()
+
+        self._lock.acquire()
+        try:
+            for image_id in image_ids:
+                if image_id in futures:
+                    continue
+                key = (image_source,) + tuple(image_id)
+                if key in self._images:
+                    self.hits += 1
+                    image = self._images.pop(key)
+                    self._images[key] = image
+                    futures[image_id] = Future()
+                    futures[image_id].set_result(image)
+                else:
+                    future = self._pending[key].wait() if key in self._pending else None
+                    if future is not None:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                        self._pending[key] = SharedFuture()
+                        future = self._pending[key].wait()
+                        missing[image_id] = (key, self._pending[key])
+                    futures[image_id] = future
+        finally:
+            self._lock.release()
+
+        if len(missing) == 0:
+            return futures
+
+        try:
+            source_futures = image_source.get_image_futures(list(missing.keys()))
+        except Exception as e:
+            for image_id, (key, shared_future) in missing.items():
+                self.__complete(key, shared_future, None)
+                shared_future.set_exception(e)
+            raise
+        for image_id, (key, shared_future) in missing.items():
+            source_futures[image_id].add_done_callback(lambda f, key=key, shared_future=shared_future: self.__complete(key, shared_future, f))
+            shared_future.attach(source_futures[image_id])
+        return futures
+
+    def get_image_region_future(self, image_source, stripe_id, version_id, rows=None, columns=None):
+        """
+        Returns
+        -------
+        Future<ndarray>
+            Future for region of cached (or already requested) image, or for region requested from image_source.
+            Regions are not cached - images of sources which do not read regions (see ImageSource.reads_regions) are
+            fetched whole and cached instead, so all regions (e.g. channels) of the image share single fetch.
+        """
+        key = (image_source, stripe_id, version_id)
+        region = region_slices(rows, columns)
+
+        if not image_source.reads_regions():
+            return map_future(self.get_image_future(image_source, stripe_id, version_id), lambda image: image[region])
+
+        self._lock.acquire()
+        try:
+            if key in self._images:
+                self.hits += 1
+                image = self._images.pop(key)
+                self._images[key] = image
+                future = Future()
+                future.set_result(image[region])
+                return future
+            future = self._pending[key].wait() if key in self._pending else None
+            if future is not None:
+                self.hits += 1
+                return map_future(future, lambda image: image[region])
+            self.misses += 1
+        finally:
+            self._lock.release()
+
+        return image_source.get_image_region_future(stripe_id, version_id, rows, columns)
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Changes memory budget evicting images if needed.
+        """
+        self._lock.acquire()
+        self.max_bytes = max_bytes
+        self.__evict()
+        self._lock.release()
+
+    def clear(self):
+        """
+        Removes all cached images.
+        """
+        self._lock.acquire()
+        self._images.clear()
+        self._total_bytes = 0
+        self._lock.release()
+
+    def statistics(self):
+        """
+        Returns
+        -------
+        dict
+            Counters helpful for tuning max_bytes: hits, misses, evictions, number of cached images, their total size
+            and the highest total size seen.
+        """
+        self._lock.acquire()
+        statistics = dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            images=len(self._images),
+            bytes=self._total_bytes,
+            peak_bytes=self.peak_bytes,
+            max_bytes=self.max_bytes
+        )
+        self._lock.release()
+        return statistics
+
+    def __complete(self, key, shared_future, source_future):
+        # only caches fetched image, shared_future passes it to requesting futures
+        self._lock.acquire()
+        if self._pending.get(key) is shared_future:
+            del self._pending[key]
+        if source_future is not None and not source_future.cancelled() and source_future.exception() is None:
+            image = source_future.result()
+            if image.nbytes <= self.max_bytes and key not in self._images:
+                self._images[key] = image
+                self._total_bytes += image.nbytes
+                self.__evict()
+                self.peak_bytes = max(self.peak_bytes, self._total_bytes)
+        self._lock.release()
+
+    def __evict(self):
+        while self._total_bytes > self.max_bytes and len(self._images) > 0:
+            _, image = self._images.popitem(last=False)
+            self._total_bytes -= image.nbytes
+            self.evictions += 1
+
+
+_default_image_cache = MemoryImageCache()
+
+
+def default_image_cache():
+    """
+    Returns
+    -------
+    MemoryImageCache
+        Cache shared by all stripes which were not given their own cache.
+    """
+    return _default_image_cache
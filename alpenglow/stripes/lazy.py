@@ -1,3 +1,6 @@
+from collections import OrderedDict
+
+from alpenglow.stripes.image_cache import default_image_cache
 from alpenglow.stripes.stripe import Stripe
 
 
@@ -6,7 +9,7 @@ class LazyStripe(Stripe):
     Stripe fetches images from an underlying image source.
     """
 
-    def __init__(self, stripe_id, image_source):
+    def __init__(self, stripe_id, image_source, image_cache=None):
         """
         Parameters
         ----------
@@ -14,28 +17,47 @@ class LazyStripe(Stripe):
             Id of the stripe
         image_source: ImageSource
             Source from which parts are fetched.
+        image_cache: MemoryImageCache
+            Cache keeping fetched images. Process wide default_image_cache is used if not given.
         """
         super(LazyStripe, self).__init__()
         self.stripe_id = stripe_id
         self.image_source = image_source
-        self.cached_image = None
-        self.cached_image_future = None
+        self.image_cache = image_cache if image_cache is not None else default_image_cache()
 
     def get_image(self, version_id):
         """
-        Fetches image from image_source and caches it by version_id keeping only 1 last value.
+        Fetches image from image_source unless it is kept in image_cache.
         """
-        if self.cached_image is None or self.cached_image[0] != version_id:
-            self.cached_image = [version_id, self.image_source.get_image(self.stripe_id, version_id)]
-        return self.cached_image[1]
+        return self.image_cache.get_image(self.image_source, self.stripe_id, version_id)
 
     def get_image_future(self, version_id):
         """
-        Fetches image from image_source and caches it by version_id keeping only 1 last value.
+        Fetches image from image_source unless it is kept in image_cache.
+        """
+        return self.image_cache.get_image_future(self.image_source, self.stripe_id, version_id)
+
+    def get_image_futures(self, version_ids):
+        """
+        Fetches images missing in image_cache from image_source with a single batch request.
+        """
+        futures = self.image_cache.get_image_futures(self.image_source, [(self.stripe_id, version_id) for version_id in version_ids])
+        return OrderedDict((version_id, future) for (_, version_id), future in futures.items())
+
+    def get_image_region_future(self, version_id, rows=None, columns=None):
+        """
+        Cuts region from the image kept in image_cache, or fetches only the region from image_source.
+        """
+        return self.image_cache.get_image_region_future(self.image_source, self.stripe_id, version_id, rows, columns)
+
+    def probe(self):
+        """
+        Probes image_source when it reads shape and dtype from image metadata (see ImageSource.probes_images),
+        otherwise fetches the image through image_cache, so it is not fetched again by following requests.
         """
-        if self.cached_image_future is None or self.cached_image_future[0] != version_id:
-            self.cached_image_future = [version_id, self.image_source.get_image_future(self.stripe_id, version_id)]
-        return self.cached_image_future[1]
+        if self.image_source.probes_images():
+            return self.image_source.probe_image(self.stripe_id)
+        return super(LazyStripe, self).probe()
 
     def version_count(self):
         return self.image_source.version_count()
@@ -1,6 +1,27 @@
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from concurrent.futures import Future
 
+from alpenglow.futures import map_future
+
+
+def region_slices(rows=None, columns=None):
+    """
+    Parameters
+    ----------
+    rows: tuple(int, int)
+        Range (start, stop) of rows, with meaning of slice arguments. All rows if None.
+    columns: tuple(int, int)
+        Range (start, stop) of columns, with meaning of slice arguments. All columns if None.
+
+    Returns
+    -------
+    tuple(slice, slice)
+        Index selecting the region from an image.
+    """
+    return (slice(*rows) if rows is not None else slice(None),
+            slice(*columns) if columns is not None else slice(None))
+
 
 class Stripe:
     """
@@ -46,9 +67,7 @@ class Stripe:
         Returns dtype of images (same in each version)
         """
         if self.cached_dtype is None:
-            image = self.get_image(0)
-            self.cached_shape = image.shape
-            self.cached_dtype = image.dtype
+            self.cached_shape, self.cached_dtype = self.probe()
         return self.cached_dtype
 
     def get_shape(self):
@@ -59,11 +78,21 @@ class Stripe:
             height, width of images (same in each version)
         """
         if self.cached_shape is None:
-            image = self.get_image(0)
-            self.cached_shape = image.shape
-            self.cached_dtype = image.dtype
+            self.cached_shape, self.cached_dtype = self.probe()
         return self.cached_shape
 
+    def probe(self):
+        """
+        Implementations may override it to learn shape and dtype of images without fetching them.
+
+        Returns
+        -------
+        tuple(tuple(int, int), numpy.dtype)
+            Shape and dtype of images (same in each version).
+        """
+        image = self.get_image(0)
+        return image.shape, image.dtype
+
     def get_channel_image(self, version_id, channel_id):
         """
         Parameters
@@ -98,6 +127,24 @@ class Stripe:
         future.set_result(self.get_image(version_id))
         return future
 
+    def get_image_futures(self, version_ids):
+        """
+        Parameters
+        ----------
+        version_ids: iterable of int
+            versions of the fetched images.
+
+        Returns
+        -------
+        OrderedDict
+            version_id -> Future for NumPy array of shape (height, width), in order of version_ids.
+        """
+        futures = OrderedDict()
+        for version_id in version_ids:
+            if version_id not in futures:
+                futures[version_id] = self.get_image_future(version_id)
+        return futures
+
     def get_channel_image_future(self, version_id, channel_id):
         """
 
@@ -119,6 +166,59 @@ class Stripe:
             lambda image: future.set_result(image.result()[:, (channel_id * (image.result().shape[1] // channel_count)):((channel_id + 1) * (image.result().shape[1] // channel_count))]))
         return future
 
+    def get_image_region(self, version_id, rows=None, columns=None):
+        """
+        Parameters
+        ----------
+        version_id: int
+            version of the fetched image starting from 0.
+        rows: tuple(int, int)
+            Range (start, stop) of rows, all rows if None.
+        columns: tuple(int, int)
+            Range (start, stop) of columns, all columns if None.
+
+        Returns
+        -------
+        ndarray
+            Requested part of the image.
+        """
+        return self.get_image_region_future(version_id, rows, columns).result()
+
+    def get_image_region_future(self, version_id, rows=None, columns=None):
+        """
+        Same as get_image_region, but returns Future. Implementations may override it to fetch only requested part of
+        the image.
+        """
+        region = region_slices(rows, columns)
+        return map_future(self.get_image_future(version_id), lambda image: image[region])
+
+    def get_channel_region_future(self, version_id, channel_id, rows=None, columns=None):
+        """
+        Parameters
+        ----------
+        version_id: int
+            version of the fetched image starting from 0.
+        channel_id: int
+            id of the channel extracted from the image
+        rows: tuple(int, int)
+            Range (start, stop) of rows, all rows if None.
+        columns: tuple(int, int)
+            Non negative range (start, stop) of columns of the channel image, all columns if None.
+
+        Returns
+        -------
+        ndarray: Future
+            Future for requested part of the channel image.
+        """
+        channel_width = self.get_channel_shape()[1]
+        column_from = channel_id * channel_width
+        if columns is not None:
+            column_to = column_from + min(channel_width, columns[1])
+            column_from += columns[0]
+        else:
+            column_to = column_from + channel_width
+        return self.get_image_region_future(version_id, rows, (column_from, column_to))
+
     def get_channel_shape(self):
         """
 
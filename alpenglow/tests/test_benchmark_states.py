@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from unittest import TestCase
+
+import numpy
+from numpy.testing import assert_equal
+
+from alpenglow.benchmark import BenchmarkConfig, CorrelationState, ShiftState, ProjectionState, ShiftCacheState, \
+    DelayDownloadState, get_image_source
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
+
+
+class TestBenchmarkStates(TestCase):
+    def test_shift_is_found_from_half_spectra(self):
+        # given
+        image_source = DemoImageSource(3, 3, channel_count=1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        config = BenchmarkConfig(sample_size=3)
+        correlation_state = CorrelationState(config)
+        shift_state = ShiftState(config)
+        expected_shift = FftMatchingAlgorithm([0, 1, 2], [0]).match(image_source.get_stripe(1), image_source.get_stripe(2))
+
+        # when
+        correlations = []
+        shifts = []
+        for version in range(3):
+            for stripe in [2, 1]:
+                for correlation in correlation_state.apply(version, stripe, image_source.get_image(stripe, version)):
+                    correlations.append(correlation)
+                    shift = shift_state.apply(*correlation)
+                    if shift is not None:
+                        shifts.append(shift)
+
+        # then
+        self.assertEqual(3, len(correlations))
+        for stripe, spectrum, top_shape, correlation_shape in correlations:
+            self.assertEqual(numpy.complex64, spectrum.dtype)
+            self.assertEqual((correlation_shape[0], correlation_shape[1] // 2 + 1), spectrum.shape)
+        self.assertEqual(1, len(shifts))
+        stripe, shift, top_shape = shifts[0]
+        self.assertEqual(1, stripe)
+        assert_equal(expected_shift, shift)
+        self.assertEqual(image_source.get_image(1, 0).shape, top_shape)
+
+    def test_adaptive_sampling_finishes_when_shift_is_confident(self):
+        # given
+        image_source = DemoImageSource(3, 12, channel_count=1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        config = BenchmarkConfig(sample_size=12, min_peak_ratio=1.5, min_samples=3, stable_samples=2)
+        correlation_state = CorrelationState(config)
+        shift_state = ShiftState(config)
+
+        # when
+        shifts = []
+        correlation_counts = []
+        for version in range(12):
+            ready_correlations = correlation_state.apply(version, 1, image_source.get_image(1, version)) + \
+                                 correlation_state.apply(version, 2, image_source.get_image(2, version))
+            correlation_counts.append(len(ready_correlations))
+            for correlation in ready_correlations:
+                shift = shift_state.apply(*correlation)
+                if shift is not None:
+                    shifts.append((version, shift))
+                    correlation_state.finish(shift[0])
+
+        # then
+        self.assertEqual(1, len(shifts))
+        version, (stripe, shift, top_shape) = shifts[0]
+        self.assertEqual(3, version)
+        assert_equal([92, 38], shift)
+        self.assertEqual([1] * 4 + [0] * 8, correlation_counts)
+        self.assertEqual([], [image_id for image_id in correlation_state.tops if image_id[1] == 1])
+        self.assertEqual([], [image_id for image_id in correlation_state.bottoms if image_id[1] == 2])
+
+    def test_projections_are_correlated_once_per_pair_of_stripes(self):
+        # given
+        image_source = DemoImageSource(3, 4, channel_count=1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        config = BenchmarkConfig(sample_size=4, projection='max')
+        projection_state = ProjectionState(config)
+
+        # when
+        shifts = []
+        for version in range(4):
+            for stripe in [2, 0, 1]:
+                shifts.extend(projection_state.apply(version, stripe, image_source.get_image(stripe, version)))
+
+        # then
+        self.assertEqual([0, 1], [stripe for stripe, shift, top_shape in shifts])
+        assert_equal([[92, -19], [92, 38]], [shift for stripe, shift, top_shape in shifts])
+        self.assertEqual(image_source.get_image(0, 0).shape, shifts[0][2])
+        self.assertEqual([2], list(projection_state.tops.keys()))
+        self.assertEqual([], list(projection_state.bottoms.keys()))
+
+    def test_shifts_are_cached_between_runs(self):
+        # given
+        directory = tempfile.mkdtemp()
+        image_source = DemoImageSource(3, 3, channel_count=1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        config = BenchmarkConfig(sample_size=2, shift_cache_path=os.path.join(directory, 'shifts.json'))
+        top_shape = image_source.get_image(1, 0).shape
+        ShiftCacheState(config, image_source).apply(1, [92, 38], top_shape)
+
+        # when
+        shift_cache_state = ShiftCacheState(config, image_source)
+        shifts = [shift_cache_state.lookup(0), shift_cache_state.lookup(1), shift_cache_state.lookup(1)]
+        shutil.rmtree(directory)
+
+        # then
+        self.assertEqual([None, [1, [92, 38], top_shape], None], shifts)
+
+    def test_fingerprints_are_fetched_once_per_physical_image(self):
+        # given
+        class FingerprintCountingImageSource(DemoImageSource):
+            def __init__(self, *args, **kwargs):
+                super(FingerprintCountingImageSource, self).__init__(*args, **kwargs)
+                self.fingerprinted = []
+
+            def fingerprint(self, stripe_id, version_id):
+                self.fingerprinted.append((stripe_id, version_id))
+                return super(FingerprintCountingImageSource, self).fingerprint(stripe_id, version_id)
+
+        directory = tempfile.mkdtemp()
+        image_source = FingerprintCountingImageSource(3, 3, channel_count=1)
+        config = BenchmarkConfig(sample_size=2, shift_cache_path=os.path.join(directory, 'shifts.json'))
+        shift_cache_state = ShiftCacheState(config, image_source)
+
+        # when
+        for stripe in range(4):
+            shift_cache_state.lookup(stripe)
+            shift_cache_state.apply(stripe, [92, 0], (232, 550))
+        shutil.rmtree(directory)
+
+        # then
+        self.assertEqual([(stripe, version) for stripe in range(3) for version in [0, 2]],
+                         sorted(image_source.fingerprinted))
+        self.assertEqual({}, shift_cache_state.keys)
+
+    def test_sample_versions_are_not_delayed(self):
+        # given
+        config = BenchmarkConfig(sample_size=2)  # first and last of 5 demo versions
+        state = DelayDownloadState(config)
+
+        # when
+        delayed = [(version, state.apply_image_id(0, version), state.apply_metadata(0, version)) for version in range(5)]
+
+        # then
+        self.assertEqual(5, state.version_count)
+        self.assertEqual([(0, False, False), (1, False, True), (2, False, True), (3, False, True), (4, False, False)],
+                         delayed)
+
+    def test_closed_image_source_stops_its_workers(self):
+        # given
+        config = BenchmarkConfig(prefetch_depth=4)
+        thread_count = threading.active_count()
+
+        # when
+        for _ in range(5):
+            with get_image_source(config) as image_source:
+                image_source.get_image(0, 0)
+
+        # then
+        self.assertEqual(thread_count, threading.active_count())
+
+    def test_replication_without_disk_cache_is_warned_about(self):
+        # given
+        cache_dir = tempfile.mkdtemp()
+
+        # when
+        with warnings.catch_warnings(record=True) as uncached_warnings:
+            warnings.simplefilter('always')
+            get_image_source(BenchmarkConfig(replication_factor=2)).close()
+        with warnings.catch_warnings(record=True) as cached_warnings:
+            warnings.simplefilter('always')
+            get_image_source(BenchmarkConfig(replication_factor=2, image_cache_dir=cache_dir)).close()
+        shutil.rmtree(cache_dir)
+
+        # then
+        self.assertEqual(1, len(uncached_warnings))
+        self.assertEqual(0, len(cached_warnings))
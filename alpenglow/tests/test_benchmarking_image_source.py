@@ -1,7 +1,12 @@
+import json
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
 from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
 from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
 
 
 class TestBenchmarkingImageSource(TestCase):
@@ -19,3 +24,46 @@ class TestBenchmarkingImageSource(TestCase):
         # then
         self.assertEqual(inner_source.get_image(0, 0).shape, image.shape)
         self.assertGreater(source.total_fetching_time(), 0.0)
+
+    def test_phases_reported_by_inner_source_are_recorded(self):
+        # given
+        inner_source = ThreadedImageSource([DemoImageSource(stripe_count=2, version_count=3) for _ in range(2)])
+        source = BenchmarkingImageSource(inner_source)
+
+        # when
+        futures = [source.get_image_future(stripe_id, version_id) for stripe_id in range(2) for version_id in range(3)]
+        for future in futures:
+            future.result()
+        inner_source.close()
+
+        # then
+        self.assertEqual(6, len(source.fetches))
+        for fetch in source.fetches:
+            self.assertIsNotNone(fetch['queue_wait'])
+            self.assertIsNotNone(fetch['read'])
+            self.assertGreaterEqual(fetch['total'], fetch['read'])
+        self.assertEqual(1, min(fetch['concurrency'] for fetch in source.fetches))
+        self.assertGreaterEqual(6, source.summary()['peak_concurrency'])
+        self.assertEqual(6, sum(images for _, images, _ in source.throughput(interval=3600.)) * 3600.)
+        self.assertEqual(6, sum(source.latency_histogram(bins=4)[0]))
+        self.assertLessEqual(source.latency_percentiles()[50], source.latency_percentiles()[100])
+
+    def test_fetches_are_exported(self):
+        # given
+        directory = tempfile.mkdtemp()
+        source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        source.get_image(0, 0)
+        source.get_image(1, 2)
+
+        # when
+        source.to_csv(os.path.join(directory, 'fetches.csv'))
+        source.to_json(os.path.join(directory, 'fetches.json'))
+
+        # then
+        with open(os.path.join(directory, 'fetches.csv')) as f:
+            self.assertEqual(3, len(f.read().strip().split('\n')))
+        with open(os.path.join(directory, 'fetches.json')) as f:
+            exported = json.load(f)
+        self.assertEqual(2, exported['summary']['fetches'])
+        self.assertEqual([[0, 0], [1, 2]], [[fetch['stripe_id'], fetch['version_id']] for fetch in exported['fetches']])
+        shutil.rmtree(directory)
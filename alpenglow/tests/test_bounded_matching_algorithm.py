@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from numpy.testing import assert_equal
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.bounded import BoundedFftMatchingAlgorithm
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
+
+
+class TestBoundedFftMatchingAlgorithm(TestCase):
+    def setUp(self):
+        self.image_source = DemoImageSource(5, 3, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        self.stripes = [self.image_source.get_stripe(stripe_id) for stripe_id in range(5)]
+
+    def test_configured_bounds(self):
+        # given
+        algorithm = BoundedFftMatchingAlgorithm([0, 2], [0, 1], overlap_range=(50, 70), shift_range=(-40, 40))
+
+        # when
+        shifts = [list(algorithm.match(top_stripe, bottom_stripe))
+                  for top_stripe, bottom_stripe in zip(self.stripes[:-1], self.stripes[1:])]
+
+        # then
+        self.assertEqual([[60, -19], [60, 38], [60, -19], [60, -19]], shifts)
+        self.assertEqual(4, algorithm.bounded_matches)
+        self.assertEqual(0, algorithm.full_matches)
+
+    def test_learned_bounds(self):
+        # given
+        algorithm = BoundedFftMatchingAlgorithm([0, 2], [0, 1])
+        algorithm.observe((60, -19))
+
+        # when
+        shift = algorithm.match(self.stripes[3], self.stripes[4])
+
+        # then
+        assert_equal([60, -19], shift)
+        self.assertEqual(((44, 76), (-35, -3), True), algorithm.search_bounds())
+        self.assertEqual(1, algorithm.bounded_matches)
+
+    def test_full_search_is_used_when_shift_is_outside_of_bounds(self):
+        # given
+        algorithm = BoundedFftMatchingAlgorithm([0, 2], [0, 1], fast=True)
+        algorithm.observe((20, -19))
+        expected_shift = FftMatchingAlgorithm([0, 2], [0, 1], fast=True).match(self.stripes[3], self.stripes[4])
+
+        # when
+        shift = algorithm.match(self.stripes[3], self.stripes[4])
+
+        # then
+        assert_equal(expected_shift, shift)
+        self.assertEqual(0, algorithm.bounded_matches)
+        self.assertEqual(1, algorithm.full_matches)
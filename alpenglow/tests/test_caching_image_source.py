@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+from time import time
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.caching import CachingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+
+
+class TestCachingImageSource(TestCase):
+    """
+    Test basic functionality of CachingImageSource
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_second_request_is_served_from_cache(self):
+        # given
+        inner_source = DemoImageSource(stripe_count=2, version_count=3)
+        source = CachingImageSource(inner_source, self.cache_dir)
+
+        # when
+        first_image = source.get_image(1, 2)
+        second_image = source.get_image_future(1, 2).result()
+
+        # then
+        assert_array_equal(inner_source.get_image(1, 2), first_image)
+        assert_array_equal(first_image, second_image)
+        self.assertEqual(1, source.hits)
+        self.assertEqual(1, source.misses)
+
+    def test_cache_survives_restart(self):
+        # given
+        inner_source = DemoImageSource(stripe_count=2, version_count=3)
+        CachingImageSource(inner_source, self.cache_dir).get_image(0, 1)
+
+        # when
+        source = CachingImageSource(inner_source, self.cache_dir)
+        image = source.get_image(0, 1)
+
+        # then
+        assert_array_equal(inner_source.get_image(0, 1), image)
+        self.assertEqual(1, source.hits)
+        self.assertEqual(0, source.misses)
+
+    def test_least_recently_used_image_is_evicted(self):
+        # given
+        inner_source = DemoImageSource(stripe_count=2, version_count=3)
+        image_bytes = inner_source.get_image(0, 0).nbytes
+        source = CachingImageSource(inner_source, self.cache_dir, max_bytes=int(2.5 * image_bytes))
+
+        # when
+        source.get_image(0, 0)
+        source.get_image(0, 1)
+        source.get_image(0, 0)
+        source.get_image(0, 2)
+
+        # then
+        self.assertEqual(1, source.evictions)
+        source.get_image(0, 0)
+        self.assertEqual(2, source.hits)
+        source.get_image(0, 1)
+        self.assertEqual(4, source.misses)
+
+    def test_stale_temporary_files_are_removed(self):
+        # given
+        inner_source = DemoImageSource(stripe_count=2, version_count=3)
+        stale_path = os.path.join(self.cache_dir, 'stale.tmp')
+        fresh_path = os.path.join(self.cache_dir, 'fresh.tmp')
+        for path in [stale_path, fresh_path]:
+            open(path, 'wb').close()
+        stale_time = time() - 2 * CachingImageSource.STALE_TEMPORARY_SECONDS
+        os.utime(stale_path, (stale_time, stale_time))
+
+        # when
+        CachingImageSource(inner_source, self.cache_dir)
+
+        # then
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertTrue(os.path.exists(fresh_path))
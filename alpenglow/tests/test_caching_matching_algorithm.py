@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+import skimage.external.tifffile as tiff
+from numpy.testing import assert_equal
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.filesystem import FilesystemImageSource
+from alpenglow.matching_algorithms.caching import CachingMatchingAlgorithm, ShiftCache
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
+from alpenglow.patchwork_builders.default import PatchworkBuilder
+from alpenglow.stripes.image_cache import MemoryImageCache
+
+
+class TestCachingMatchingAlgorithm(TestCase):
+    """
+    Test basic functionality of CachingMatchingAlgorithm and ShiftCache
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'shifts.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rerun_does_not_fetch_images(self):
+        # given
+        demo_source = DemoImageSource(3, 2, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = FftMatchingAlgorithm([0, 1], [0], fast=True)
+        first_source = BenchmarkingImageSource(demo_source)
+        first_builder = PatchworkBuilder(CachingMatchingAlgorithm(algorithm, ShiftCache(self.path), [0, 1], [0]))
+        for stripe_id in range(3):
+            first_builder.stitch(first_source.get_stripe(stripe_id, MemoryImageCache()))
+
+        # when
+        second_source = BenchmarkingImageSource(demo_source)
+        shift_cache = ShiftCache(self.path)
+        second_builder = PatchworkBuilder(CachingMatchingAlgorithm(algorithm, shift_cache, [0, 1], [0]))
+        for stripe_id in range(3):
+            second_builder.stitch(second_source.get_stripe(stripe_id, MemoryImageCache()))
+
+        # then
+        assert_equal([shift for _, shift in first_builder.patchwork], [shift for _, shift in second_builder.patchwork])
+        self.assertEqual(6, len(first_source.fetches))
+        self.assertEqual(0, len(second_source.fetches))
+        self.assertEqual(2, shift_cache.hits)
+        self.assertEqual(0, shift_cache.misses)
+
+    def test_shift_is_not_reused_when_image_changes(self):
+        # given
+        path_format = os.path.join(self.directory, '{stripe_id}_{version_id}.tif')
+        demo_source = DemoImageSource(2, 1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        for stripe_id in range(2):
+            tiff.imsave(path_format.format(stripe_id=stripe_id, version_id=0),
+                        demo_source.get_image(stripe_id, 0).astype(numpy.uint16).swapaxes(0, 1))
+        source = FilesystemImageSource(path_format, [0, 1], [0])
+        shift_cache = ShiftCache(self.path)
+        algorithm = CachingMatchingAlgorithm(FftMatchingAlgorithm([0], [0], fast=True), shift_cache, [0], [0])
+        algorithm.match(source.get_stripe(0, MemoryImageCache()), source.get_stripe(1, MemoryImageCache()))
+
+        # when
+        changed_path = path_format.format(stripe_id=1, version_id=0)
+        tiff.imsave(changed_path, numpy.zeros((256, 213), dtype=numpy.uint16))
+        os.utime(changed_path, (0, 0))
+        algorithm.match(source.get_stripe(0, MemoryImageCache()), source.get_stripe(1, MemoryImageCache()))
+
+        # then
+        self.assertEqual(0, shift_cache.hits)
+        self.assertEqual(2, shift_cache.misses)
+
+    def test_looped_stripes_share_keys_with_stripes_of_the_same_loop_parity(self):
+        # given
+        source = DemoImageSource(3, 2)
+
+        # when
+        key = ShiftCache.key(source, 1, 2, [0, 1])
+        same_parity_key = ShiftCache.key(source, 7, 8, [0, 1])
+        mirrored_key = ShiftCache.key(source, 3, 4, [0, 1])
+        other_versions_key = ShiftCache.key(source, 1, 2, [1])
+
+        # then
+        self.assertEqual(key, same_parity_key)
+        self.assertNotEqual(key, mirrored_key)
+        self.assertNotEqual(key, other_versions_key)
+
+    def test_cached_shift_is_returned(self):
+        # given
+        source = DemoImageSource(2, 1)
+        key = ShiftCache.key(source, 0, 1, [0])
+        ShiftCache(self.path).put(key, numpy.array([92, -19]))
+
+        # when
+        shift = ShiftCache(self.path).get(key)
+
+        # then
+        assert_equal([92, -19], shift)
@@ -0,0 +1,161 @@
+from concurrent.futures import Future
+from threading import Event
+from unittest import TestCase
+
+import numpy
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.coalescing import CoalescingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.image_sources.prefetching import PrefetchingImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
+
+
+class ManualImageSource(ImageSource):
+    """
+    Image source returning futures which are completed by the test.
+    """
+    def __init__(self):
+        super(ManualImageSource, self).__init__()
+        self.futures = []
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def get_image_future(self, stripe_id, version_id):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def stripe_count(self):
+        return 1
+
+    def version_count(self):
+        return 1
+
+    def channel_count(self):
+        return 1
+
+
+class TestCoalescingImageSource(TestCase):
+    """
+    Test basic functionality of CoalescingImageSource
+    """
+    def test_concurrent_requests_share_fetch(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+        image = numpy.zeros((4, 4), dtype=numpy.uint16)
+
+        # when
+        first_future = source.get_image_future(0, 0)
+        second_future = source.get_image_future(0, 0)
+        inner_source.futures[0].set_result(image)
+
+        # then
+        self.assertEqual(1, len(inner_source.futures))
+        self.assertIs(image, first_future.result())
+        self.assertIs(image, second_future.result())
+        self.assertEqual(1, source.saved_fetches)
+        self.assertEqual(image.nbytes, source.saved_bytes)
+
+    def test_completed_fetch_is_forgotten(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+        source.get_image_future(0, 0)
+        inner_source.futures[0].set_result(numpy.zeros((4, 4)))
+
+        # when
+        source.get_image_future(0, 0)
+
+        # then
+        self.assertEqual(2, len(inner_source.futures))
+        self.assertEqual(0, source.saved_fetches)
+
+    def test_failure_is_passed_to_all_requesters(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+
+        # when
+        futures = [source.get_image_future(0, 0) for _ in range(2)]
+        inner_source.futures[0].set_exception(IOError("missing"))
+
+        # then
+        for future in futures:
+            self.assertIsInstance(future.exception(), IOError)
+
+    def test_batch_skips_images_being_fetched(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+        first_future = source.get_image_future(0, 0)
+
+        # when
+        futures = source.get_image_futures([(0, 0), (1, 0)])
+        for future in inner_source.futures:
+            future.set_result(numpy.zeros((4, 4)))
+
+        # then
+        self.assertEqual(2, len(inner_source.futures))
+        self.assertEqual((4, 4), first_future.result().shape)
+        self.assertEqual((4, 4), futures[(0, 0)].result().shape)
+        self.assertEqual((4, 4), futures[(1, 0)].result().shape)
+        self.assertEqual(1, source.saved_fetches)
+
+    def test_cancelling_one_request_does_not_cancel_others(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+        image = numpy.zeros((4, 4), dtype=numpy.uint16)
+        cancelled_future = source.get_image_future(0, 0)
+        future = source.get_image_future(0, 0)
+
+        # when
+        cancelled = cancelled_future.cancel()
+        inner_source.futures[0].set_result(image)
+
+        # then
+        self.assertTrue(cancelled)
+        self.assertFalse(inner_source.futures[0].cancelled())
+        self.assertIs(image, future.result())
+
+    def test_fetch_is_cancelled_when_all_requests_are_cancelled(self):
+        # given
+        inner_source = ManualImageSource()
+        source = CoalescingImageSource(inner_source)
+        futures = [source.get_image_future(0, 0) for _ in range(2)]
+
+        # when
+        for future in futures:
+            future.cancel()
+        next_future = source.get_image_future(0, 0)
+        inner_source.futures[1].set_result(numpy.zeros((4, 4)))
+
+        # then
+        self.assertTrue(inner_source.futures[0].cancelled())
+        self.assertEqual((4, 4), next_future.result().shape)
+
+    def test_dropped_prefetch_never_reaches_inner_source(self):
+        # given
+        benchmarking_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=5))
+        threaded_source = ThreadedImageSource([benchmarking_source])
+        order = [(0, version) for version in range(5)]
+        source = PrefetchingImageSource(CoalescingImageSource(threaded_source), order, depth=2)
+        gate = Event()
+        threaded_source.get_image_future(1, 0, priority=1).add_done_callback(lambda f: gate.wait())
+
+        # when
+        futures = [source.get_image_future(0, version) for version in [0, 2, 3, 4]]
+        gate.set()
+        for future in futures:
+            future.result(timeout=10)
+        source.close()
+
+        # then
+        self.assertEqual(1, source.dropped)
+        self.assertEqual([(1, 0), (0, 0), (0, 2), (0, 3), (0, 4)],
+                         sorted([(fetch['stripe_id'], fetch['version_id']) for fetch in benchmarking_source.fetches],
+                                key=lambda image_id: (-image_id[0], image_id[1])))
@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.deduplicating import DeduplicatingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+
+
+class TestDeduplicatingImageSource(TestCase):
+    """
+    Test basic functionality of DeduplicatingImageSource
+    """
+    def test_loop_variants_are_derived_from_single_fetch(self):
+        # given
+        demo_source = DemoImageSource(stripe_count=3, version_count=2)
+        inner_source = BenchmarkingImageSource(demo_source)
+        source = DeduplicatingImageSource(inner_source)
+
+        # when
+        images = dict(((stripe_id, version_id), source.get_image(stripe_id, version_id))
+                      for stripe_id in range(9) for version_id in range(2))
+
+        # then
+        self.assertEqual(3 * 2, len(inner_source.fetch_times))
+        for (stripe_id, version_id), image in images.items():
+            assert_array_equal(demo_source.get_image(stripe_id, version_id), image)
+
+    def test_physical_image_id(self):
+        # given
+        source = DemoImageSource(stripe_count=3, version_count=2)
+
+        # when & then
+        self.assertEqual((1, 1, False, False), source.physical_image_id(1, 1))
+        self.assertEqual((2, 0, True, True), source.physical_image_id(3, 0))
+        self.assertEqual((0, 0, True, False), source.physical_image_id(5, 0))
+        self.assertEqual((0, 0, False, True), source.physical_image_id(6, 0))
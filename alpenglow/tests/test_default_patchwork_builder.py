@@ -4,6 +4,8 @@ import numpy
 from numpy.testing import assert_array_equal, assert_array_almost_equal
 
 from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.bounded import BoundedFftMatchingAlgorithm
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
 from alpenglow.matching_algorithms.old import OldMatchingAlgorithm
 from alpenglow.patchwork_builders.default import PatchworkBuilder
 
@@ -82,6 +84,64 @@ class TestDefaultPatchworkBuilder(TestCase):
         self.assertIsNotNone(result_generation_time)
         self.assertGreater(result_generation_time, 0.0)
 
+    def test_stitch_all_is_equal_to_sequential_stitching(self):
+        # given
+        matching_algorithm = FftMatchingAlgorithm([0, 1], [0], fast=True)
+        sequential_builder = PatchworkBuilder(matching_algorithm)
+        builder = PatchworkBuilder(matching_algorithm)
+        image_source = DemoImageSource(stripe_count=6, version_count=2, overlap=0.4, vertical_shifts=(19, 38, 0))
+        stripes = [image_source.get_stripe(stripe_id) for stripe_id in range(6)]
+        for stripe in stripes:
+            sequential_builder.stitch(stripe)
+
+        # when
+        builder.stitch(stripes[0])
+        builder.stitch_all(stripes[1:], max_workers=3)
+
+        # then
+        self.assertEqual([(stripe, tuple(shift)) for stripe, shift in sequential_builder.patchwork],
+                         [(stripe, tuple(shift)) for stripe, shift in builder.patchwork])
+        self.assertEqual(6, len(builder.benchmark()[0]))
+
+    def test_stitch_all_matches_stripes_in_order_when_algorithm_learns_from_previous_pairs(self):
+        # given
+        image_source = DemoImageSource(stripe_count=6, version_count=2, overlap=0.4, vertical_shifts=(19, 38, 0))
+        stripes = [image_source.get_stripe(stripe_id) for stripe_id in range(6)]
+        sequential_algorithm = BoundedFftMatchingAlgorithm([0, 1], [0], fast=True)
+        sequential_builder = PatchworkBuilder(sequential_algorithm)
+        for stripe in stripes:
+            sequential_builder.stitch(stripe)
+        algorithm = BoundedFftMatchingAlgorithm([0, 1], [0], fast=True)
+        builder = PatchworkBuilder(algorithm)
+
+        # when
+        builder.stitch_all(stripes, max_workers=3)
+
+        # then
+        self.assertFalse(algorithm.matches_independently())
+        self.assertEqual([(stripe, tuple(shift)) for stripe, shift in sequential_builder.patchwork],
+                         [(stripe, tuple(shift)) for stripe, shift in builder.patchwork])
+        self.assertEqual(list(sequential_algorithm.shifts), list(algorithm.shifts))
+        self.assertEqual(sequential_algorithm.bounded_matches, algorithm.bounded_matches)
+
+    def test_stitch_all_stitches_stripes_preceding_mismatch(self):
+        # given
+        class FailingMatchingAlgorithm(FftMatchingAlgorithm):
+            def match(self, top_stripe, bottom_stripe):
+                if bottom_stripe.stripe_id == 3:
+                    raise ValueError("mismatch")
+                return FftMatchingAlgorithm.match(self, top_stripe, bottom_stripe)
+
+        builder = PatchworkBuilder(FailingMatchingAlgorithm([0], [0], fast=True))
+        image_source = DemoImageSource(stripe_count=5, overlap=0.4, vertical_shifts=(19, 38, 0))
+
+        # when
+        with self.assertRaises(ValueError):
+            builder.stitch_all([image_source.get_stripe(stripe_id) for stripe_id in range(5)])
+
+        # then
+        self.assertEqual([0, 1, 2], [stripe.stripe_id for stripe, _ in builder.patchwork])
+
     def test_gradient_merge_arrays(self):
         # given
         image_one = numpy.array([[1, 2], [3, 4], [5, 6], [7, 8]])
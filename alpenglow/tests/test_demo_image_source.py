@@ -5,7 +5,7 @@ from numpy.testing import assert_array_equal, assert_array_almost_equal
 from skimage.filters import gaussian
 from skimage.util import invert
 
-from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.demo import DemoImageSource, set_max_cached_bytes
 
 
 class TestDemoImageSource(TestCase):
@@ -84,3 +84,44 @@ class TestDemoImageSource(TestCase):
         assert_array_almost_equal(image[:shape[0], :int(shape[1] // 2)],
                                   numpy.vectorize(lambda x: int(round(x * 255)))(gaussian(source.source_image[:shape[0], :int(shape[1] // 2)], 2.0)).astype(image.dtype),
                                   decimal=0)
+
+    def test_tiled_source_image(self):
+        # given
+        source = DemoImageSource(stripe_count=2, version_count=3, tiles=(2, 3))
+
+        # when
+        image = source.get_image(0, 0)
+
+        # then
+        self.assertEqual((1024, 1536), source.source_image.shape)
+        assert_array_equal(source.source_image[:512, 512:1024], source.source_image[:512, 511::-1])
+        self.assertEqual(1536, image.shape[1])
+
+    def test_generated_images_are_shared(self):
+        # given
+        first_source = DemoImageSource(stripe_count=2, version_count=3, channel_count=2)
+        second_source = DemoImageSource(stripe_count=2, version_count=3, channel_count=2)
+
+        # when
+        image = first_source.get_image(1, 1)
+
+        # then
+        self.assertIs(image, second_source.get_image(1, 1))
+        self.assertFalse(image.flags.writeable)
+
+    def test_generated_images_are_bounded_by_bytes(self):
+        # given
+        image_bytes = DemoImageSource(stripe_count=4, version_count=3).get_image(0, 0).nbytes
+        source = DemoImageSource(stripe_count=4, version_count=3)
+        max_bytes = set_max_cached_bytes(2 * image_bytes)
+
+        # when
+        image = source.get_image(1, 1)
+        for stripe_id in range(4):
+            source.get_image(stripe_id, 2)
+        regenerated_image = source.get_image(1, 1)
+        set_max_cached_bytes(max_bytes)
+
+        # then
+        self.assertIsNot(image, regenerated_image)
+        assert_array_equal(image, regenerated_image)
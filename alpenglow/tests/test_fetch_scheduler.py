@@ -0,0 +1,71 @@
+from concurrent.futures import Future
+from unittest import TestCase
+
+from alpenglow.image_sources.scheduler import FetchScheduler
+
+
+class TestFetchScheduler(TestCase):
+    def test_requests_with_higher_priority_are_served_first(self):
+        # given
+        scheduler = FetchScheduler()
+        scheduler.put(Future(), 'rest', stripe_id=0, priority=0)
+        scheduler.put(Future(), 'sample', stripe_id=0, priority=1)
+
+        # when
+        tasks = [task for _, task in scheduler.get(max_count=2)]
+
+        # then
+        self.assertEqual(['sample', 'rest'], tasks)
+
+    def test_stripes_are_served_in_turns(self):
+        # given
+        scheduler = FetchScheduler()
+        scheduler.put_many([(Future(), (0, version_id), 0, 0, None) for version_id in range(3)])
+        scheduler.put_many([(Future(), (1, version_id), 1, 0, None) for version_id in range(2)])
+
+        # when
+        tasks = [task for _, task in scheduler.get(max_count=5)]
+
+        # then
+        self.assertEqual([(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)], tasks)
+
+    def test_requests_with_earlier_deadline_are_served_first(self):
+        # given
+        scheduler = FetchScheduler()
+        scheduler.put(Future(), 'no deadline', stripe_id=0)
+        scheduler.put(Future(), 'late', stripe_id=0, deadline=20.)
+        scheduler.put(Future(), 'early', stripe_id=0, deadline=10.)
+
+        # when
+        tasks = [task for _, task in scheduler.get(max_count=3)]
+
+        # then
+        self.assertEqual(['early', 'late', 'no deadline'], tasks)
+
+    def test_cancelled_requests_are_dropped(self):
+        # given
+        scheduler = FetchScheduler()
+        cancelled_future = Future()
+        scheduler.put(cancelled_future, 'cancelled')
+        scheduler.put(Future(), 'needed')
+
+        # when
+        cancelled_future.cancel()
+        tasks = [task for _, task in scheduler.get(max_count=2)]
+
+        # then
+        self.assertEqual(['needed'], tasks)
+        self.assertEqual(0, len(scheduler))
+
+    def test_closed_scheduler_returns_pending_requests_then_nothing(self):
+        # given
+        scheduler = FetchScheduler()
+        scheduler.put(Future(), 'pending')
+
+        # when
+        scheduler.close()
+
+        # then
+        self.assertEqual(['pending'], [task for _, task in scheduler.get()])
+        self.assertEqual([], scheduler.get())
+        self.assertRaises(RuntimeError, scheduler.put, Future(), 'rejected')
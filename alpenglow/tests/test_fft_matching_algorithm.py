@@ -1,11 +1,33 @@
+from threading import Event, Lock
 from unittest import TestCase
 
 from numpy.testing import assert_equal
 
 from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
 from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
 
 
+class GatedImageSource(DemoImageSource):
+    """
+    Demo image source serving first open_count regions immediately, and the following ones after the gate is opened.
+    """
+    def __init__(self, open_count, *args, **kwargs):
+        super(GatedImageSource, self).__init__(*args, **kwargs)
+        self.open_count = open_count
+        self.gate = Event()
+        self.region_count = 0
+        self._count_lock = Lock()
+
+    def get_image_region(self, stripe_id, version_id, rows=None, columns=None):
+        with self._count_lock:
+            self.region_count += 1
+            region_count = self.region_count
+        if region_count > self.open_count:
+            self.gate.wait(10)
+        return super(GatedImageSource, self).get_image_region(stripe_id, version_id, rows, columns)
+
+
 class TestFftMatchingAlgorithm(TestCase):
     def test_match(self):
         # given
@@ -21,5 +43,114 @@ class TestFftMatchingAlgorithm(TestCase):
         # then
         assert_equal([92, -19], shift)
 
+    def test_fast_match(self):
+        # given
+        image_source = DemoImageSource(3, 3, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = FftMatchingAlgorithm([0, 2], [0, 1])
+        fast_algorithm = FftMatchingAlgorithm([0, 2], [0, 1], fast=True)
+
+        top_stripe = image_source.get_stripe(1)
+        bottom_stripe = image_source.get_stripe(2)
+
+        # when
+        shift = algorithm.match(top_stripe, bottom_stripe)
+        fast_shift = fast_algorithm.match(top_stripe, bottom_stripe)
+        repeated_fast_shift = fast_algorithm.match(top_stripe, bottom_stripe)
+
+        # then
+        assert_equal(shift, fast_shift)
+        assert_equal(fast_shift, repeated_fast_shift)
+
+    def test_workspaces_of_overlaps_of_different_shapes_are_bounded(self):
+        # given
+        image_source = DemoImageSource(3, 3, channel_count=1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = FftMatchingAlgorithm([0, 2], [0], fast=True)
+        fast_algorithm = FftMatchingAlgorithm([0, 2], [0], fast=True, max_workspaces=1)
+        stripes = [image_source.get_stripe(stripe_id) for stripe_id in range(5)]
+
+        for top_stripe, bottom_stripe in zip(stripes[:-1], stripes[1:]):
+            # when
+            shift = algorithm.match(top_stripe, bottom_stripe)
+            fast_shift = fast_algorithm.match(top_stripe, bottom_stripe)
+
+            # then
+            assert_equal(shift, fast_shift)
+            self.assertEqual(1, len(fast_algorithm._workspaces.buffers))
+
+    def test_batched_match(self):
+        # given
+        image_source = DemoImageSource(3, 3, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        stripes = [image_source.get_stripe(stripe_id) for stripe_id in range(3)]
+
+        for fast in [False, True]:
+            algorithm = FftMatchingAlgorithm([0, 1, 2], [0, 1, 2], fast=fast)
+            batched_algorithm = FftMatchingAlgorithm([0, 1, 2], [0, 1, 2], fast=fast, batched=True)
+
+            for top_stripe, bottom_stripe in zip(stripes[:-1], stripes[1:]):
+                # when
+                shift = algorithm.match(top_stripe, bottom_stripe)
+                batched_shift = batched_algorithm.match(top_stripe, bottom_stripe)
+
+                # then
+                assert_equal(shift, batched_shift)
+                self.assertEqual({}, getattr(batched_algorithm._workspaces, 'buffers', {}))
 
+    def test_adaptive_sampling(self):
+        # given
+        image_source = DemoImageSource(3, 12, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = FftMatchingAlgorithm(list(range(12)), [0, 1, 2])
+        adaptive_algorithm = FftMatchingAlgorithm(list(range(12)), [0, 1, 2], min_peak_ratio=1.5, min_samples=3,
+                                                  stable_samples=2)
+
+        top_stripe = image_source.get_stripe(1)
+        bottom_stripe = image_source.get_stripe(2)
+
+        # when
+        shift = algorithm.match(top_stripe, bottom_stripe)
+        adaptive_shift = adaptive_algorithm.match(top_stripe, bottom_stripe)
+
+        # then
+        assert_equal(shift, adaptive_shift)
+        self.assertEqual(36, algorithm.sample_count)
+        self.assertEqual(4, adaptive_algorithm.sample_count)
+
+    def test_adaptive_sampling_does_not_depend_on_order_of_fetches(self):
+        # given
+        demo_source = DemoImageSource(3, 12, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        reversed_source = ThreadedImageSource([demo_source], priority=lambda stripe_id, version_id: version_id)
+        algorithm = FftMatchingAlgorithm(list(range(12)), [0, 1, 2], min_peak_ratio=1.5, min_samples=3,
+                                         stable_samples=2)
+
+        # when
+        shift = algorithm.match(demo_source.get_stripe(1), demo_source.get_stripe(2))
+        sample_count = algorithm.sample_count
+        reversed_shift = algorithm.match(reversed_source.get_stripe(1), reversed_source.get_stripe(2))
+        reversed_source.close()
 
+        # then
+        assert_equal(shift, reversed_shift)
+        self.assertEqual(sample_count, algorithm.sample_count)
+
+    def test_adaptive_sampling_cancels_remaining_fetches(self):
+        # given
+        gated_source = GatedImageSource(8, 3, 12, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        image_source = ThreadedImageSource([gated_source], max_pending=0)
+        algorithm = FftMatchingAlgorithm(list(range(12)), [0, 1, 2], min_peak_ratio=1.5, min_samples=3,
+                                         stable_samples=2)
+
+        # when
+        shift = algorithm.match(image_source.get_stripe(1), image_source.get_stripe(2))
+        gated_source.gate.set()
+        image_source.close()
+
+        # then
+        assert_equal([92, 38], shift)
+        self.assertEqual(4, algorithm.sample_count)
+        self.assertLess(gated_source.region_count, 2 * 36)
+
+    def test_fast_length(self):
+        # when
+        lengths = [FftMatchingAlgorithm.fast_length(length) for length in [1, 7, 97, 116, 275, 1021]]
+
+        # then
+        assert_equal([1, 8, 100, 120, 288, 1024], lengths)
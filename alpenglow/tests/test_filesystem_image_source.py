@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+import skimage.external.tifffile as tiff
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.filesystem import FilesystemImageSource
+from alpenglow.stripes.image_cache import MemoryImageCache
+
+
+class TestFilesystemImageSource(TestCase):
+    """
+    Test basic functionality of FilesystemImageSource
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path_format = os.path.join(self.directory, '{stripe_id}_{version_id}.tif')
+        self.images = {}
+        for stripe_id in range(2):
+            for version_id in range(2):
+                image = numpy.random.randint(0, 2 ** 16, size=(30, 20)).astype(numpy.uint16)
+                tiff.imsave(self.path_format.format(stripe_id=stripe_id, version_id=version_id), image)
+                self.images[(stripe_id, version_id)] = image
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_image_is_transposed(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1])
+
+        # when
+        image = source.get_image(1, 0)
+
+        # then
+        assert_array_equal(self.images[(1, 0)].swapaxes(0, 1), image)
+
+    def test_memory_mapped_images_are_equal_to_read_ones(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1])
+        memory_mapped_source = FilesystemImageSource(self.path_format, [0, 1], [0, 1], memory_map=True)
+
+        # when & then
+        for stripe_id in range(4):
+            for version_id in range(2):
+                assert_array_equal(source.get_image(stripe_id, version_id),
+                                   memory_mapped_source.get_image(stripe_id, version_id))
+
+    def test_memory_mapped_image_is_copied_on_write(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1], memory_map=True)
+        image = source.get_image(0, 1)
+
+        # when
+        image[:] = 0
+
+        # then
+        self.assertIsInstance(image, numpy.memmap)
+        assert_array_equal(self.images[(0, 1)].swapaxes(0, 1), source.get_image(0, 1))
+
+    def test_read_and_decode_times_are_reported(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1])
+        timing = {}
+
+        # when
+        image = source.get_image_timed(0, 1, timing)
+
+        # then
+        assert_array_equal(self.images[(0, 1)].swapaxes(0, 1), image)
+        self.assertEqual(os.path.getsize(self.path_format.format(stripe_id=0, version_id=1)), timing['bytes'])
+        self.assertGreaterEqual(timing['read'], 0.)
+        self.assertGreaterEqual(timing['decode'], 0.)
+
+    def test_regions_are_equal_to_parts_of_images(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1])
+
+        for stripe_id in range(5):
+            # when
+            region = source.get_image_region(stripe_id, 1, rows=(5, -3), columns=(4, 22))
+
+            # then
+            assert_array_equal(source.get_image(stripe_id, 1)[5:-3, 4:22], region)
+
+    def test_probe_returns_shape_and_dtype_of_images(self):
+        # given
+        source = FilesystemImageSource(self.path_format, [0, 1], [0, 1])
+
+        for stripe_id in range(5):
+            # when
+            shape, dtype = source.probe_image(stripe_id)
+
+            # then
+            image = source.get_image(stripe_id, 0)
+            self.assertEqual(image.shape, shape)
+            self.assertEqual(image.dtype, dtype)
+
+    def test_stripe_shape_is_known_without_fetching_images(self):
+        # given
+        source = BenchmarkingImageSource(FilesystemImageSource(self.path_format, [0, 1], [0, 1]))
+        stripe = source.get_stripe(1, MemoryImageCache())
+
+        # when
+        shape = stripe.get_channel_shape()
+
+        # then
+        self.assertEqual((20, 30), shape)
+        self.assertEqual(numpy.uint16, stripe.get_dtype())
+        self.assertEqual(0, len(source.fetches))
+
+    def test_images_are_returned_in_requested_order(self):
+        # given
+        image_ids = [(1, 1), (0, 0), (1, 0), (0, 0), (0, 1)]
+
+        # when
+        with FilesystemImageSource(self.path_format, [0, 1], [0, 1], max_workers=2) as source:
+            images = list(source.get_images(image_ids))
+
+        # then
+        self.assertEqual([(1, 1), (0, 0), (1, 0), (0, 1)], [image_id for image_id, _ in images])
+        for image_id, image in images:
+            assert_array_equal(self.images[image_id].swapaxes(0, 1), image)
@@ -3,6 +3,7 @@ from unittest import TestCase
 from numpy.testing import assert_array_almost_equal
 
 from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
 from alpenglow.matching_algorithms.old import OldMatchingAlgorithm
 from alpenglow.patchwork_builders.lazy import LazyPatchworkBuilder
 
@@ -21,3 +22,20 @@ class TestLazyPatchworkBuilder(TestCase):
         # then
         patchwork = builder.get()
         assert_array_almost_equal(image_source.source_image, patchwork[:][0], decimal=0)
+
+    def test_stitch_all_is_equal_to_sequential_stitching(self):
+        # given
+        matching_algorithm = FftMatchingAlgorithm([0], [0], fast=True)
+        sequential_builder = LazyPatchworkBuilder(matching_algorithm)
+        builder = LazyPatchworkBuilder(matching_algorithm)
+        image_source = DemoImageSource(stripe_count=4, overlap=0.4, vertical_shifts=(19, 38, 0))
+        stripes = [image_source.get_stripe(stripe_id) for stripe_id in range(4)]
+        for stripe in stripes:
+            sequential_builder.stitch(stripe)
+
+        # when
+        builder.stitch_all(stripes)
+
+        # then
+        self.assertEqual([(stripe, tuple(shift)) for stripe, shift in sequential_builder.patchwork],
+                         [(stripe, tuple(shift)) for stripe, shift in builder.patchwork])
@@ -0,0 +1,178 @@
+from threading import Event
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
+from alpenglow.stripes.image_cache import MemoryImageCache
+
+
+class BatchRecordingImageSource(DemoImageSource):
+    """
+    Demo image source recording batches of requested images.
+    """
+    def __init__(self, **kwargs):
+        super(BatchRecordingImageSource, self).__init__(**kwargs)
+        self.batches = []
+
+    def get_image_futures(self, image_ids):
+        self.batches.append(list(image_ids))
+        return super(BatchRecordingImageSource, self).get_image_futures(self.batches[-1])
+
+
+class TestMemoryImageCache(TestCase):
+    def test_stripes_share_fetched_images(self):
+        # given
+        image_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        image_cache = MemoryImageCache()
+        first_stripe = image_source.get_stripe(1, image_cache)
+        second_stripe = image_source.get_stripe(1, image_cache)
+
+        # when
+        first_image = first_stripe.get_image(2)
+        second_image = second_stripe.get_image_future(2).result()
+
+        # then
+        assert_array_equal(first_image, second_image)
+        self.assertEqual(1, len(image_source.fetch_times))
+        self.assertEqual(1, image_cache.statistics()['hits'])
+        self.assertEqual(1, image_cache.statistics()['misses'])
+
+    def test_images_from_different_sources_are_not_mixed(self):
+        # given
+        image_cache = MemoryImageCache()
+        first_source = DemoImageSource(stripe_count=2, version_count=3)
+        second_source = DemoImageSource(stripe_count=3, version_count=3)
+
+        # when
+        first_image = first_source.get_stripe(0, image_cache).get_image(0)
+        second_image = second_source.get_stripe(0, image_cache).get_image(0)
+
+        # then
+        self.assertNotEqual(first_image.shape, second_image.shape)
+        self.assertEqual(2, image_cache.statistics()['misses'])
+
+    def test_least_recently_used_image_is_evicted(self):
+        # given
+        image_source = DemoImageSource(stripe_count=2, version_count=3)
+        image_bytes = image_source.get_image(0, 0).nbytes
+        image_cache = MemoryImageCache(max_bytes=2 * image_bytes)
+        stripe = image_source.get_stripe(0, image_cache)
+
+        # when
+        stripe.get_image(0)
+        stripe.get_image(1)
+        stripe.get_image(0)
+        stripe.get_image(2)
+
+        # then
+        statistics = image_cache.statistics()
+        self.assertEqual(1, statistics['evictions'])
+        self.assertEqual(2, statistics['images'])
+        self.assertEqual(2 * image_bytes, statistics['peak_bytes'])
+        stripe.get_image(1)
+        self.assertEqual(4, image_cache.statistics()['misses'])
+
+    def test_missing_images_are_requested_in_single_batch(self):
+        # given
+        image_source = BatchRecordingImageSource(stripe_count=2, version_count=4)
+        image_cache = MemoryImageCache()
+        stripe = image_source.get_stripe(1, image_cache)
+        stripe.get_image(1)
+
+        # when
+        futures = stripe.get_image_futures([0, 1, 2, 3])
+
+        # then
+        self.assertEqual([0, 1, 2, 3], list(futures.keys()))
+        self.assertEqual([[(1, 1)], [(1, 0), (1, 2), (1, 3)]], image_source.batches)
+        for version_id, future in futures.items():
+            assert_array_equal(image_source.get_image(1, version_id), future.result())
+
+    def test_region_is_cut_from_cached_image(self):
+        # given
+        image_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        image_cache = MemoryImageCache()
+        stripe = image_source.get_stripe(0, image_cache)
+        image = stripe.get_image(1)
+
+        # when
+        region = stripe.get_image_region_future(1, rows=(10, 20), columns=(5, 50)).result()
+
+        # then
+        assert_array_equal(image[10:20, 5:50], region)
+        self.assertEqual(1, len(image_source.fetch_times))
+        self.assertEqual(1, image_cache.statistics()['hits'])
+
+    def test_regions_of_images_from_sources_not_reading_regions_share_single_fetch(self):
+        # given
+        image_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3, channel_count=2))
+        image_cache = MemoryImageCache()
+        stripe = image_source.get_stripe(0, image_cache)
+
+        # when
+        regions = [stripe.get_channel_region_future(2, channel_id, rows=(10, 20)).result() for channel_id in range(2)]
+
+        # then
+        for channel_id, region in enumerate(regions):
+            assert_array_equal(stripe.get_channel_image(2, channel_id)[10:20], region)
+        self.assertEqual(2, len(image_source.fetch_times))  # image of version 0 is fetched to probe the stripe
+        self.assertEqual(2, image_cache.statistics()['misses'])
+
+    def test_probing_stripe_of_source_without_metadata_does_not_fetch_image_twice(self):
+        # given
+        image_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        image_cache = MemoryImageCache()
+        stripe = image_source.get_stripe(1, image_cache)
+
+        # when
+        shape = stripe.get_shape()
+        image = stripe.get_image(0)
+
+        # then
+        self.assertEqual(image.shape, shape)
+        self.assertEqual(1, len(image_source.fetch_times))
+        self.assertEqual(1, image_cache.statistics()['hits'])
+
+    def test_cancelling_request_does_not_cancel_other_requests_of_the_same_image(self):
+        # given
+        demo_source = DemoImageSource(stripe_count=2, version_count=3)
+        image_source = ThreadedImageSource([demo_source])
+        image_cache = MemoryImageCache()
+        gate = Event()
+        image_source.get_image_future(0, 0, priority=1).add_done_callback(lambda f: gate.wait())
+
+        # when
+        cancelled_future = image_cache.get_image_future(image_source, 1, 2)
+        future = image_cache.get_image_future(image_source, 1, 2)
+        cancelled = cancelled_future.cancel()
+        gate.set()
+
+        # then
+        self.assertTrue(cancelled)
+        assert_array_equal(demo_source.get_image(1, 2), future.result(timeout=10))
+        image_source.close()
+
+    def test_fetch_is_cancelled_when_all_requests_are_cancelled(self):
+        # given
+        demo_source = DemoImageSource(stripe_count=2, version_count=3)
+        benchmarking_source = BenchmarkingImageSource(demo_source)
+        image_source = ThreadedImageSource([benchmarking_source])
+        image_cache = MemoryImageCache()
+        gate = Event()
+        image_source.get_image_future(0, 0, priority=1).add_done_callback(lambda f: gate.wait())
+
+        # when
+        futures = [image_cache.get_image_future(image_source, 1, 2) for _ in range(2)]
+        for future in futures:
+            future.cancel()
+        gate.set()
+        image = image_cache.get_image(image_source, 1, 2)
+        image_source.close()
+
+        # then
+        assert_array_equal(demo_source.get_image(1, 2), image)
+        self.assertEqual([(0, 0), (1, 2)], [(fetch['stripe_id'], fetch['version_id']) 
+                         for fetch in benchmarking_source.fetches])
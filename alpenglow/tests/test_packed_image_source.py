@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+import skimage.external.tifffile as tiff
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.filesystem import FilesystemImageSource
+from alpenglow.image_sources.packed import PackedImageSource
+from alpenglow.pack import main
+
+
+class TestPackedImageSource(TestCase):
+    """
+    Test basic functionality of PackedImageSource
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path_format = os.path.join(self.directory, 'raw', '{stripe_id}_{version_id}.tif')
+        self.packed_format = os.path.join(self.directory, 'packed', '{stripe_id}.pack')
+        os.makedirs(os.path.dirname(self.path_format))
+        for stripe_id in range(2):
+            for version_id in range(1, 4):
+                image = numpy.random.randint(0, 2 ** 16, size=(30, 20)).astype(numpy.uint16)
+                tiff.imsave(self.path_format.format(stripe_id=stripe_id, version_id=version_id), image)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_packed_images_are_equal_to_source_files(self):
+        for compression in [[], ['--compression', 'zlib']]:
+            # given
+            main([self.path_format, self.packed_format, '--stripes', '0-1', '--versions', '1-3'] + compression)
+            filesystem_source = FilesystemImageSource(self.path_format, [0, 1], [1, 2, 3])
+
+            # when
+            source = PackedImageSource(self.packed_format, [0, 1])
+
+            # then
+            self.assertEqual(3, source.version_count())
+            for stripe_id in range(4):
+                for version_id in range(3):
+                    assert_array_equal(filesystem_source.get_image(stripe_id, version_id),
+                                       source.get_image_future(stripe_id, version_id).result())
+
+    def test_probe_reads_shape_from_index(self):
+        # given
+        main([self.path_format, self.packed_format, '--stripes', '0-1', '--versions', '1-3'])
+        source = PackedImageSource(self.packed_format, [0, 1])
+
+        for stripe_id in range(3):
+            # when
+            shape, dtype = source.probe_image(stripe_id)
+
+            # then
+            image = source.get_image(stripe_id, 0)
+            self.assertEqual(image.shape, shape)
+            self.assertEqual(image.dtype, dtype)
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.benchmarking import BenchmarkingImageSource
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.prefetching import PrefetchingImageSource
+
+
+class TestPrefetchingImageSource(TestCase):
+    """
+    Test basic functionality of PrefetchingImageSource
+    """
+    def test_images_are_requested_ahead(self):
+        # given
+        inner_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        order = [(stripe, version) for stripe in range(2) for version in range(3)]
+        source = PrefetchingImageSource(inner_source, order, depth=3)
+
+        # when
+        source.get_image(0, 0)
+        image = source.get_image(0, 1)
+
+        # then
+        self.assertEqual([(0, 1), (0, 2), (1, 0), (0, 0), (1, 1)], [tuple(x[1:]) for x in inner_source.fetch_times])
+        assert_array_equal(inner_source.get_image(0, 1), image)
+        self.assertEqual(1, source.hits)
+        self.assertEqual(1, source.misses)
+
+    def test_prefetching_stops_when_consumer_is_behind(self):
+        # given
+        inner_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        order = [(stripe, version) for stripe in range(2) for version in range(3)]
+        image_bytes = inner_source.get_image(0, 0).nbytes
+        source = PrefetchingImageSource(inner_source, order, depth=4, max_bytes=2 * image_bytes)
+
+        # when
+        source.get_image(1, 2)
+
+        # then
+        self.assertEqual(1 + 2 + 1, len(inner_source.fetch_times))
+        self.assertEqual(1, source.misses)
+
+    def test_images_requested_before_prefetching_are_skipped(self):
+        # given
+        inner_source = BenchmarkingImageSource(DemoImageSource(stripe_count=2, version_count=3))
+        order = [(stripe, version) for stripe in range(2) for version in range(3)]
+        source = PrefetchingImageSource(inner_source, order, depth=2, max_bytes=0)
+
+        # when
+        source.get_image(0, 0)
+        source.max_bytes = 1024 ** 3
+        source.get_image(0, 1)
+
+        # then
+        self.assertEqual([(0, 0), (0, 2), (1, 0), (0, 1)], [tuple(x[1:]) for x in inner_source.fetch_times])
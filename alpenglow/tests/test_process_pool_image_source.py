@@ -0,0 +1,74 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.process_pool import ProcessPoolImageSource, SHARED_FILE_PREFIX
+
+
+class TestProcessPoolImageSource(TestCase):
+    """
+    Test basic functionality of ProcessPoolImageSource
+    """
+    def test_images_are_fetched_by_workers(self):
+        # given
+        kwargs = dict(stripe_count=2, version_count=3, channel_count=2)
+        local_source = DemoImageSource(**kwargs)
+
+        with ProcessPoolImageSource(DemoImageSource, kwargs=kwargs, max_workers=2) as source:
+            # when
+            futures = dict(((stripe_id, version_id), source.get_image_future(stripe_id, version_id))
+                           for stripe_id in range(3) for version_id in range(3))
+
+            # then
+            self.assertEqual(3, source.version_count())
+            for (stripe_id, version_id), future in futures.items():
+                assert_array_equal(local_source.get_image(stripe_id, version_id), future.result())
+
+    def test_worker_errors_are_passed_to_future(self):
+        # given
+        with ProcessPoolImageSource(DemoImageSource, kwargs=dict(stripe_count=2, version_count=3)) as source:
+            # when
+            future = source.get_image_future(0, 5)
+
+            # then
+            self.assertIsInstance(future.exception(), AssertionError)
+
+    def test_shared_files_are_removed(self):
+        # given
+        shared_directory = tempfile.mkdtemp()
+
+        # when
+        with ProcessPoolImageSource(DemoImageSource, kwargs=dict(stripe_count=2, version_count=3),
+                                    shared_directory=shared_directory) as source:
+            source.get_image(0, 0)
+            source.get_image_future(0, 5).exception()
+        filenames = os.listdir(shared_directory)
+        shutil.rmtree(shared_directory)
+
+        # then
+        self.assertEqual([], filenames)
+
+    def test_files_left_by_dead_processes_are_removed(self):
+        # given
+        shared_directory = tempfile.mkdtemp()
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        stale_path = os.path.join(shared_directory, '{}{}-stale.npy'.format(SHARED_FILE_PREFIX, process.pid))
+        live_path = os.path.join(shared_directory, '{}{}-live.npy'.format(SHARED_FILE_PREFIX, os.getpid()))
+        for path in [stale_path, live_path]:
+            open(path, 'wb').close()
+
+        # when
+        ProcessPoolImageSource(DemoImageSource, shared_directory=shared_directory).close()
+        stale_exists, live_exists = os.path.exists(stale_path), os.path.exists(live_path)
+        shutil.rmtree(shared_directory)
+
+        # then
+        self.assertFalse(stale_exists)
+        self.assertTrue(live_exists)
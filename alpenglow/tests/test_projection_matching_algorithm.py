@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+import numpy
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.projection import Projection, ProjectionMatchingAlgorithm
+from alpenglow.patchwork_builders.default import PatchworkBuilder
+
+
+class TestProjectionMatchingAlgorithm(TestCase):
+    def test_match(self):
+        # given
+        image_source = DemoImageSource(3, 4, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = ProjectionMatchingAlgorithm([0, 1, 3], [0, 2])
+
+        # when
+        shifts = [algorithm.match(image_source.get_stripe(0), image_source.get_stripe(1)),
+                  algorithm.match(image_source.get_stripe(1), image_source.get_stripe(2))]
+
+        # then
+        assert_equal([[92, -19], [92, 38]], shifts)
+
+    def test_match_with_mean_projection(self):
+        # given
+        image_source = DemoImageSource(3, 4, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = ProjectionMatchingAlgorithm([0, 1, 3], [0, 2], projection='mean')
+
+        # when
+        shift = algorithm.match(image_source.get_stripe(1), image_source.get_stripe(2))
+
+        # then
+        assert_equal([92, 38], shift)
+
+    def test_projection(self):
+        # given
+        images = [numpy.array([[1, 5], [3, 0]], dtype=numpy.uint8), numpy.array([[2, 1], [3, 4]], dtype=numpy.uint8)]
+        max_projection = Projection('max')
+        mean_projection = Projection('mean')
+
+        # when
+        for image in images:
+            max_projection.add(image)
+            mean_projection.add(image)
+
+        # then
+        assert_equal([[2, 5], [3, 4]], max_projection.get())
+        assert_array_almost_equal([[1.5, 3], [3, 2]], mean_projection.get())
+        self.assertEqual(2, mean_projection.count)
+        assert_equal([[1, 5], [3, 0]], images[0])
+
+    def test_unknown_projection(self):
+        with self.assertRaises(ValueError):
+            ProjectionMatchingAlgorithm([0], [0], projection='median')
+
+    def test_stitching_two_stripes_with_shift(self):
+        # given
+        builder = PatchworkBuilder(ProjectionMatchingAlgorithm([0], [0]))
+        image_source = DemoImageSource(stripe_count=2, vertical_shifts=(0, 20))
+
+        # when
+        builder.stitch(image_source.get_stripe(0))
+        builder.stitch(image_source.get_stripe(1))
+
+        # then
+        patchwork = builder.get()
+        assert_array_almost_equal(image_source.source_image, patchwork.get_image(0)[:, :512], decimal=0)
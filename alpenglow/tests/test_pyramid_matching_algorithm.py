@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.pyramid import PyramidMatchingAlgorithm
+from alpenglow.patchwork_builders.default import PatchworkBuilder
+
+
+class TestPyramidMatchingAlgorithm(TestCase):
+    def test_match(self):
+        # given
+        image_source = DemoImageSource(3, 3, channel_count=3, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = PyramidMatchingAlgorithm([0, 2], [0, 1])
+
+        # when
+        shifts = [algorithm.match(image_source.get_stripe(0), image_source.get_stripe(1)),
+                  algorithm.match(image_source.get_stripe(1), image_source.get_stripe(2))]
+
+        # then
+        assert_equal([[92, -19], [92, 38]], shifts)
+
+    def test_match_without_pyramid(self):
+        # given
+        image_source = DemoImageSource(3, 1, overlap=0.4, vertical_shifts=(19, 38, 0))
+        algorithm = PyramidMatchingAlgorithm([0], [0], levels=0)
+
+        # when
+        shift = algorithm.match(image_source.get_stripe(0), image_source.get_stripe(1))
+
+        # then
+        assert_equal([92, -19], shift)
+
+    def test_pyramid(self):
+        # given
+        image = DemoImageSource(3).get_image(0, 0)
+
+        # when
+        pyramid = PyramidMatchingAlgorithm.pyramid(image, 3)
+
+        # then
+        self.assertEqual([(213, 512), (106, 256), (53, 128), (26, 64)], [level.shape for level in pyramid])
+        self.assertAlmostEqual(0., float(pyramid[0].mean()), places=2)
+
+    def test_stitching_two_stripes_with_shift(self):
+        # given
+        builder = PatchworkBuilder(PyramidMatchingAlgorithm([0], [0]))
+        image_source = DemoImageSource(stripe_count=2, vertical_shifts=(0, 20))
+
+        # when
+        builder.stitch(image_source.get_stripe(0))
+        builder.stitch(image_source.get_stripe(1))
+
+        # then
+        patchwork = builder.get()
+        assert_array_almost_equal(image_source.source_image, patchwork.get_image(0)[:, :512], decimal=0)
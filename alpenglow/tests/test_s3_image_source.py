@@ -0,0 +1,87 @@
+from io import BytesIO
+from unittest import TestCase
+
+import boto3
+import numpy
+import skimage.external.tifffile as tiff
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.s3 import S3ImageSource
+from alpenglow.image_sources.tiff_layout import contiguous_layout
+
+
+class TestS3ImageSource(TestCase):
+    """
+    Test requests made by S3ImageSource, answered by stubbed boto3 client
+    """
+    def setUp(self):
+        self.image = numpy.random.randint(0, 2 ** 16, size=(30, 20)).astype(numpy.uint16)
+        buffer = BytesIO()
+        tiff.imsave(buffer, self.image.swapaxes(0, 1))
+        self.body = buffer.getvalue()
+
+        self.source = S3ImageSource('{stripe_id}/{version_id}.tif', [0, 1], [0, 1], key='key', secret='secret',
+                                    bucket='raw-alpenglow', endpoint='http://127.0.0.1:1', max_workers=1)
+        self.source._connection = boto3.client('s3', region_name='us-east-1', aws_access_key_id='key',
+                                               aws_secret_access_key='secret')
+        self.stubber = Stubber(self.source._connection)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.source.close()
+        self.stubber.deactivate()
+
+    def expect_get(self, key, data, byte_range=None):
+        parameters = {'Bucket': 'raw-alpenglow', 'Key': key}
+        if byte_range is not None:
+            parameters['Range'] = byte_range
+        self.stubber.add_response('get_object', {'Body': StreamingBody(BytesIO(data), len(data))}, parameters)
+
+    def test_region_of_columns_is_fetched_with_byte_range(self):
+        # given
+        offset, _, dtype = contiguous_layout(tiff.TiffFile(BytesIO(self.body)))
+        row_bytes = 30 * dtype.itemsize  # image columns are stored as rows
+        byte_range = 'bytes={}-{}'.format(offset + 5 * row_bytes, offset + 9 * row_bytes - 1)
+        self.expect_get('0/1.tif', self.body, 'bytes=0-65535')
+        self.expect_get('0/1.tif', self.body[offset + 5 * row_bytes:offset + 9 * row_bytes], byte_range)
+
+        # when
+        future = self.source.get_image_region_future(0, 1, rows=(3, 25), columns=(5, 9))
+        region = future.result()
+
+        # then
+        assert_array_equal(self.image[3:25, 5:9], region)
+        self.assertEqual(4 * row_bytes, future.timing['bytes'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_layout_is_read_once_per_stripe(self):
+        # given
+        offset, _, dtype = contiguous_layout(tiff.TiffFile(BytesIO(self.body)))
+        row_bytes = 30 * dtype.itemsize
+        byte_range = 'bytes={}-{}'.format(offset, offset + 2 * row_bytes - 1)
+        self.expect_get('1/0.tif', self.body, 'bytes=0-65535')
+        self.expect_get('1/0.tif', self.body[offset:offset + 2 * row_bytes], byte_range)
+        self.expect_get('1/1.tif', self.body[offset:offset + 2 * row_bytes], byte_range)
+
+        # when
+        regions = [self.source.get_image_region_future(1, version_id, columns=(0, 2)).result()
+                   for version_id in range(2)]
+
+        # then
+        for region in regions:
+            assert_array_equal(self.image[:, :2], region)
+        self.stubber.assert_no_pending_responses()
+
+    def test_region_is_cut_from_whole_image_when_header_cannot_be_read(self):
+        # given
+        self.stubber.add_client_error('get_object', 'InvalidRange', http_status_code=416)
+        self.expect_get('1/0.tif', self.body)
+
+        # when
+        region = self.source.get_image_region_future(1, 0, columns=(5, 9)).result()
+
+        # then
+        assert_array_equal(self.image[:, 5:9], region)
+        self.stubber.assert_no_pending_responses()
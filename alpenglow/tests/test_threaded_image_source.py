@@ -0,0 +1,66 @@
+from concurrent.futures import wait
+from threading import Event
+from unittest import TestCase
+
+from numpy.testing import assert_array_equal
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
+
+
+class TestThreadedImageSource(TestCase):
+    def test_get_images_returns_each_requested_image(self):
+        # given
+        demo_source = DemoImageSource(stripe_count=3, version_count=2)
+        source = ThreadedImageSource([DemoImageSource(stripe_count=3, version_count=2) for _ in range(2)])
+        image_ids = [(stripe_id, version_id) for stripe_id in range(3) for version_id in range(2)]
+
+        # when
+        images = dict(source.get_images(image_ids + [(0, 0)]))
+
+        # then
+        self.assertEqual(sorted(image_ids), sorted(images.keys()))
+        for (stripe_id, version_id), image in images.items():
+            assert_array_equal(demo_source.get_image(stripe_id, version_id), image)
+
+    def test_sample_versions_are_fetched_first(self):
+        # given
+        fetched = []
+        started = Event()
+        release = Event()
+
+        def get_image(stripe_id, version_id):
+            started.set()
+            release.wait()
+            fetched.append(version_id)
+
+        demo_source = DemoImageSource(stripe_count=1, version_count=4)
+        demo_source.get_image = get_image
+        source = ThreadedImageSource([demo_source], priority=lambda stripe_id, version_id: 1 if version_id == 3 else 0)
+        first_future = source.get_image_future(0, 0)
+        started.wait()
+
+        # when
+        futures = source.get_image_futures([(0, 1), (0, 2), (0, 3)])
+        release.set()
+        wait([first_future] + list(futures.values()))
+
+        # then
+        self.assertEqual([0, 3, 1, 2], fetched)
+
+    def test_failure_is_passed_to_future(self):
+        # given
+        demo_source = DemoImageSource(stripe_count=1, version_count=1)
+
+        def get_image(stripe_id, version_id):
+            raise IOError("missing")
+
+        demo_source.get_image = get_image
+
+        # when
+        with ThreadedImageSource([demo_source]) as source:
+            future = source.get_image_future(0, 0)
+
+            # then
+            self.assertIsInstance(future.exception(timeout=10), IOError)
+            self.assertIsInstance(source.get_image_future(0, 0).exception(timeout=10), IOError)
@@ -0,0 +1,64 @@
+"""
+Measures time of matching a pair of stripes with FftMatchingAlgorithm in default and fast mode, each with and without
+batching of versions and channels, and with BoundedFftMatchingAlgorithm searching within 16 rows of the overlap of
+demo stripes, with PyramidMatchingAlgorithm and with ProjectionMatchingAlgorithm (maximum projection).
+
+Stripes come from DemoImageSource, so the measured time is dominated by correlation, not by fetching images.
+
+Usage:
+    python benchmarks/fft_matching_algorithm.py [--stripes 3] [--versions 4] [--channels 3] [--tiles 2] [--overlap 0.4]
+        [--rounds 5]
+"""
+import argparse
+from time import time
+
+import numpy
+
+from alpenglow.image_sources.demo import DemoImageSource
+from alpenglow.matching_algorithms.bounded import BoundedFftMatchingAlgorithm
+from alpenglow.matching_algorithms.fft import FftMatchingAlgorithm
+from alpenglow.matching_algorithms.projection import ProjectionMatchingAlgorithm
+from alpenglow.matching_algorithms.pyramid import PyramidMatchingAlgorithm
+
+
+def run(algorithm, top_stripe, bottom_stripe, rounds):
+    shift = algorithm.match(top_stripe, bottom_stripe)  # warm up caches and workspaces
+    times = []
+    for _ in range(rounds):
+        start_time = time()
+        algorithm.match(top_stripe, bottom_stripe)
+        times.append(time() - start_time)
+    return numpy.min(times), shift
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stripes', type=int, default=3)
+    parser.add_argument('--versions', type=int, default=4)
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--tiles', type=int, default=2, help='camera image copies stacked in each direction')
+    parser.add_argument('--overlap', type=float, default=0.4, help='part of stripe common with the next one')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    image_source = DemoImageSource(args.stripes, args.versions, channel_count=args.channels, overlap=args.overlap,
+                                   vertical_shifts=(19, 38, 0), tiles=(args.tiles, args.tiles))
+    top_stripe = image_source.get_stripe(0)
+    bottom_stripe = image_source.get_stripe(1)
+    versions = list(range(args.versions))
+    channels = list(range(args.channels))
+
+    overlap_range = (image_source.overlap_height - 16, image_source.overlap_height + 16)
+    default_time = None
+    for name, algorithm_class, options in [('default', FftMatchingAlgorithm, dict()),
+                                           ('batched', FftMatchingAlgorithm, dict(batched=True)),
+                                           ('fast', FftMatchingAlgorithm, dict(fast=True)),
+                                           ('fast batched', FftMatchingAlgorithm, dict(fast=True, batched=True)),
+                                           ('bounded', BoundedFftMatchingAlgorithm, dict(fast=True, overlap_range=overlap_range, shift_range=(-40, 40))),
+                                           ('pyramid', PyramidMatchingAlgorithm, dict()),
+                                           ('projection', ProjectionMatchingAlgorithm, dict())]:
+        algorithm = algorithm_class(versions, channels, **options)
+        pair_time, shift = run(algorithm, top_stripe, bottom_stripe, args.rounds)
+        default_time = default_time or pair_time
+        print("{:>12}: {:8.3f} s per pair, speedup {:5.1f}x, shift {}".format(name, pair_time, default_time / pair_time,
+                                                                             shift))
@@ -0,0 +1,118 @@
+"""
+Measures per request overhead of S3ImageSource against local S3 stand-in.
+
+Requests are issued in bursts separated by pauses, which is how AlpenglowRunner requests images. Two setups are compared:
+
+    per burst  - new source (new worker threads, new boto3 client and new connections) for each burst, which is what
+                 happened when workers exited after draining the queue,
+    persistent - single source with long living workers and pooled connections reused by all bursts.
+
+Usage:
+    python benchmarks/s3_image_source.py [--bursts 20] [--burst-size 16] [--pause 0.05] [--connection-latency 0.02]
+"""
+import argparse
+import sys
+import threading
+from io import BytesIO
+from time import sleep, time
+
+is_py2 = sys.version[0] == '2'
+if is_py2:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+import numpy
+import skimage.external.tifffile as tiff
+
+from alpenglow.image_sources.s3 import S3ImageSource
+
+
+class S3StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    Minimal HTTP server answering every GET with the same TIFF file, like S3 GetObject with path style addressing.
+    """
+    daemon_threads = True
+
+    def __init__(self, body, connection_latency):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), S3StandInHandler)
+        self.body = body
+        self.connection_latency = connection_latency
+
+
+class S3StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # simulates TCP + TLS handshake paid once per new connection
+        sleep(self.server.connection_latency)
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/tiff')
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.send_header('ETag', '"alpenglow"')
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def tiff_body(shape):
+    buffer = BytesIO()
+    tiff.imsave(buffer, numpy.random.randint(0, 2 ** 16, size=shape).astype(numpy.uint16))
+    return buffer.getvalue()
+
+
+def create_source(endpoint, workers):
+    return S3ImageSource('{stripe_id}/{version_id}.tif', list(range(4)), list(range(1024)),
+                         key='key', secret='secret', bucket='raw-alpenglow', endpoint=endpoint, max_workers=workers)
+
+
+def run_bursts(bursts, burst_size, pause, get_source, release_source):
+    times = []
+    for burst in range(bursts):
+        start_time = time()
+        source = get_source()
+        futures = [source.get_image_future(burst % 4, version) for version in range(burst_size)]
+        for future in futures:
+            future.result()
+        release_source(source)
+        times.append((time() - start_time) / burst_size)
+        sleep(pause)
+    return times
+
+
+def report(name, times):
+    print("{:>12}: {:8.3f} ms/request (first burst {:8.3f} ms/request)".format(
+        name, 1000 * numpy.mean(times), 1000 * times[0]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bursts', type=int, default=20)
+    parser.add_argument('--burst-size', type=int, default=16)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds between bursts')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--connection-latency', type=float, default=0.02, help='seconds added to every new connection')
+    parser.add_argument('--shape', type=int, nargs=2, default=[512, 512])
+    args = parser.parse_args()
+
+    server = S3StandInServer(tiff_body(tuple(args.shape)), args.connection_latency)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    endpoint = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    report('per burst', run_bursts(args.bursts, args.burst_size, args.pause,
+                                   lambda: create_source(endpoint, args.workers), lambda source: source.close()))
+
+    with create_source(endpoint, args.workers) as persistent_source:
+        report('persistent', run_bursts(args.bursts, args.burst_size, args.pause,
+                                        lambda: persistent_source, lambda source: None))
+
+    server.shutdown()
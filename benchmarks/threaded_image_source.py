@@ -0,0 +1,123 @@
+"""
+Measures throughput of ThreadedImageSource against its previous implementation.
+
+Both wrap the same number of instances of a synthetic source, which waits --fetch-time seconds (with the GIL released,
+like network or disk I/O) and returns a small image. Two setups are compared:
+
+    previous   - task list drained with pop(0) under global lock, new thread started whenever a source is free,
+    persistent - workers bound to sources for the whole run, taking requests from FetchScheduler.
+
+Usage:
+    python benchmarks/threaded_image_source.py [--requests 20000] [--sources 8] [--fetch-time 0.0] [--rounds 3]
+"""
+import argparse
+from concurrent.futures import Future
+from threading import Thread, Lock
+from time import sleep, time
+
+import numpy
+
+from alpenglow.image_sources.image_source import ImageSource
+from alpenglow.image_sources.threaded_image_source import ThreadedImageSource
+
+
+class SyntheticImageSource(ImageSource):
+    def __init__(self, fetch_time):
+        super(SyntheticImageSource, self).__init__()
+        self.fetch_time = fetch_time
+        self.image = numpy.zeros((16, 16), dtype=numpy.uint16)
+
+    def get_image(self, stripe_id, version_id):
+        if self.fetch_time > 0:
+            sleep(self.fetch_time)
+        return self.image
+
+    def stripe_count(self):
+        return 64
+
+    def version_count(self):
+        return 1024
+
+    def channel_count(self):
+        return 1
+
+
+class PreviousImageSourceThread(Thread):
+    def __init__(self, image_source, task_queue, lock, sources):
+        Thread.__init__(self)
+        self.daemon = True
+        self.task_queue = task_queue
+        self.lock = lock
+        self.image_source = image_source
+        self.sources = sources
+
+    def run(self):
+        while True:
+            self.lock.acquire()
+            if len(self.task_queue) == 0:
+                break
+            future, stripe_id, version_id = self.task_queue.pop(0)
+            self.lock.release()
+            future.set_result(self.image_source.get_image(stripe_id, version_id))
+        self.sources.append(self.image_source)
+        self.lock.release()
+
+
+class PreviousThreadedImageSource(ImageSource):
+    """
+    ThreadedImageSource as it was before workers became persistent.
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.sample_source = sources[0]
+        self._task_queue = []
+        self._lock = Lock()
+
+    def get_image_future(self, stripe_id, version_id):
+        future = Future()
+        self._lock.acquire()
+        self._task_queue.append((future, stripe_id, version_id))
+        if len(self.sources) > 0:
+            thread = PreviousImageSourceThread(self.sources.pop(), self._task_queue, self._lock, self.sources)
+            thread.start()
+        self._lock.release()
+        return future
+
+    def get_image(self, stripe_id, version_id):
+        return self.get_image_future(stripe_id, version_id).result()
+
+    def stripe_count(self):
+        return self.sample_source.stripe_count()
+
+    def version_count(self):
+        return self.sample_source.version_count()
+
+    def channel_count(self):
+        return self.sample_source.channel_count()
+
+
+def run(source, requests, rounds):
+    image_ids = [(request % 64, (request // 64) % 1024) for request in range(requests)]
+    times = []
+    for _ in range(rounds):
+        start_time = time()
+        futures = [source.get_image_future(stripe_id, version_id) for stripe_id, version_id in image_ids]
+        for future in futures:
+            future.result()
+        times.append(time() - start_time)
+    return requests / numpy.min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--sources', type=int, default=8)
+    parser.add_argument('--fetch-time', type=float, default=0.0, help='seconds spent in each get_image')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    previous = PreviousThreadedImageSource([SyntheticImageSource(args.fetch_time) for _ in range(args.sources)])
+    print("{:>12}: {:10.0f} requests/s".format('previous', run(previous, args.requests, args.rounds)))
+
+    with ThreadedImageSource([SyntheticImageSource(args.fetch_time) for _ in range(args.sources)], max_pending=0) as persistent:
+        print("{:>12}: {:10.0f} requests/s".format('persistent', run(persistent, args.requests, args.rounds)))
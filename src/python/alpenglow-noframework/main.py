@@ -3,7 +3,7 @@ import time
 import concurrent
 
 from alpenglow.benchmark import BenchmarkConfig, get_image_order, is_in_sample, get_image_source, CorrelationState, \
-    ShiftState, PositionState, DelayDownloadState, MergeImageState, WindowState, validate, segmentation
+    ShiftState, ProjectionState, ShiftCacheState, PositionState, DelayDownloadState, MergeImageState, WindowState, validate, segmentation
 
 
 REFERENCE_TIME = int(time.time() * 1000)
@@ -22,11 +22,14 @@ class AlpenglowRunner:
     def __init__(self, config):
         self.config = config
         self.image_source = get_image_source(config)
+        self.version_count = self.image_source.version_count()
 
         self.delay_download_state = DelayDownloadState(config)
 
         self.correlation_state = CorrelationState(config)
         self.shift_state = ShiftState(config)
+        self.projection_state = ProjectionState(config) if config.projection is not None else None
+        self.shift_cache_state = ShiftCacheState(config, self.image_source)
         self.positions_state = PositionState(config)
         self.merge_state = MergeImageState(config)
         self.window_state = WindowState(config)
@@ -40,9 +43,15 @@ class AlpenglowRunner:
     def apply(self, image_id):
         stripe, version = image_id
 
-        if is_in_sample(self.config, image_id[1]):
+        if is_in_sample(self.config, image_id[1], self.version_count):
             if stripe not in self.sample_futures:
                 self.sample_futures[stripe] = {}
+                if stripe > 0:
+                    shift = self.shift_cache_state.lookup(stripe - 1)
+                    if shift is not None:
+                        log(3, "cached shift {}".format(shift[0]))
+                        self.__finish(shift[0])
+                        self.__apply_shift(shift)
             self.sample_futures[stripe][self.image_source.get_image_future(stripe, version)] = version
 
         elif self.delay_download_state.apply_image_id(stripe, version):
@@ -63,6 +72,12 @@ class AlpenglowRunner:
             else:
                 break
 
+    def close(self):
+        """
+        Stops workers of the image source.
+        """
+        self.image_source.close()
+
     def __samples_available(self, stripe):
         return stripe in self.sample_futures and len(self.sample_futures[stripe]) == self.config.sample_size
 
@@ -82,24 +97,49 @@ class AlpenglowRunner:
             log(3, "sample fetched {}".format((sample_stripe, version)))
             self.__apply_image(version, sample_stripe, image)
 
-            for stripe, correlation, image_shape in self.correlation_state.apply(version, sample_stripe, image):
-                shift = self.shift_state.apply(stripe, correlation, image_shape)
-                if shift is not None:
-                    log(3, "correlation calculated {}".format(stripe))
-                    for position in self.positions_state.apply(*shift):
-                        log(2, 'calculated position {}'.format(position))
-                        for version in range(self.image_source.version_count()):
-                            stripe = position[0]
-                            if self.delay_download_state.apply_metadata(stripe, version):
-                                if stripe not in self.rest_futures:
-                                    self.rest_futures[stripe] = {}
-                                self.rest_futures[stripe][self.image_source.get_image_future(stripe, version)] = version
-
-                            for merged_image in self.merge_state.apply_metadata([version] + position):
-                                self.__apply_merged_image(merged_image)
+            for shift in self.__shifts(version, sample_stripe, image):
+                self.shift_cache_state.apply(*shift)
+                self.__apply_shift(shift)
 
         self.samples_to = sample_stripe
 
+    def __apply_shift(self, shift):
+        for position in self.positions_state.apply(*shift):
+            log(2, 'calculated position {}'.format(position))
+            stripe = position[0]
+            image_ids = [(stripe, version) for version in range(self.image_source.version_count())
+                         if self.delay_download_state.apply_metadata(stripe, version)]
+            if len(image_ids) > 0:
+                if stripe not in self.rest_futures:
+                    self.rest_futures[stripe] = {}
+                for (_, version), future in self.image_source.get_image_futures(image_ids).items():
+                    self.rest_futures[stripe][future] = version
+
+            for version in range(self.image_source.version_count()):
+                for merged_image in self.merge_state.apply_metadata([version] + position):
+                    self.__apply_merged_image(merged_image)
+
+    def __finish(self, stripe):
+        if self.projection_state is not None:
+            self.projection_state.finish(stripe)
+        else:
+            self.shift_state.finish(stripe)
+            self.correlation_state.finish(stripe)
+
+    def __shifts(self, version, stripe, image):
+        if self.projection_state is not None:
+            for shift in self.projection_state.apply(version, stripe, image):
+                log(3, "projections correlated {}".format(shift[0]))
+                yield shift
+            return
+
+        for stripe, spectrum, image_shape, correlation_shape in self.correlation_state.apply(version, stripe, image):
+            shift = self.shift_state.apply(stripe, spectrum, image_shape, correlation_shape)
+            if shift is not None:
+                log(3, "correlation calculated {}".format(stripe))
+                self.__finish(stripe)
+                yield shift
+
     def __wait_for_rest(self, stripe):
         if self.rest_to >= stripe:
             return
@@ -131,6 +171,7 @@ if __name__ == '__main__':
                                  window_step=128,
                                  image_source="filesystem",
                                  image_source_threads=4,
+                                 prefetch_depth=64,
                                  image_source_config=dict(
                                      args=['/Users/tpawlowski/workspace/dokstud/alpenglow/data/{stripe_id:06d}/{stripe_id:06d}_{version_id:05d}.tif', [0, 1, 2], list(range(1, 1801))],
                                      kwargs={}
@@ -142,4 +183,5 @@ if __name__ == '__main__':
     for image_id in get_image_order(config):
         log(3, 'apply {}'.format(image_id))
         runner.apply(image_id)
+    runner.close()
 
@@ -2,20 +2,20 @@ import time
 from streamz import Stream
 
 from alpenglow.benchmark import BenchmarkConfig, get_image_order, is_in_sample, get_image_source, CorrelationState, \
-    ShiftState, PositionState, DelayDownloadState, MergeImageState
+    ShiftState, ProjectionState, PositionState, DelayDownloadState, MergeImageState
 from dask.distributed import Client
 
 
 def get_images(image_ids, config=None):
     if len(image_ids) == 0:
         return []
-    source = get_image_source(config)
-    return [[stripe, version, source.get_image(stripe, version)] for stripe, version in image_ids]
+    with get_image_source(config) as source:
+        return [[stripe, version, source.get_image(stripe, version)] for stripe, version in image_ids]
 
 
-def sample(image_id, config=None):
+def sample(image_id, config=None, version_count=None):
     _, version = image_id
-    if is_in_sample(config, version):
+    if is_in_sample(config, version, version_count):
         return [image_id]
     return []
 
@@ -28,8 +28,8 @@ def correlation(state, images):
 
 def shifts(state, correlations):
     results = []
-    for stripe, correlation, shape in correlations:
-        shift = state.apply(stripe, correlation, shape)
+    for stripe, spectrum, shape, correlation_shape in correlations:
+        shift = state.apply(stripe, spectrum, shape, correlation_shape)
         if shift is not None:
             results.append(shift)
 
@@ -84,14 +84,23 @@ if __name__ == '__main__':
     buffer_size = 32
     client = Client('127.0.0.1:8786')
 
+    with get_image_source(config) as image_source:
+        version_count = image_source.version_count()
+
     image_id_bolt = Stream()
     scattered_ids = image_id_bolt.scatter()
     sample_images_bolt = scattered_ids\
-        .map(sample, config=config).buffer(buffer_size)
+        .map(sample, config=config, version_count=version_count).buffer(buffer_size)
+
+    if config.projection is not None:
+        shifts_bolt = sample_images_bolt\
+            .accumulate(correlation, returns_state=True, start=ProjectionState(config)).buffer(buffer_size)
+    else:
+        shifts_bolt = sample_images_bolt\
+            .accumulate(correlation, returns_state=True, start=CorrelationState(config)).buffer(buffer_size) \
+            .accumulate(shifts, returns_state=True, start=ShiftState(config)).buffer(buffer_size)
 
-    positions_bolt = sample_images_bolt\
-        .accumulate(correlation, returns_state=True, start=CorrelationState(config)).buffer(buffer_size) \
-        .accumulate(shifts, returns_state=True, start=ShiftState(config)).buffer(buffer_size) \
+    positions_bolt = shifts_bolt\
         .accumulate(positions, returns_state=True, start=PositionState(config)).buffer(buffer_size)\
         .map(lambda x: ['positions', x]).buffer(buffer_size)
 
@@ -10,7 +10,8 @@ class AbsolutePositionsBolt(Bolt):
         self.log("Initializing AbsolutePositionsBolt...")
         self.config = BenchmarkConfig.from_dict(config["benchmark_config"])
         self.state = PositionState(self.config)
-        self.version_count = get_image_source(self.config).version_count()
+        with get_image_source(self.config) as image_source:
+            self.version_count = image_source.version_count()
 
     def process(self, tup):
         if self.config.verbosity > 0:
@@ -3,7 +3,7 @@ from heronpy.api.bolt.bolt import Bolt
 
 
 class CorrelationsBolt(Bolt):
-    outputs = ['stripe', 'correlation_matrix', 'top_image_shape']
+    outputs = ['stripe', 'cross_power_spectrum', 'top_image_shape', 'correlation_shape']
 
     def initialize(self, config, context):
         self.log("Initializing CountCorrelationsBolt...")
@@ -1,6 +1,6 @@
 from heronpy.api.bolt.bolt import Bolt
 
-from alpenglow.benchmark import is_in_sample, BenchmarkConfig
+from alpenglow.benchmark import is_in_sample, get_image_source, BenchmarkConfig
 
 
 class SamplingBolt(Bolt):
@@ -8,6 +8,8 @@ class SamplingBolt(Bolt):
 
     def initialize(self, config, context):
         self.config = BenchmarkConfig.from_dict(config["benchmark_config"])
+        with get_image_source(self.config) as image_source:
+            self.version_count = image_source.version_count()
         if self.config.verbosity > 0:
             self.log("Initializing SamplingBolt...")
 
@@ -17,7 +19,7 @@ class SamplingBolt(Bolt):
         if self.config.verbosity > 1:
             self.log("got pair {}".format((stripe, version)))
 
-        if is_in_sample(self.config, version):
+        if is_in_sample(self.config, version, self.version_count):
             if self.config.verbosity > 0:
                 self.log("accepting {}".format((stripe, version)))
             self.emit(tup.values)
@@ -11,12 +11,12 @@ class ShiftsBolt(Bolt):
         self.state = ShiftState(self.config)
 
     def process(self, tup):
-        (stripe, correlation, top_shape) = tup.values
+        (stripe, spectrum, top_shape, correlation_shape) = tup.values
 
         if self.config.verbosity > 0:
             self.log("received {}".format(stripe))
 
-        shift = self.state.apply(stripe, correlation, top_shape)
+        shift = self.state.apply(stripe, spectrum, top_shape, correlation_shape)
         if shift is not None:
             if self.config.verbosity > 0:
                 self.log("emmiting {}".format(shift))